@@ -0,0 +1,9 @@
+"""
+Benchmarks for django q filter
+
+run against the example food models on SQLite with generated data::
+
+    python -m benchmarks --scales 1000,10000 --ingredients 3,10
+    python -m benchmarks --save baseline.json
+    python -m benchmarks --compare baseline.json --threshold 0.2
+"""
@@ -0,0 +1,140 @@
+"""
+benchmark runner
+
+every case is timed with timeit for each qfilter and each scale, the
+generated databases are kept in --data-dir and reused by later runs.
+"""
+
+# pylint: disable=wrong-import-position,import-outside-toplevel
+
+import argparse
+import json
+import os
+import statistics
+import sys
+import timeit
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, 'example'))
+sys.path.insert(0, ROOT)
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'benchmarks.settings')
+
+import django
+
+django.setup()
+
+from django.core.management import call_command
+from django.db import connection
+from django.test.utils import setup_test_environment
+
+
+def _int_list(value):
+    return [int(v) for v in value.split(',')]
+
+
+def get_args(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m benchmarks', description=__doc__)
+    parser.add_argument('--scales', type=_int_list, default=[1000, 10000],
+                        help='comma separated numbers of recipes, ex. 1000,100000,1000000')
+    parser.add_argument('--ingredients', type=_int_list, default=[3, 10],
+                        help='comma separated numbers of ingredients per recipe')
+    parser.add_argument('--cases', help='comma separated case names, default all')
+    parser.add_argument('--qfilters', help='comma separated qfilter names, default all')
+    parser.add_argument('--repeat', type=int, default=5, help='number of timed repetitions')
+    parser.add_argument('--data-dir', default=os.path.join(ROOT, '.benchmarks'),
+                        help='directory of the generated databases')
+    parser.add_argument('--save', help='write the results as json')
+    parser.add_argument('--compare', help='compare with results written by --save')
+    parser.add_argument('--threshold', type=float, default=0.2,
+                        help='relative slowdown reported as regression by --compare')
+    return parser.parse_args(argv)
+
+
+def use_database(path, recipes, ingredients):
+    """
+    switch the default database to the generated data of a scale
+    """
+    from . import data
+
+    connection.close()
+    connection.settings_dict['NAME'] = path
+    if os.path.exists(path):
+        return
+    print('generate {} recipes with {} ingredients: {}'.format(recipes, ingredients, path), file=sys.stderr)
+    call_command('migrate', verbosity=0)
+    data.generate(recipes, ingredients)
+
+
+def measure(func, repeat):
+    """
+    time a callable, the number of calls per repetition is chosen by timeit
+
+    :return: (best, median) seconds per call
+    """
+    timer = timeit.Timer(func)
+    number, _ = timer.autorange()
+    times = [t / number for t in timer.repeat(repeat, number)]
+    return min(times), statistics.median(times)
+
+
+def run(args):
+    from .cases import CASES, QFILTERS
+
+    cases = args.cases.split(',') if args.cases else list(CASES)
+    qfilters = args.qfilters.split(',') if args.qfilters else list(QFILTERS)
+    os.makedirs(args.data_dir, exist_ok=True)
+
+    results = {}
+    for recipes in args.scales:
+        for ingredients in args.ingredients:
+            scale = '{}x{}'.format(recipes, ingredients)
+            use_database(os.path.join(args.data_dir, 'food-{}.sqlite3'.format(scale)), recipes, ingredients)
+            for case_name in cases:
+                case, needs_database, per_qfilter = CASES[case_name]
+                if not needs_database and ingredients != args.ingredients[0]:
+                    # independent of the data, timed once per number of recipes
+                    continue
+                for qfilter_name in qfilters if per_qfilter else qfilters[:1]:
+                    name = '{}[{}]'.format(case_name, qfilter_name) if per_qfilter else case_name
+                    best, median = measure(case(QFILTERS[qfilter_name]), args.repeat)
+                    results.setdefault(scale, {})[name] = best
+                    print('{:<12} {:<32} {:>12.6f} ms {:>12.6f} ms'.format(scale, name, best * 1000, median * 1000))
+    return results
+
+
+def compare(results, baseline, threshold):
+    """
+    report cases which are slower than the baseline by more than threshold
+
+    :return: number of regressions
+    """
+    regressions = 0
+    for scale, cases in results.items():
+        for name, best in cases.items():
+            before = baseline.get(scale, {}).get(name)
+            if before and best > before * (1 + threshold):
+                regressions += 1
+                print('REGRESSION {} {}: {:.6f} ms -> {:.6f} ms (+{:.0%})'.format(
+                    scale, name, before * 1000, best * 1000, best / before - 1))
+    return regressions
+
+
+def main(argv=None):
+    args = get_args(argv)
+    setup_test_environment()
+    print('{:<12} {:<32} {:>15} {:>15}'.format('scale', 'case', 'best', 'median'))
+    results = run(args)
+
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        if compare(results, baseline, args.threshold):
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
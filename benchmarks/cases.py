@@ -0,0 +1,121 @@
+"""
+benchmark cases for the qfilter hot paths
+
+each case is a function returning the callable to time, the setup
+(database queries to prepare input data etc.) is not timed.
+"""
+
+__all__ = (
+    'QFILTERS',
+    'CASES',
+)
+
+from django.test import Client
+
+from food.models import Recipe
+from food.views import RecipeListView
+from qfilter import utils
+from qfilter.catalog import clear_field_catalog
+from qfilter.parser import _parse_normalized, normalize_qquery
+
+QFILTERS = {
+    'simple': 'Q(name__icontains="recipe 1")',
+    'to-many': 'Q(ingredients__name="ingredient 1") | Q(ingredients__name="ingredient 2") | '
+               'Q(ingredients__name="ingredient 3")',
+    'wide': 'Q(name__icontains="1") & Q(cook_time__gte=30) & Q(cook_time__lte=90) & '
+            '(Q(ingredients__name__icontains="ingredient 1") | Q(cookbook__name="cookbook 1")) & '
+            '~Q(ingredients__type__name="type 3")',
+}
+
+
+def parse(qfilter):
+    """
+    eval_qquery, served from the parser cache
+    """
+    return lambda: utils.eval_qquery(qfilter)
+
+
+def parse_uncached(qfilter):
+    """
+    tokenize and parse without the parser cache
+    """
+    parse_normalized = _parse_normalized.__wrapped__
+    return lambda: parse_normalized(normalize_qquery(qfilter))
+
+
+def filter_fields(qfilter):  # pylint: disable=unused-argument
+    """
+    get_filter_fields from the field catalog
+    """
+    view = RecipeListView()
+    return view.get_filter_fields
+
+
+def filter_fields_cold(qfilter):  # pylint: disable=unused-argument
+    """
+    get_filter_fields, discovering the fields on each call
+    """
+    view = RecipeListView()
+
+    def run():
+        clear_field_catalog()
+        return view.get_filter_fields()
+    return run
+
+
+def annotate(qfilter):
+    """
+    annotate_qfilter_value, building the annotated queryset without executing it
+    """
+    view = RecipeListView()
+    qquery = utils.eval_qquery(qfilter)
+    queryset = Recipe.objects.filter(qquery).distinct()
+    return lambda: view.annotate_qfilter_value(queryset, qquery, stringify=True)
+
+
+def merge(qfilter):
+    """
+    utils.merge of the fetched joined values
+    """
+    view = RecipeListView()
+    qquery = utils.eval_qquery(qfilter)
+    queryset = view.annotate_qfilter_value(Recipe.objects.filter(qquery).distinct(), qquery, stringify=True)
+    values = list(queryset.order_by('id').values(*queryset.qfilter_columns))
+    return lambda: utils.merge('id', queryset.qfilter_fields, values)
+
+
+def _render(params):
+    client = Client()
+
+    def run():
+        response = client.get('/', params)
+        assert response.status_code == 200, response.status_code
+        return response
+    return run
+
+
+def view(qfilter):
+    """
+    full request of the example recipe list view
+    """
+    return _render({'qfilter': qfilter})
+
+
+def view_merged(qfilter):
+    """
+    full request of the example recipe list view with merged results
+    """
+    return _render({'qfilter': qfilter, 'qfilter-merged': 'on'})
+
+
+# name: (case, needs database, depends on the qfilter)
+CASES = {
+    'parse': (parse, False, True),
+    'parse-uncached': (parse_uncached, False, True),
+    'filter-fields': (filter_fields, False, False),
+    'filter-fields-cold': (filter_fields_cold, False, False),
+    'annotate': (annotate, False, True),
+    'merge': (merge, True, True),
+    'view': (view, True, True),
+    'view-merged': (view_merged, True, True),
+}
@@ -0,0 +1,59 @@
+"""
+generated benchmark data for the example food models
+
+data is generated with a fixed seed, so every scale has the same content on each run.
+"""
+
+__all__ = (
+    'INGREDIENT_TYPES',
+    'INGREDIENTS',
+    'generate',
+)
+
+import random
+
+from django.db import transaction
+
+from food.models import Cookbook, Ingredient, IngredientType, Recipe
+
+INGREDIENT_TYPES = 10
+INGREDIENTS = 500
+RECIPES_PER_COOKBOOK = 100
+BATCH_SIZE = 5000
+
+
+def _bulk_create(model, objs):
+    model.objects.bulk_create(objs, batch_size=BATCH_SIZE)
+
+
+@transaction.atomic
+def generate(recipes, ingredients_per_recipe, seed=42):
+    """
+    fill an empty database with recipes, their ingredients and cookbooks
+
+    :param recipes:                number of recipes
+    :param ingredients_per_recipe: number of ingredients of each recipe
+    """
+    rnd = random.Random(seed)
+
+    _bulk_create(IngredientType, [IngredientType(id=i + 1, name='type {}'.format(i))
+                                  for i in range(INGREDIENT_TYPES)])
+    _bulk_create(Ingredient, [Ingredient(id=i + 1, name='ingredient {}'.format(i),
+                                         type_id=i % INGREDIENT_TYPES + 1)
+                              for i in range(INGREDIENTS)])
+
+    through = Recipe.ingredients.through
+    cookbook_through = Cookbook.recipes.through
+    cookbooks = max(1, recipes // RECIPES_PER_COOKBOOK)
+    _bulk_create(Cookbook, [Cookbook(id=i + 1, name='cookbook {}'.format(i)) for i in range(cookbooks)])
+
+    # generate in batches to keep the memory usage constant for large scales
+    for start in range(0, recipes, BATCH_SIZE):
+        stop = min(start + BATCH_SIZE, recipes)
+        _bulk_create(Recipe, [Recipe(id=i + 1, name='recipe {}'.format(i), cook_time=rnd.randint(5, 180))
+                              for i in range(start, stop)])
+        _bulk_create(through, [through(recipe_id=i + 1, ingredient_id=ingredient_id)
+                               for i in range(start, stop)
+                               for ingredient_id in rnd.sample(range(1, INGREDIENTS + 1), ingredients_per_recipe)])
+        _bulk_create(cookbook_through, [cookbook_through(recipe_id=i + 1, cookbook_id=i % cookbooks + 1)
+                                        for i in range(start, stop)])
@@ -0,0 +1,19 @@
+"""
+settings for the benchmarks, based on the example project
+the database name is set per scale by the runner
+"""
+
+# pylint: disable=wildcard-import,unused-wildcard-import
+
+from core.settings import *  # noqa
+
+DEBUG = False
+
+ALLOWED_HOSTS = ['testserver']
+
+DATABASES = {
+    'default': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': ':memory:',
+    }
+}
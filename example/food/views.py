@@ -13,4 +13,5 @@ class RecipeListView(QQueryViewMixin, ListView):
     """
     model = Recipe
     template_name = 'food/recipe_list.html'
-    ordering = ['name']
\ No newline at end of file
+    ordering = ['name']
+    paginate_by = 25
\ No newline at end of file
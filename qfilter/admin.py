@@ -0,0 +1,25 @@
+"""
+admin for saved qfilters
+"""
+
+from django.contrib import admin, messages
+
+from .models import SavedQFilter
+
+
+@admin.register(SavedQFilter)
+class SavedQFilterAdmin(admin.ModelAdmin):
+    """
+    saved qfilters with an action to refresh the results
+    """
+    list_display = ('name', 'model', 'qfilter', 'merged', 'stale', 'refreshed')
+    list_filter = ('model', 'stale')
+    search_fields = ('name', 'qfilter')
+    readonly_fields = ('stale', 'involved_models', 'refreshed')
+    actions = ('refresh',)
+
+    def refresh(self, request, queryset):
+        for saved in queryset:
+            added, removed, updated = saved.refresh()
+            messages.info(request, '{}: {} added, {} removed, {} updated'.format(saved.name, added, removed, updated))
+    refresh.short_description = 'Refresh the results'
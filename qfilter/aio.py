@@ -0,0 +1,145 @@
+"""
+Async support for qfilter views on ASGI
+
+the queries are run with asgiref's sync_to_async, concurrent queries in
+own threads with own database connections.
+"""
+
+__all__ = (
+    'afetch',
+    'amerged',
+    'AsyncQQueryViewMixin',
+)
+
+# pylint: disable=protected-access
+
+import asyncio
+import functools
+
+from asgiref.sync import sync_to_async
+from django.db import connections
+from django.db.models.query import QuerySet
+
+from .mixins import QQueryViewMixin
+
+
+def _run_in_thread(func, concurrent, using):
+    """
+    run a blocking function from async code
+
+    concurrent functions run in their own thread with an own database
+    connection, which is closed afterwards if it was opened by the function.
+    otherwise the function runs in the thread shared by all sync code of the
+    request, one after the other.
+    """
+    if not concurrent:
+        return sync_to_async(func)()
+
+    def run():
+        connection = connections[using]
+        opened = connection.connection is None
+        try:
+            return func()
+        finally:
+            if opened:
+                connection.close()
+    return sync_to_async(run, thread_sensitive=False)()
+
+
+async def afetch(queryset, concurrent=False):
+    """
+    evaluate a queryset and fill its result cache, templates iterating
+    the queryset afterwards do not query the database again
+    """
+    await _run_in_thread(queryset._fetch_all, concurrent, queryset.db)
+    return queryset
+
+
+async def amerged(merged, concurrent=False, using='default'):
+    """
+    evaluate merged values (MergedValues or AggregatedMergedValues) to a dict
+    """
+    return await _run_in_thread(lambda: dict(merged.items()), concurrent, using)
+
+
+class AsyncQQueryViewMixin(QQueryViewMixin):
+    """
+    async variant of QQueryViewMixin for ASGI
+
+    the filter is parsed and the querysets are built like in QQueryViewMixin,
+    then the querysets of the context keys in qfilter_async_prefetch and the
+    merged values are evaluated concurrently before the template is rendered.
+    the event loop is not blocked by the database queries.
+
+    the merged values are evaluated to a dict, so they are not streamed.
+    """
+
+    # context keys with querysets to evaluate before rendering
+    qfilter_async_prefetch = ('object_list', 'qfilter_qs')
+
+    # run the prefetch queries in own threads and database connections
+    qfilter_concurrent_queries = True
+
+    @classmethod
+    def as_view(cls, **initkwargs):
+        """
+        mark the view as coroutine function, django < 4.1 does not detect async class based views
+        """
+        view = super().as_view(**initkwargs)
+        if asyncio.iscoroutinefunction(view):
+            return view
+
+        async def async_view(request, *args, **kwargs):
+            response = view(request, *args, **kwargs)
+            if asyncio.iscoroutine(response):
+                response = await response
+            return response
+
+        return functools.wraps(view)(async_view)
+
+    async def aprefetch_context(self, context):
+        """
+        evaluate the querysets of the context concurrently
+        """
+        querysets = []
+        for key in self.qfilter_async_prefetch:
+            queryset = context.get(key)
+            if isinstance(queryset, QuerySet) and not any(queryset is qs for qs in querysets):
+                querysets.append(queryset)
+
+        tasks = [afetch(queryset, self.qfilter_concurrent_queries) for queryset in querysets]
+
+        qfilter_qs = context.get('qfilter_qs')
+        merged = getattr(qfilter_qs, 'merged', None)
+        if merged is not None and not isinstance(merged, dict):
+            tasks.append(amerged(merged, self.qfilter_concurrent_queries, qfilter_qs.db))
+
+        results = await asyncio.gather(*tasks)
+        if merged is not None and not isinstance(merged, dict):
+            qfilter_qs.merged = results[-1]
+
+    async def arender(self, response):
+        """
+        prefetch the context and render the response outside of the event loop
+        """
+        if not hasattr(response, 'render'):
+            return response
+        if not response.is_rendered and response.context_data is not None:
+            await self.aprefetch_context(response.context_data)
+        if not response.is_rendered:
+            await sync_to_async(response.render)()
+        return response
+
+    async def get(self, request, *args, **kwargs):  # pylint: disable=invalid-overridden-method
+        """
+        get qfilter from get parameters
+        """
+        response = await sync_to_async(super().get)(request, *args, **kwargs)
+        return await self.arender(response)
+
+    async def post(self, request, *args, **kwargs):  # pylint: disable=invalid-overridden-method
+        """
+        get qfilter wizard parameters from post
+        """
+        response = await sync_to_async(super().post)(request, *args, **kwargs)
+        return await self.arender(response)
@@ -0,0 +1,14 @@
+"""
+qfilter app config
+"""
+
+from django.apps import AppConfig
+
+
+class QFilterConfig(AppConfig):
+    """
+    django q filter
+    """
+    name = 'qfilter'
+    verbose_name = 'Q Filter'
+    default_auto_field = 'django.db.models.AutoField'
@@ -0,0 +1,155 @@
+"""
+Result cache for qfilter querysets
+
+the primary keys of a filtered queryset (or any small list of values, ex. autocomplete
+suggestions) are stored in django's cache framework.
+the cache key contains the SQL of the query and a data version of every
+involved model. the version is bumped by the post_save, post_delete and
+m2m_changed signals after the transaction is committed, which invalidates all
+cached results using the model, also those cached by other processes.
+only tracked models are bumped, in the caches their results were cached in:
+models are tracked when results depending on them are cached, processes
+which only write (ex. workers) can track them with track_models.
+"""
+
+__all__ = (
+    'get_cached_keys',
+    'get_cached_values',
+    'bump_data_version',
+    'track_models',
+)
+
+# pylint: disable=protected-access,unused-argument
+
+import hashlib
+import logging
+import time
+
+from django.core.cache import caches
+from django.core.exceptions import EmptyResultSet
+from django.db import transaction
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+
+from .utils import get_page_keys
+
+LOGGER = logging.getLogger(__name__)
+
+KEY_PREFIX = 'qfilter'
+
+# {model label: cache aliases} of the models whose data version is bumped on changes
+_TRACKED_MODELS = {}
+
+
+def _version_key(label):
+    return '{}:version:{}'.format(KEY_PREFIX, label)
+
+
+def _new_version():
+    # time based, an evicted version key never falls back to an older version
+    return int(time.time() * 1000000)
+
+
+def _get_data_versions(cache, labels):
+    keys = [_version_key(label) for label in labels]
+    versions = cache.get_many(keys)
+    for key in keys:
+        if key not in versions:
+            version = _new_version()
+            if not cache.add(key, version, None):
+                version = cache.get(key, version)
+            versions[key] = version
+    return tuple(versions[key] for key in keys)
+
+
+def track_models(models, alias='default'):
+    """
+    bump the data version of the models in the cache alias if they change,
+    models of cached results are tracked automatically
+    """
+    for model in models:
+        _TRACKED_MODELS.setdefault(model._meta.label_lower, set()).add(alias)
+
+
+def bump_data_version(model, using=None):
+    """
+    invalidate all cached results which depend on the model,
+    after the transaction of the database alias using is committed
+    """
+    label = model._meta.label_lower
+    aliases = _TRACKED_MODELS.get(label)
+    if not aliases:
+        return
+
+    def bump():
+        version = _new_version()
+        for alias in tuple(aliases):
+            LOGGER.debug('bump qfilter data version of %s in cache %s', label, alias)
+            caches[alias].set(_version_key(label), version, None)
+
+    transaction.on_commit(bump, using=using)
+
+
+def _get_cached(queryset, models, kind, timeout, alias):
+    cache = caches[alias]
+    labels = sorted(model._meta.label_lower for model in models)
+
+    try:
+        sql, params = queryset.query.sql_with_params()
+    except EmptyResultSet:
+        # ex. none() or an empty __in, nothing to query or cache
+        return []
+    track_models(models, alias)
+    versions = _get_data_versions(cache, labels)
+    digest = hashlib.md5(repr((sql, params, labels, versions)).encode()).hexdigest()
+    cache_key = '{}:{}:{}'.format(KEY_PREFIX, kind, digest)
+
+    values = cache.get(cache_key)
+    if values is None:
+        LOGGER.debug('qfilter cache miss: %s', cache_key)
+        values = list(queryset)
+        cache.set(cache_key, values, timeout)
+    return values
+
+
+def get_cached_keys(queryset, shared_key, models, timeout=300, alias='default'):
+    """
+    get the ordered shared_key values of a queryset from cache,
+    the query is executed on a cache miss.
+
+    :param queryset:   filtered queryset
+    :param shared_key: ex. id
+    :param models:     models the queryset depends on, see compiler.get_involved_models
+    :param timeout:    cache timeout in seconds
+    :param alias:      django cache alias
+    :return: list of keys
+    """
+    return _get_cached(get_page_keys(queryset, shared_key), models, 'keys', timeout, alias)
+
+
+def get_cached_values(queryset, models, timeout=300, alias='default'):
+    """
+    get the result of a queryset (ex. values_list) from cache as list,
+    the query is executed on a cache miss.
+
+    :param queryset: queryset, should be limited
+    :param models:   models the queryset depends on
+    :param timeout:  cache timeout in seconds
+    :param alias:    django cache alias
+    :return: list
+    """
+    return _get_cached(queryset, models, 'values', timeout, alias)
+
+
+@receiver(post_save)
+@receiver(post_delete)
+def _invalidate_on_change(sender, using=None, **kwargs):
+    bump_data_version(sender, using)
+
+
+@receiver(m2m_changed)
+def _invalidate_on_m2m_change(sender, instance, action, model, using=None, **kwargs):
+    if not action.startswith('post_'):
+        return
+    for changed in {sender, type(instance), model}:
+        bump_data_version(changed, using)
@@ -0,0 +1,235 @@
+"""
+Filter field catalog
+
+process wide, model keyed cache of the possible filter fields of a model.
+the catalog is built once per model and cleared if the app registry changes,
+together with the lookup cache of qfilter.utils.
+"""
+
+__all__ = (
+    'FilterField',
+    'FieldCatalog',
+    'iter_filter_fields',
+    'get_field_catalog',
+    'clear_field_catalog',
+)
+
+# pylint: disable=protected-access,unused-argument
+
+import hashlib
+import json
+import logging
+from collections import deque, namedtuple
+
+from django.core.exceptions import FieldDoesNotExist
+from django.core.signals import setting_changed
+from django.db.models.constants import LOOKUP_SEP
+from django.db.models.signals import class_prepared
+from django.dispatch import receiver
+
+from .utils import clear_lookup_cache, get_short_field_name
+
+LOGGER = logging.getLogger(__name__)
+
+FilterField = namedtuple('FilterField', ('path', 'internal_type', 'field'))
+
+EXCLUDED_FIELD_TYPES = ('AutoField', 'BigAutoField', 'SmallAutoField')
+
+_CATALOGS = {}
+
+
+def _freeze_field_options(options):
+    """
+    convert a {model label: field names} mapping to a hashable form
+    model labels are case insensitive, ex. food.Recipe or food.recipe
+    a single field name may be given as string, ex. {'food.recipe': 'name'}
+    """
+    if not options:
+        return None
+    return frozenset((label.lower(), frozenset((names,) if isinstance(names, str) else names))
+                     for label, names in options.items())
+
+
+def _is_field_allowed(label, field, include, exclude):
+    if include is not None and label in include and field.name not in include[label]:
+        return False
+    if exclude is not None and field.name in exclude.get(label, ()):
+        return False
+    return True
+
+
+def iter_filter_fields(model, max_depth=1, include=None, exclude=None):
+    """
+    discover possible filter fields of a model breadth-first
+
+    relations are followed up to max_depth, a model is not entered twice
+    on the same relation path to avoid cycles over reverse relations.
+    fields are yielded lazily, ordered by depth.
+    - exclude auto generated ID fields
+
+    :param model:     django model
+    :param max_depth: number of relations to follow, 0 for local fields only
+    :param include:   {model label: field names}, only these fields of the model are used
+    :param exclude:   {model label: field names}, these fields of the model are skipped
+    """
+    include = dict(_freeze_field_options(include) or ())
+    exclude = dict(_freeze_field_options(exclude) or ())
+
+    queue = deque([(model, '', 0, frozenset((model,)))])
+    while queue:
+        current, prefix, depth, ancestors = queue.popleft()
+        label = current._meta.label_lower
+        for field in current._meta.get_fields():
+            if not _is_field_allowed(label, field, include, exclude):
+                continue
+
+            if not field.is_relation:
+                if field.get_internal_type() not in EXCLUDED_FIELD_TYPES:
+                    yield FilterField(prefix + field.name, field.get_internal_type(), field)
+                continue
+
+            related_model = field.related_model
+            if depth < max_depth and related_model is not None and related_model not in ancestors:
+                queue.append((related_model, prefix + field.name + LOOKUP_SEP, depth + 1, ancestors | {related_model}))
+
+
+class FieldCatalog:
+    """
+    possible filter fields of a model with O(1) lookup by qfilter path
+
+    :param model:  django model
+    :param fields: iterable of FilterField
+    """
+
+    def __init__(self, model, fields):
+        self.model = model
+        self.fields = tuple(fields)
+        self._index = {ff.path: ff for ff in self.fields}
+        self._short_names = {ff.path: get_short_field_name(ff.field) for ff in self.fields}
+        self._json = None
+        self._version = None
+
+    def __contains__(self, path):
+        return path in self._index
+
+    def __iter__(self):
+        return iter(self.fields)
+
+    def __len__(self):
+        return len(self.fields)
+
+    def _resolve(self, path):
+        """
+        resolve a lookup path which is not part of the discovered fields
+        by walking the model meta, ex. deeper relations used in a qfilter
+        """
+        opts = self.model._meta
+        field = None
+        for part in path.split(LOOKUP_SEP):
+            if opts is None:
+                return None
+            try:
+                field = opts.get_field(part)
+            except FieldDoesNotExist:
+                return None
+            opts = field.related_model._meta if field.is_relation and field.related_model else None
+        return FilterField(path, field.get_internal_type(), field)
+
+    def get(self, path):
+        """
+        get FilterField for qfilter path, ex. group__name
+        returns None if the path can not be resolved
+        """
+        try:
+            return self._index[path]
+        except KeyError:
+            pass
+
+        filter_field = self._resolve(path)
+        if filter_field is not None:
+            self._index[path] = filter_field
+            self._short_names[path] = get_short_field_name(filter_field.field)
+        return filter_field
+
+    def short_name(self, path):
+        """
+        get short field name for qfilter path, ex. group__name -> Group.name
+        falls back to the path if it can not be resolved
+        """
+        try:
+            return self._short_names[path]
+        except KeyError:
+            pass
+        if self.get(path) is None:
+            return path
+        return self._short_names[path]
+
+    def as_json(self):
+        """
+        get the fields serialized as json (bytes) for the wizard,
+        built once per catalog
+        """
+        if self._json is None:
+            fields = [{'path': ff.path, 'name': self._short_names[ff.path], 'type': ff.internal_type}
+                      for ff in self.fields]
+            self._version = hashlib.md5(json.dumps(fields).encode()).hexdigest()[:16]
+            self._json = json.dumps({'version': self._version, 'fields': fields}).encode()
+        return self._json
+
+    @property
+    def version(self):
+        """
+        version of the serialized fields, changes if the fields change
+        """
+        if self._version is None:
+            self.as_json()
+        return self._version
+
+    def internal_type(self, path):
+        """
+        get internal type of the model field for qfilter path
+        """
+        filter_field = self.get(path)
+        return filter_field.internal_type if filter_field else None
+
+
+def get_field_catalog(model, max_depth=1, include=None, exclude=None):
+    """
+    get the cached FieldCatalog of a model, built on first use
+    catalogs are cached per model, depth and include/exclude options,
+    see iter_filter_fields
+    """
+    key = (model, max_depth, _freeze_field_options(include), _freeze_field_options(exclude))
+    try:
+        return _CATALOGS[key]
+    except KeyError:
+        pass
+    LOGGER.debug('build filter field catalog for %s with depth %s', model._meta.label, max_depth)
+    catalog = _CATALOGS[key] = FieldCatalog(model, iter_filter_fields(model, max_depth, include, exclude))
+    return catalog
+
+
+def clear_field_catalog():
+    """
+    clear all cached field catalogs
+    """
+    _CATALOGS.clear()
+
+
+@receiver(class_prepared)
+def _clear_on_class_prepared(sender, **kwargs):
+    """
+    new models can add reverse relations to already cataloged models
+    """
+    clear_field_catalog()
+    clear_lookup_cache()
+
+
+@receiver(setting_changed)
+def _clear_on_setting_changed(setting, **kwargs):
+    """
+    app registry is reloaded if INSTALLED_APPS changes
+    """
+    if setting == 'INSTALLED_APPS':
+        clear_field_catalog()
+        clear_lookup_cache()
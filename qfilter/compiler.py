@@ -0,0 +1,194 @@
+"""
+Filter compiler
+
+rewrites lookups of a Q query which traverse to-many relations
+(many-to-many, reverse foreign keys) as Exists subqueries.
+the filtered queryset needs no join for these lookups and therefore no
+DISTINCT over all selected columns.
+"""
+
+__all__ = (
+    'get_to_many_prefix',
+    'get_involved_models',
+    'compile_exists',
+)
+
+# pylint: disable=protected-access
+
+import django
+from django.core.exceptions import FieldDoesNotExist
+from django.db.models import Exists, ManyToManyField, OuterRef, Q
+from django.db.models.constants import LOOKUP_SEP
+
+
+def _resolve_lookup(model, lookup):
+    """
+    split a lookup in its field parts
+
+    :return: (field_parts, to_many) where to_many is the index of the first
+             to-many relation in field_parts or None
+    """
+    opts = model._meta
+    field_parts = []
+    to_many = None
+    for part in lookup.split(LOOKUP_SEP):
+        if opts is None:
+            break
+        try:
+            field = opts.pk if part == 'pk' else opts.get_field(part)
+        except FieldDoesNotExist:
+            break
+        field_parts.append(part)
+        if to_many is None and (field.many_to_many or field.one_to_many):
+            to_many = len(field_parts) - 1
+        opts = field.related_model._meta if field.is_relation and field.related_model else None
+    return field_parts, to_many
+
+
+def get_to_many_prefix(model, lookup):
+    """
+    get the path up to the first to-many relation of a lookup,
+    ex. ingredients__name__icontains -> ingredients
+    returns None if the lookup does not traverse a to-many relation
+    """
+    field_parts, to_many = _resolve_lookup(model, lookup)
+    if to_many is None:
+        return None
+    return LOOKUP_SEP.join(field_parts[:to_many + 1])
+
+
+def get_involved_models(model, qquery):
+    """
+    get the models a Q query depends on: the model itself, the related
+    models along the lookup paths and the through models of many-to-many relations
+    """
+    models = {model}
+    for _, lookup, _ in _iter_leaves(qquery):
+        opts = model._meta
+        for part in lookup.split(LOOKUP_SEP):
+            try:
+                field = opts.pk if part == 'pk' else opts.get_field(part)
+            except FieldDoesNotExist:
+                break
+            if not field.is_relation or field.related_model is None:
+                break
+            # many-to-many field or its reverse relation
+            through = getattr(field.remote_field, 'through', None) or getattr(field, 'through', None)
+            if field.many_to_many and through is not None:
+                models.add(through)
+            models.add(field.related_model)
+            opts = field.related_model._meta
+    return models
+
+
+def _iter_leaves(node):
+    """
+    yield (node, lookup, value) of all lookups in a Q tree
+    """
+    for child in node.children:
+        if isinstance(child, Q):
+            yield from _iter_leaves(child)
+        else:
+            yield node, child[0], child[1]
+
+
+def _build_exists(model, prefix, leaves):
+    """
+    build an Exists subquery for the given (lookup, value) leaves
+    which share the to-many prefix. the leaves are applied in one filter()
+    call, like in the joined query they have to match the same related row.
+    """
+    parts = prefix.split(LOOKUP_SEP)
+    field = model._meta.get_field(parts[0]) if len(parts) == 1 else None
+
+    if field is not None and field.auto_created and not field.concrete:
+        # reverse relation, ex. ManyToOneRel or ManyToManyRel
+        back = field.field.name
+    elif isinstance(field, ManyToManyField):
+        back = field.related_query_name()
+    else:
+        # relation behind a to-one relation or generic relation, use a subquery on the model itself
+        subquery = model._base_manager.filter(Q(*leaves), pk=OuterRef('pk'))
+        return Exists(subquery)
+
+    related_leaves = []
+    for lookup, value in leaves:
+        rest = lookup[len(prefix) + len(LOOKUP_SEP):]
+        field_parts, _ = _resolve_lookup(model, lookup)
+        if len(field_parts) == len(parts):
+            # lookup on the relation itself, ex. ingredients=1 or ingredients__in=[..]
+            rest = LOOKUP_SEP.join(filter(None, ('pk', rest)))
+        related_leaves.append((rest, value))
+    # separate filter() calls, a lookup back over the same relation (ex. cookbook__recipes__name)
+    # needs its own join and must not match the outer object only
+    subquery = field.related_model._base_manager.filter(**{back: OuterRef('pk')}).filter(Q(*related_leaves))
+    return Exists(subquery)
+
+
+def _rebuild(node, model, safe, negated=False):
+    # like the ORM, negated lookups over a to-many relation get a subquery each
+    negated = negated or node.negated
+    children = []
+    groups = {}
+    for child in node.children:
+        if isinstance(child, Q):
+            children.append(_rebuild(child, model, safe, negated))
+            continue
+
+        prefix = safe.get(child[0])
+        if prefix is None:
+            children.append(child)
+        elif node.connector == Q.AND and not negated:
+            # siblings with the same prefix are combined in one subquery,
+            # placed at the position of the first sibling
+            if prefix not in groups:
+                groups[prefix] = (len(children), [])
+                children.append(None)
+            groups[prefix][1].append(child)
+        else:
+            children.append(_build_exists(model, prefix, [child]))
+
+    for prefix, (index, leaves) in groups.items():
+        children[index] = _build_exists(model, prefix, leaves)
+    return Q(*children, _connector=node.connector, _negated=node.negated)
+
+
+def compile_exists(model, qquery, keep=()):
+    """
+    rewrite the to-many lookups of a Q query as Exists subqueries
+
+    a to-many prefix is rewritten if all lookups using it are siblings
+    in the same Q node, so the join semantics of a single filter() call
+    are kept: ANDed siblings share a subquery, negated lookups get one each. lookups on fields in keep (ex. annotated fields) and
+    "isnull=True" lookups, which also match objects without related rows,
+    keep their join.
+
+    :param model:  django model
+    :param qquery: Q query
+    :param keep:   field paths which have to stay joined
+    :return: (Q query, needs_distinct)
+    """
+    # filtering on Exists expressions needs django >= 3.0
+    if django.VERSION < (3, 0):
+        return qquery, True
+
+    prefixes = {}
+    nodes = {}
+    blocked = set()
+    for node, lookup, value in _iter_leaves(qquery):
+        field_parts, to_many = _resolve_lookup(model, lookup)
+        if to_many is None:
+            continue
+        prefix = LOOKUP_SEP.join(field_parts[:to_many + 1])
+        prefixes[lookup] = prefix
+        nodes.setdefault(prefix, set()).add(id(node))
+        if LOOKUP_SEP.join(field_parts) in keep or (lookup.endswith(LOOKUP_SEP + 'isnull') and value):
+            blocked.add(prefix)
+
+    safe = {lookup: prefix for lookup, prefix in prefixes.items()
+            if prefix not in blocked and len(nodes[prefix]) == 1}
+    needs_distinct = len(safe) != len(prefixes)
+    if not safe:
+        return qquery, needs_distinct
+
+    return _rebuild(qquery, model, safe), needs_distinct
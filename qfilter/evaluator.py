@@ -0,0 +1,384 @@
+"""
+In-memory evaluation of Q queries
+
+compiles a Q query to a python predicate which is evaluated against
+loaded objects (model instances or any object with attributes) and dicts,
+without a database query. lookups, regexes and value conversions are
+resolved once when the predicate is compiled.
+
+like the ORM, a lookup over a to-many relation (a list, tuple, set or a
+related manager) matches if any related value matches. related managers
+query the database unless the relation is prefetched (prefetch_related).
+ANDed lookups over the same to-many relation have to match the same related
+value like in a single filter() call, ex. Q(ingredients__name__icontains="a") &
+Q(ingredients__name__icontains="e") matches if an ingredient contains both.
+negated lookups are matched separately like in the ORM. unlike the ORM, the
+lookups of a nested Q object are not matched against the same related value
+as the lookups around it.
+
+supported lookups: exact, iexact, contains, icontains, startswith,
+istartswith, endswith, iendswith, isnull, gt, gte, lt, lte, in, range,
+regex and iregex. comparisons are done in python, ex. exact is case
+sensitive and contains is not affected by the database collation.
+"""
+
+__all__ = (
+    'compile_q',
+    'compile_qfilter',
+    'filter_objects',
+)
+
+# pylint: disable=protected-access
+
+import functools
+import operator
+import re
+
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+from django.db.models.constants import LOOKUP_SEP
+
+from . import vars
+from .compiler import _resolve_lookup
+from .optimizer import optimize_q
+from .parser import parse_qquery
+
+
+class _Many(list):
+    """
+    values of a to-many relation, the lookup matches if any value matches
+    """
+
+
+_ITERABLES = (list, tuple, set, frozenset)
+
+# path part of the primary key of a related object, which may be given as object, dict or key
+_PK = object()
+
+
+def _get_pk(value):
+    if isinstance(value, dict):
+        return value.get('pk', value.get('id'))
+    return getattr(value, 'pk', value)
+
+
+def _get_part(value, part):
+    if part is _PK:
+        return _get_pk(value)
+    if isinstance(value, dict):
+        value = _get_pk(value) if part == 'pk' else value.get(part)
+    else:
+        value = getattr(value, part, None)
+    if value is None or isinstance(value, str):
+        return value
+    if isinstance(value, _ITERABLES):
+        return _Many(value)
+    if callable(getattr(value, 'all', None)) and hasattr(value, 'model'):
+        # related manager
+        return _Many(value.all())
+    return value
+
+
+def _match(obj, leaves):
+    """
+    check if all leaves match, leaves are (parts, test) with the field path of a lookup.
+    leaves over the same to-many relation have to match the same related value, like
+    the joins of the ORM are shared within a filter() call.
+    """
+    related = {}
+    for parts, test in leaves:
+        value = obj
+        for index, part in enumerate(parts):
+            if value is None:
+                break
+            value = _get_part(value, part)
+            if isinstance(value, _Many):
+                prefix = tuple(parts[:index + 1])
+                related.setdefault(prefix, (value, []))[1].append((parts[index + 1:], test))
+                break
+        else:
+            if not test(value):
+                return False
+            continue
+        if value is None and not test(None):
+            return False
+    for values, related_leaves in related.values():
+        if not values:
+            # no related object, like the NULL of a LEFT JOIN
+            if not all(test(None) for _, test in related_leaves):
+                return False
+        elif not any(_match(value, related_leaves) for value in values):
+            return False
+    return True
+
+
+def _text(value):
+    return value if isinstance(value, str) else str(value)
+
+
+def _compare(op):
+    def make(rhs):
+        def test(value):
+            try:
+                return value is not None and op(value, rhs)
+            except TypeError:
+                return False
+        return test
+    return make
+
+
+def _exact(rhs):
+    if rhs is None:
+        return lambda value: value is None
+    return lambda value: value == rhs
+
+
+def _iexact(rhs):
+    rhs = _text(rhs).casefold()
+    return lambda value: value is not None and _text(value).casefold() == rhs
+
+
+def _contains(rhs):
+    rhs = _text(rhs)
+    return lambda value: value is not None and rhs in _text(value)
+
+
+def _icontains(rhs):
+    rhs = _text(rhs).casefold()
+    return lambda value: value is not None and rhs in _text(value).casefold()
+
+
+def _startswith(rhs):
+    rhs = _text(rhs)
+    return lambda value: value is not None and _text(value).startswith(rhs)
+
+
+def _istartswith(rhs):
+    rhs = _text(rhs).casefold()
+    return lambda value: value is not None and _text(value).casefold().startswith(rhs)
+
+
+def _endswith(rhs):
+    rhs = _text(rhs)
+    return lambda value: value is not None and _text(value).endswith(rhs)
+
+
+def _iendswith(rhs):
+    rhs = _text(rhs).casefold()
+    return lambda value: value is not None and _text(value).casefold().endswith(rhs)
+
+
+def _isnull(rhs):
+    rhs = bool(rhs)
+    return lambda value: (value is None) is rhs
+
+
+def _in(rhs):
+    try:
+        values = frozenset(rhs)
+    except TypeError:
+        values = list(rhs)
+
+    def test(value):
+        try:
+            return value in values
+        except TypeError:
+            return False
+    return test
+
+
+def _range(rhs):
+    low, high = rhs
+
+    def test(value):
+        try:
+            return value is not None and low <= value <= high
+        except TypeError:
+            return False
+    return test
+
+
+def _regex(flags=0):
+    def make(rhs):
+        search = re.compile(_text(rhs), flags).search
+        return lambda value: value is not None and search(_text(value)) is not None
+    return make
+
+
+LOOKUPS = {
+    'exact': _exact,
+    'iexact': _iexact,
+    'contains': _contains,
+    'icontains': _icontains,
+    'startswith': _startswith,
+    'istartswith': _istartswith,
+    'endswith': _endswith,
+    'iendswith': _iendswith,
+    'isnull': _isnull,
+    'gt': _compare(operator.gt),
+    'gte': _compare(operator.ge),
+    'lt': _compare(operator.lt),
+    'lte': _compare(operator.le),
+    'in': _in,
+    'range': _range,
+    'regex': _regex(),
+    'iregex': _regex(re.IGNORECASE),
+}
+
+# lookups whose value is converted to the python type of the model field
+_CONVERTED_LOOKUPS = ('exact', 'gt', 'gte', 'lt', 'lte', 'in', 'range')
+
+
+def _split_lookup(lookup, model):
+    """
+    split a lookup in field parts and lookup name, ex. ingredients__name__icontains
+
+    :return: (parts, lookup_name, field) where field is the model field or None
+    """
+    parts = lookup.split(LOOKUP_SEP)
+    field = None
+    if model is not None:
+        field_parts, _ = _resolve_lookup(model, lookup)
+        rest = parts[len(field_parts):]
+        if len(rest) > 1 or not field_parts:
+            raise ValueError('unsupported lookup: {}'.format(lookup))
+        field, parts = _get_field(model, field_parts)
+        name = rest[0] if rest else 'exact'
+        if field.is_relation and name != 'isnull':
+            # compare related objects by primary key like the ORM
+            parts = parts + [_PK]
+            field = field.related_model._meta.pk
+    elif len(parts) > 1 and parts[-1] in LOOKUPS:
+        parts, name = parts[:-1], parts[-1]
+    else:
+        name = 'exact'
+    if name not in LOOKUPS:
+        raise ValueError('unsupported lookup: {}'.format(lookup))
+    return parts, name, field
+
+
+def _get_field(model, parts):
+    """
+    get the last field of a field path and the attribute names of the path,
+    reverse relations are accessed by their accessor, ex. cookbook -> cookbook_set
+
+    :return: (field, attribute_names)
+    """
+    opts = model._meta
+    names = []
+    for part in parts:
+        field = opts.pk if part == 'pk' else opts.get_field(part)
+        names.append(field.get_accessor_name() if field.auto_created and not field.concrete else part)
+        if field.is_relation and field.related_model:
+            opts = field.related_model._meta
+    return field, names
+
+
+def _convert(field, name, value):
+    """
+    convert the value of a lookup to the python type of the field, ex. "2020-01-01" to a date
+    """
+    if field is None or name not in _CONVERTED_LOOKUPS or value is None:
+        return value
+    try:
+        if name in ('in', 'range'):
+            return [field.to_python(v) for v in value]
+        return field.to_python(value)
+    except ValidationError as e:
+        raise ValueError('invalid value {!r} for {}: {}'.format(value, field.name, '; '.join(e.messages))) from e
+
+
+def _compile_leaf(lookup, value, model):
+    """
+    :return: (parts, test) of a lookup, see _match
+    """
+    parts, name, field = _split_lookup(lookup, model)
+    if name == 'exact' and value is None:
+        name = 'isnull'
+        value = True
+    return parts, LOOKUPS[name](_convert(field, name, value))
+
+
+def _leaves(leaves):
+    return lambda obj: _match(obj, leaves)
+
+
+def _all(predicates):
+    def predicate(obj):
+        for p in predicates:
+            if not p(obj):
+                return False
+        return True
+    return predicate
+
+
+def _any(predicates):
+    def predicate(obj):
+        for p in predicates:
+            if p(obj):
+                return True
+        return False
+    return predicate
+
+
+def _not(inner):
+    return lambda obj: not inner(obj)
+
+
+def _compile(node, model, negated=False):
+    negated = negated or node.negated
+    leaves = tuple(_compile_leaf(child[0], child[1], model) for child in node.children if not isinstance(child, Q))
+    predicates = tuple(_compile(child, model, negated) for child in node.children if isinstance(child, Q))
+    if node.connector == Q.OR or negated:
+        # like the ORM, lookups over a to-many relation under a negation are matched separately
+        predicates = tuple(_leaves((leaf,)) for leaf in leaves) + predicates
+    elif leaves:
+        # ANDed lookups are evaluated together, see _match
+        predicates = (_leaves(leaves),) + predicates
+    if not predicates:
+        predicate = lambda obj: True  # pylint: disable=unnecessary-lambda-assignment
+    elif len(predicates) == 1:
+        predicate = predicates[0]
+    elif node.connector == Q.OR:
+        predicate = _any(predicates)
+    else:
+        predicate = _all(predicates)
+    return _not(predicate) if node.negated else predicate
+
+
+def compile_q(qquery, model=None):
+    """
+    compile a Q query to a predicate, predicate(obj) -> bool
+
+    :param qquery: Q query
+    :param model:  django model of the objects, optional. lookups are resolved
+                   against its fields, related objects are compared by primary key
+                   and values are converted to the field types, ex. "2020-01-01" to a date.
+                   without a model the last part of a lookup is the lookup name if
+                   it is a supported lookup and values are compared as they are.
+    :raises ValueError: if a lookup is not supported or a value is invalid for its field
+    """
+    return _compile(qquery, model)
+
+
+@functools.lru_cache(maxsize=vars.QQUERY_PARSE_CACHE_SIZE)
+def compile_qfilter(qfilter, model=None):
+    """
+    parse, optimize and compile a qfilter string to a predicate, see compile_q
+
+    predicates are cached by qfilter and model.
+
+    :raises QQuerySyntaxError: if the qfilter is invalid
+    :raises ValueError: if a lookup is not supported or a value is invalid for its field
+    """
+    return compile_q(optimize_q(parse_qquery(qfilter), model), model)
+
+
+def filter_objects(qfilter, objects, model=None):
+    """
+    filter objects or dicts by a qfilter string or Q query in memory
+
+    :return: iterator of the matching objects
+    """
+    predicate = compile_q(qfilter, model) if isinstance(qfilter, Q) else compile_qfilter(qfilter, model)
+    return filter(predicate, objects)
@@ -0,0 +1,72 @@
+"""
+Streaming export of qfilter results
+
+rows are streamed from the database with iterator() and written as
+CSV or JSON Lines chunk by chunk, memory usage does not depend on the
+number of rows.
+"""
+
+__all__ = (
+    'EXPORT_FORMATS',
+    'iter_csv',
+    'iter_jsonl',
+    'iter_rows',
+    'iter_merged_rows',
+)
+
+import csv
+import json
+
+from django.core.serializers.json import DjangoJSONEncoder
+
+
+class _Echo:
+    """
+    file like object which returns the written value, used for csv.writer
+    """
+
+    def write(self, value):  # pylint: disable=no-self-use
+        return value
+
+
+def iter_csv(columns, rows, list_separator='|'):
+    """
+    generate CSV lines with a header row, lists (merged values) are joined by list_separator
+    """
+    writer = csv.writer(_Echo())
+    yield writer.writerow(columns)
+    for row in rows:
+        yield writer.writerow([list_separator.join(str(v) for v in value) if isinstance(value, list) else value
+                               for value in row])
+
+
+def iter_jsonl(columns, rows, list_separator=None):  # pylint: disable=unused-argument
+    """
+    generate JSON Lines, one object per row
+    """
+    encoder = DjangoJSONEncoder()
+    for row in rows:
+        yield encoder.encode(dict(zip(columns, row))) + '\n'
+
+
+# format: (generator, content type, file extension)
+EXPORT_FORMATS = {
+    'csv': (iter_csv, 'text/csv', 'csv'),
+    'jsonl': (iter_jsonl, 'application/x-ndjson', 'jsonl'),
+}
+
+
+def iter_rows(queryset, columns, chunk_size=2000):
+    """
+    stream the columns of a queryset as tuples
+    """
+    return queryset.values_list(*columns).iterator(chunk_size=chunk_size)
+
+
+def iter_merged_rows(merged, columns):
+    """
+    stream merged values (MergedValues or AggregatedMergedValues) as tuples,
+    the first column is the shared key
+    """
+    for key, record in merged.items():
+        yield (key,) + tuple(record.get(column) for column in columns[1:])
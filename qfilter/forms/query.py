@@ -13,9 +13,8 @@ __all__ = (
 from crispy_forms.helper import FormHelper
 from crispy_forms.layout import Column, Div, Layout, Row
 from django import forms
-from django.core.validators import RegexValidator
 
-from qfilter import vars
+from qfilter.utils import qquery_validator
 
 
 class QueryFilterForm(forms.Form):
@@ -32,8 +31,8 @@ class QueryFilterForm(forms.Form):
     qfilter = forms.CharField(required=False,
                               empty_value=None,
                               label="Django Q Query",
-                              validators=[RegexValidator(vars.QQUERY_REGEX)],
-                              widget=forms.TextInput(attrs={'pattern': vars.QQUERY_REGEX, 'class':'w-100'})
+                              validators=[qquery_validator],
+                              widget=forms.TextInput(attrs={'class':'w-100'})
                               )
 
 
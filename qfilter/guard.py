@@ -0,0 +1,153 @@
+"""
+Query cost guard
+
+estimates the cost of a qfilter queryset with EXPLAIN before it is executed
+and limits the execution time of queries with a statement timeout.
+"""
+
+__all__ = (
+    'QueryCost',
+    'QueryCostExceeded',
+    'explain_cost',
+    'exceeds',
+    'statement_timeout',
+)
+
+# pylint: disable=invalid-name
+
+import contextlib
+import json
+import logging
+import time
+from collections import namedtuple
+
+from django.core.exceptions import EmptyResultSet
+from django.db import connections, transaction
+
+LOGGER = logging.getLogger(__name__)
+
+# cost and rows are planner estimates (PostgreSQL), scans is the number of
+# full table scans in the plan (SQLite), unknown values are None
+QueryCost = namedtuple('QueryCost', ('cost', 'rows', 'scans'))
+
+
+class QueryCostExceeded(Exception):
+    """
+    raised if the estimated cost of a query exceeds the configured limits
+    """
+
+    def __init__(self, cost):
+        super().__init__('query too expensive: {}'.format(
+            ', '.join('{}={}'.format(k, v) for k, v in cost._asdict().items() if v is not None)))
+        self.cost = cost
+
+
+def _explain_postgresql(queryset):
+    plan = json.loads(queryset.explain(format='json'))[0]['Plan']
+    return QueryCost(plan['Total Cost'], plan['Plan Rows'], None)
+
+
+def _explain_sqlite(queryset):
+    scans = 0
+    for line in queryset.explain().splitlines():
+        detail = line.split(None, 3)[-1]
+        if detail.startswith('SCAN') and 'USING' not in detail and 'CONSTANT ROW' not in detail:
+            scans += 1
+    return QueryCost(None, None, scans)
+
+
+_EXPLAIN = {
+    'postgresql': _explain_postgresql,
+    'sqlite': _explain_sqlite,
+}
+
+
+def explain_cost(queryset):
+    """
+    estimate the cost of a queryset with EXPLAIN
+    returns None if the database is not supported
+    """
+    explain = _EXPLAIN.get(connections[queryset.db].vendor)
+    if explain is None:
+        return None
+    try:
+        queryset.query.get_compiler(queryset.db).as_sql()
+    except EmptyResultSet:
+        # the query matches nothing and is never sent to the database
+        return QueryCost(0, 0, 0)
+    cost = explain(queryset)
+    LOGGER.debug('qfilter query cost: %s', cost)
+    return cost
+
+
+def exceeds(cost, max_cost=None, max_rows=None, max_scans=None):
+    """
+    check if a QueryCost exceeds one of the given limits
+    """
+    limits = ((cost.cost, max_cost), (cost.rows, max_rows), (cost.scans, max_scans))
+    return any(value is not None and limit is not None and value > limit for value, limit in limits)
+
+
+@contextlib.contextmanager
+def _timeout_postgresql(connection, timeout):
+    # SET LOCAL lasts until the end of the outer transaction (ex. ATOMIC_REQUESTS),
+    # the previous value is restored after the block. if the block fails, rolling
+    # back the savepoint restores it.
+    with transaction.atomic(using=connection.alias):
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT current_setting('statement_timeout')")
+            previous = cursor.fetchone()[0]
+            cursor.execute('SET LOCAL statement_timeout = %s', [int(timeout)])
+        yield
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT set_config('statement_timeout', %s, true)", [previous])
+
+
+@contextlib.contextmanager
+def _timeout_mysql(connection, timeout):
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT @@SESSION.max_execution_time')
+        previous = cursor.fetchone()[0]
+        cursor.execute('SET SESSION max_execution_time = %s', [int(timeout)])
+    try:
+        yield
+    finally:
+        with connection.cursor() as cursor:
+            cursor.execute('SET SESSION max_execution_time = %s', [previous])
+
+
+@contextlib.contextmanager
+def _timeout_sqlite(connection, timeout):
+    connection.ensure_connection()
+    deadline = time.monotonic() + timeout / 1000.0
+    # a non-zero return value interrupts the running statement
+    connection.connection.set_progress_handler(lambda: time.monotonic() > deadline, 1000)
+    try:
+        yield
+    finally:
+        connection.connection.set_progress_handler(None, 0)
+
+
+_TIMEOUT = {
+    'postgresql': _timeout_postgresql,
+    'mysql': _timeout_mysql,
+    'sqlite': _timeout_sqlite,
+}
+
+
+@contextlib.contextmanager
+def statement_timeout(using, timeout):
+    """
+    limit the execution time of each query in the block
+    exceeding the timeout raises a django.db.OperationalError (or DatabaseError)
+
+    :param using:   database alias
+    :param timeout: timeout in milliseconds, None to disable
+    """
+    connection = connections[using]
+    handler = _TIMEOUT.get(connection.vendor)
+    if timeout is None or handler is None:
+        yield
+        return
+    with handler(connection, timeout):
+        yield
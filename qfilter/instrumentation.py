@@ -0,0 +1,237 @@
+"""
+Instrumentation of qfilter requests
+
+collects the time of each phase of a qfilter request, the number of
+queries and the number of result rows. the metrics are sent with the
+qfilter_finished signal and reported to an optional metrics adapter.
+
+phases:
+- parse:    parse and validate the qfilter string
+- optimize: optimize the Q tree
+- resolve:  resolve the lookups of the Q tree to fields
+- annotate: annotate the filter fields to the queryset
+- cost:     estimate the query cost with EXPLAIN
+- merge:    merge the values by object, streamed while rendering
+- render:   render the response, the querysets are evaluated here
+- execute:  time spent in the database, included in the phase which ran the query
+"""
+
+__all__ = (
+    'qfilter_finished',
+    'QFilterMetrics',
+    'TimedMerged',
+    'MetricsAdapter',
+    'LoggingMetricsAdapter',
+    'MemoryMetricsAdapter',
+    'StatsdMetricsAdapter',
+    'PrometheusMetricsAdapter',
+)
+
+import contextlib
+import logging
+import time
+
+from django.dispatch import Signal
+
+LOGGER = logging.getLogger(__name__)
+
+# sent after a qfilter request is rendered, arguments: view, metrics
+qfilter_finished = Signal()
+
+
+class QFilterMetrics:
+    """
+    metrics of one qfilter request
+
+    queries are counted with an execute wrapper on the database connection,
+    installed by start() and removed by finish().
+    """
+
+    def __init__(self, qfilter, connection=None):
+        self.qfilter = qfilter
+        self.connection = connection
+        self.phases = {}
+        self.queries = 0
+        self.rows = 0
+        self.finished = False
+
+    def add(self, phase, seconds):
+        self.phases[phase] = self.phases.get(phase, 0.0) + seconds
+
+    @contextlib.contextmanager
+    def phase(self, name):
+        """
+        time a block as phase, repeated phases are summed up
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - start)
+
+    def _execute_wrapper(self, execute, sql, params, many, context):  # pylint: disable=too-many-arguments
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries += 1
+            self.add('execute', time.perf_counter() - start)
+
+    def start(self):
+        if self.connection is not None:
+            self.connection.execute_wrappers.append(self._execute_wrapper)
+
+    def finish(self):
+        """
+        stop counting queries, returns False if already finished
+        """
+        if self.finished:
+            return False
+        self.finished = True
+        if self.connection is not None and self._execute_wrapper in self.connection.execute_wrappers:
+            self.connection.execute_wrappers.remove(self._execute_wrapper)
+        return True
+
+    def as_dict(self):
+        return {
+            'qfilter': self.qfilter,
+            'phases': dict(self.phases),
+            'queries': self.queries,
+            'rows': self.rows,
+        }
+
+
+class TimedMerged:
+    """
+    proxy of merged values (MergedValues or AggregatedMergedValues) which adds
+    the time spent iterating the merged values to the merge phase and counts the rows
+    """
+
+    def __init__(self, merged, metrics):
+        self.merged = merged
+        self.metrics = metrics
+
+    def _timed(self, iterator):
+        iterator = iter(iterator)
+        while True:
+            start = time.perf_counter()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                return
+            finally:
+                self.metrics.add('merge', time.perf_counter() - start)
+            self.metrics.rows += 1
+            yield item
+
+    def items(self):
+        return self._timed(self.merged.items())
+
+    def values(self):
+        return self._timed(self.merged.values())
+
+    def for_keys(self, keys):
+        return TimedMerged(self.merged.for_keys(keys), self.metrics)
+
+    def __iter__(self):
+        return iter(self.values())
+
+
+class MetricsAdapter:
+    """
+    base class to report the metrics of qfilter requests to a metrics system
+
+    :param prefix: prefix of the metric names
+    """
+
+    def __init__(self, prefix='qfilter'):
+        self.prefix = prefix
+
+    def name(self, name):
+        return '{}.{}'.format(self.prefix, name)
+
+    def timing(self, name, seconds):
+        raise NotImplementedError
+
+    def incr(self, name, value=1):
+        raise NotImplementedError
+
+    def report(self, metrics):
+        """
+        report the metrics of one request
+        """
+        for phase, seconds in metrics.phases.items():
+            self.timing(self.name(phase), seconds)
+        self.incr(self.name('requests'))
+        self.incr(self.name('queries'), metrics.queries)
+        self.incr(self.name('rows'), metrics.rows)
+
+
+class LoggingMetricsAdapter(MetricsAdapter):
+    """
+    log the metrics of each request in one line
+    """
+
+    def __init__(self, prefix='qfilter', logger=LOGGER, level=logging.INFO):
+        super().__init__(prefix)
+        self.logger = logger
+        self.level = level
+
+    def report(self, metrics):
+        self.logger.log(self.level, '%s phases=%s queries=%s rows=%s filter=%s', self.prefix,
+                        ' '.join('{}:{:.2f}ms'.format(phase, seconds * 1000) for phase, seconds in metrics.phases.items()),
+                        metrics.queries, metrics.rows, metrics.qfilter)
+
+
+class MemoryMetricsAdapter(MetricsAdapter):
+    """
+    keep the reported metrics in memory, ex. for local development and tests
+    """
+
+    def __init__(self, prefix='qfilter'):
+        super().__init__(prefix)
+        self.timings = []
+        self.counters = {}
+
+    def timing(self, name, seconds):
+        self.timings.append((name, seconds))
+
+    def incr(self, name, value=1):
+        self.counters[name] = self.counters.get(name, 0) + value
+
+
+class StatsdMetricsAdapter(MetricsAdapter):
+    """
+    report to a statsd client with timing(name, milliseconds) and incr(name, count)
+    """
+
+    def __init__(self, client, prefix='qfilter'):
+        super().__init__(prefix)
+        self.client = client
+
+    def timing(self, name, seconds):
+        self.client.timing(name, seconds * 1000)
+
+    def incr(self, name, value=1):
+        self.client.incr(name, value)
+
+
+class PrometheusMetricsAdapter(MetricsAdapter):
+    """
+    report to a prometheus histogram with a phase label and a counter with a name label,
+    ex. prometheus_client.Histogram('qfilter_seconds', '...', ['phase'])
+    """
+
+    def __init__(self, histogram, counter, prefix='qfilter'):
+        super().__init__(prefix)
+        self.histogram = histogram
+        self.counter = counter
+
+    def name(self, name):
+        return name
+
+    def timing(self, name, seconds):
+        self.histogram.labels(phase=name).observe(seconds)
+
+    def incr(self, name, value=1):
+        self.counter.labels(name=name).inc(value)
@@ -0,0 +1,46 @@
+"""
+refresh the materialized results of saved qfilters
+"""
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from qfilter.models import SavedQFilter
+
+
+class Command(BaseCommand):
+    """
+    refresh saved qfilters, ex. from cron::
+
+        python manage.py qfilter_refresh --due
+    """
+    help = 'refresh the materialized results of saved qfilters'
+
+    def add_arguments(self, parser):
+        parser.add_argument('names', nargs='*', help='names of the saved qfilters, all if empty')
+        parser.add_argument('--due', action='store_true',
+                            help='only refresh stale saved qfilters and those with an elapsed refresh interval')
+
+    def handle(self, *args, **options):
+        saved_filters = SavedQFilter.objects.order_by('name')
+        if options['names']:
+            saved_filters = saved_filters.filter(name__in=options['names'])
+            missing = set(options['names']) - {saved.name for saved in saved_filters}
+            if missing:
+                raise CommandError('unknown saved qfilters: {}'.format(', '.join(sorted(missing))))
+
+        now = timezone.now()
+        failed = 0
+        for saved in saved_filters:
+            if options['due'] and not saved.is_due(now):
+                continue
+            try:
+                added, removed, updated = saved.refresh()
+            except Exception as exc:  # pylint: disable=broad-except
+                failed += 1
+                self.stderr.write('{}: {}'.format(saved.name, exc))
+                continue
+            self.stdout.write('{}: {} added, {} removed, {} updated'.format(saved.name, added, removed, updated))
+
+        if failed:
+            raise CommandError('{} saved qfilters failed'.format(failed))
@@ -0,0 +1,47 @@
+# Generated by Django 3.2.25 on 2026-10-18 09:39
+
+from django.db import migrations, models
+import django.db.models.deletion
+import qfilter.utils
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SavedQFilter',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.SlugField(max_length=100, unique=True)),
+                ('model', models.CharField(help_text='model label, ex. food.Recipe', max_length=100)),
+                ('qfilter', models.TextField(validators=[qfilter.utils.qquery_validator])),
+                ('merged', models.BooleanField(default=False, help_text='materialize the merged values')),
+                ('refresh_interval', models.PositiveIntegerField(blank=True, help_text='refresh every n seconds, only if stale if empty', null=True)),
+                ('stale', models.BooleanField(default=True, editable=False)),
+                ('involved_models', models.TextField(default='', editable=False)),
+                ('refreshed', models.DateTimeField(blank=True, editable=False, null=True)),
+                ('created', models.DateTimeField(auto_now_add=True)),
+                ('updated', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name': 'saved qfilter',
+            },
+        ),
+        migrations.CreateModel(
+            name='SavedQFilterResult',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('object_id', models.BigIntegerField()),
+                ('payload', models.TextField(blank=True, null=True)),
+                ('saved_filter', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='results', to='qfilter.savedqfilter')),
+            ],
+            options={
+                'unique_together': {('saved_filter', 'object_id')},
+            },
+        ),
+    ]
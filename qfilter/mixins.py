@@ -3,23 +3,69 @@ Mixins for Inventory
 """
 
 __all__ = (
+    'QFilterOptions',
     'QQueryViewMixin',
 )
 
 # pylint: disable=attribute-defined-outside-init,line-too-long,protected-access
 
+import contextlib
 import logging
+from collections import namedtuple
 
 from django.contrib import messages
+from django.core.exceptions import FieldError, ValidationError
+from django.core.paginator import Paginator
+from django.db import DatabaseError, connections
 from django.db.models import Q  # pylint: disable=unused-import
-from django.db.models import F
-
+from django.db.models import Count, F
+from django.http import HttpResponse, HttpResponseNotModified, JsonResponse, StreamingHttpResponse
+from django.shortcuts import get_object_or_404
+from django.utils.cache import patch_cache_control
+from django.utils.http import parse_etags
+
+from .cache import get_cached_keys, get_cached_values
+from .catalog import get_field_catalog
+from .compiler import compile_exists, get_involved_models, get_to_many_prefix
 from .forms import (QueryFilterForm, QueryFilterWizardFormSet, QueryFilterWizardFormSetHelper)
-from . import utils
+from .optimizer import EMPTY, optimize_q
+from .parser import QQuerySyntaxError
+from . import export, guard, instrumentation, utils
 from .utils import eval_qquery
 
 LOGGER = logging.getLogger(__name__)
 
+# immutable per request options, parsed from GET or POST
+# merged: normalize the joined values of the result by object
+QFilterOptions = namedtuple('QFilterOptions', ('merged',))
+
+
+@contextlib.contextmanager
+def _no_phase():
+    yield
+
+
+class _ClosingStream:
+    """
+    streamed content which calls on_close when the response is closed,
+    also if the content was never iterated
+    """
+
+    def __init__(self, iterable, on_close):
+        self.iterable = iterable
+        self.on_close = on_close
+
+    def __iter__(self):
+        return iter(self.iterable)
+
+    def close(self):
+        try:
+            close = getattr(self.iterable, 'close', None)
+            if close is not None:
+                close()
+        finally:
+            self.on_close()
+
 
 class QQueryViewMixin:
     """
@@ -31,7 +77,87 @@ class QQueryViewMixin:
     """
 
     qfilter = None
-    qfilter_options = {'merged': False}
+    qfilter_query = None
+    # error of the qfilter which was not applied, ex. syntax error or rejected by the cost guard
+    qfilter_error = None
+    qfilter_options = QFilterOptions(merged=False)
+
+    # filter field discovery, see qfilter.catalog.iter_filter_fields
+    qfilter_max_depth = 1
+    qfilter_include_fields = None
+    qfilter_exclude_fields = None
+
+    # merge the joined values with database aggregates if supported
+    qfilter_merge_in_database = False
+
+    # filter to-many relations with EXISTS subqueries instead of joins and DISTINCT,
+    # the to-many fields are not annotated to the result
+    qfilter_exists_to_many = False
+
+    # normalize the Q query before execution: flatten, merge OR-ed exact lookups
+    # to __in, remove duplicate and contradictory clauses, see qfilter.optimizer
+    qfilter_optimize = True
+
+    # use the filter queryset as the view's object list instead of a separate queryset
+    qfilter_replace_queryset = False
+
+    # cache the ids of paginated qfilter results, see qfilter.cache
+    qfilter_cache = False
+    qfilter_cache_timeout = 300
+    qfilter_cache_alias = 'default'
+
+    # reject, warn or downgrade filters exceeding the EXPLAIN estimates, see qfilter.guard
+    qfilter_max_cost = None
+    qfilter_max_rows = None
+    qfilter_max_scans = None
+    qfilter_cost_action = 'reject'
+    qfilter_downgrade_paginate_by = 100
+
+    # statement timeout in milliseconds for the qfilter queries
+    qfilter_statement_timeout = None
+
+    # load the wizard field choices from a cached json response instead of
+    # rendering them into every form, see render_qfilter_fields
+    qfilter_lazy_field_choices = False
+    qfilter_fields_kwarg = 'qfilter-fields'
+    qfilter_fields_max_age = 3600
+
+    # get parameter with the field path to autocomplete values of text fields,
+    # the prefix is given in the q parameter, see render_qfilter_autocomplete
+    qfilter_autocomplete_kwarg = 'qfilter-autocomplete'
+    qfilter_autocomplete_limit = 10
+    qfilter_autocomplete_timeout = 300
+    qfilter_autocomplete_field_types = ('CharField', 'TextField', 'SlugField', 'EmailField', 'URLField')
+
+    # get or post parameter to respond with the number of matching objects as json,
+    # exact or estimate, see get_qfilter_count
+    qfilter_count_kwarg = 'qfilter-count'
+
+    # minimal planner row estimate which is returned instead of an exact count
+    qfilter_count_estimate_min = 10000
+
+    # get parameter with the name of a saved qfilter, served from its materialized
+    # results, see qfilter.models.SavedQFilter
+    qfilter_saved_kwarg = 'qfilter-saved'
+    qfilter_saved = None
+
+    # get parameter and options to stream the qfilter results as csv or jsonl
+    qfilter_export_kwarg = 'qfilter-export'
+    qfilter_export_chunk_size = 2000
+    qfilter_export_list_separator = '|'
+
+    # collect per phase timings, query and row counts of qfilter requests,
+    # sent with the qfilter_finished signal, see qfilter.instrumentation
+    qfilter_instrument = True
+
+    # optional MetricsAdapter the metrics are reported to
+    qfilter_metrics_adapter = None
+
+    qfilter_metrics = None
+
+    # get parameters to paginate the qfilter results, see paginate_by
+    qfilter_page_kwarg = 'qfilter-page'
+    qfilter_after_kwarg = 'qfilter-after'
 
     def _get_lookups_from_q(self, qquery):
         """
@@ -68,57 +194,75 @@ class QQueryViewMixin:
 
         # pylint: disable=invalid-name
 
-        lookups = self.get_lookups_from_q(qquery)
-        q_fields = utils.extract_field_names_from_q(qs.query, lookups)
-        filter_fields = self.get_filter_fields()
+        with self.qfilter_phase('resolve'):
+            annotations = self.plan_qfilter_annotations(qs, qquery, stringify=stringify)
+        LOGGER.debug('qfilter annotations: %s', annotations)
+        with self.qfilter_phase('annotate'):
+            if annotations:
+                qs = qs.annotate(**{name: F(field) for name, field in annotations.items()})
+
+        qs.qfilter_fields = list(annotations)
+        qs.qfilter_field_map = annotations
+        # pylint: disable=protected-access
+        qs.qfilter_columns = [field.attname for field in qs.model._meta.concrete_fields] + qs.qfilter_fields
+        return qs
+
+    def plan_qfilter_annotations(self, qs, qquery, stringify=False):
+        """
+        resolve the fields of the Q Query lookups to annotation names
 
-        qfilter_fields = []
-        for field in q_fields:
+        repeated fields are annotated once, if two fields resolve to
+        the same name the first one is used.
+
+        :return: {annotation name: field path} in lookup order
+        """
+        # the empty clause of the optimizer matches nothing, there is no value to annotate
+        q_fields = [resolved.path for lookup, resolved in utils.resolve_q_lookups(qs.query, qquery).items()
+                    if lookup != EMPTY[0]]
+        catalog = self.get_filter_field_catalog()
+
+        annotations = {}
+        for field in dict.fromkeys(q_fields):
+
+            # filtered by EXISTS subquery or materialized results, annotating would join again
+            # without the filter restricting the related rows
+            if self._skip_to_many_annotations() and get_to_many_prefix(qs.model, field):
+                continue
 
             if stringify:
                 # get __str__ representation of field
-                # iteration needed to get django model field from q-filter notation
-                # ex. group__name -> inventory.Group.name
-                for ff in filter_fields:
-                    if ff[0] == field:
-                        annotate_field_name = utils.get_short_field_name(ff[2])
-                        break
+                # ex. group__name -> Group.name
+                annotate_field_name = catalog.short_name(field)
             else:
                 annotate_field_name = 'Q({})'.format(field)
+            annotations.setdefault(annotate_field_name, field)
 
-            annotate_field_value = {annotate_field_name: F(field)}
-            qfilter_fields.append(annotate_field_name)
-            LOGGER.debug(annotate_field_name)
-            LOGGER.debug(annotate_field_value)
-            qs = qs.annotate(**annotate_field_value)
+        return annotations
 
-        qs.qfilter_fields = list(set(qfilter_fields))
-        return qs
+    def _skip_to_many_annotations(self):
+        if self.qfilter_exists_to_many:
+            return True
+        # the materialized merged values contain the to-many fields
+        return self.qfilter_saved is not None and not (self.qfilter_options.merged and self.qfilter_saved.merged)
+
+    def get_filter_field_catalog(self):
+        """
+        get the cached filter field catalog of the model
+        """
+        return get_field_catalog(self.model,
+                                 max_depth=self.qfilter_max_depth,
+                                 include=self.qfilter_include_fields,
+                                 exclude=self.qfilter_exclude_fields)
 
     def get_filter_fields(self):
         """
         collect possible filter fields from given model
-        also the related fields with depth 2 and for ansiblefacts depth 3
-        - exclude field type "AutoField": auto generated ID field
-        """
-        filter_fields = []
-
-        for field in self.model._meta.get_fields():  # pylint: disable=too-many-nested-blocks
-            if field.is_relation:
-                for field2 in field.related_model._meta.get_fields():  # traverse 1. relation
-                    if not field2.is_relation and field2.get_internal_type() != 'AutoField':
-                        filter_fields.append(('{}__{}'.format(field.name, field2.name), field2.get_internal_type(), field2),)  # pylint: disable=line-too-long
-                    # traverse 2. relation
-                    elif field2.is_relation and field2.related_model is not None and field2.related_model._meta.model_name.startswith('ansiblefacts'):  # pylint: disable=line-too-long
-                        for field3 in field2.related_model._meta.get_fields():
-                            if not field3.is_relation and field3.get_internal_type() != 'AutoField':
-                                filter_fields.append(('{}__{}__{}'.format(field.name, field2.name, field3.name), field3.get_internal_type(), field3),)  # pylint: disable=line-too-long
-            else:
-                if field.get_internal_type() != 'AutoField':
-                    filter_fields.append(('{}'.format(field.name), field.get_internal_type(), field),)
-
-        return filter_fields
+        also the related fields up to qfilter_max_depth relations
+        - exclude auto generated ID fields
 
+        the fields are discovered once per model, see qfilter.catalog
+        """
+        return self.get_filter_field_catalog().fields
 
     def get_queryset(self, *args, **kwargs):
         """
@@ -126,6 +270,10 @@ class QQueryViewMixin:
 
         to avoid inner joins and slow SQL, the QQuery QuerySet is stored in self.qfilter_qs
         and evaluated separate.
+
+        with qfilter_replace_queryset the QQuery QuerySet is built from the parent queryset
+        (ordering, select_related, manager) and returned as the view's object list,
+        only one query is needed per page.
         """
         # pylint: disable=invalid-name
         qs = super().get_queryset(*args, **kwargs)
@@ -135,29 +283,250 @@ class QQueryViewMixin:
         #
         try:
             if self.qfilter:
-                Q_query = eval_qquery(self.qfilter)
-
-                # check if there is a basic / non-customized select
-                if getattr(qs.model.objects, 'minimal', None):
-                    qquery_mgr = qs.model.objects.minimal()
+                self.start_qfilter_metrics(qs.db)
+                Q_query = self.qfilter_query = self.get_qfilter_query(qs.model)
+                qquery_mgr = self.get_qfilter_manager(qs)
+
+                if self.qfilter_saved is not None:
+                    # materialized results, joined by primary key
+                    Q_filter, needs_distinct = Q(pk__in=self.qfilter_saved.get_result_ids()), False
+                elif self.qfilter_exists_to_many:
+                    Q_filter, needs_distinct = compile_exists(qs.model, Q_query)
                 else:
-                    qquery_mgr = qs.model.objects
+                    Q_filter, needs_distinct = Q_query, True
 
-                qquery_qs = qquery_mgr.filter(Q_query).distinct()
+                qquery_qs = qquery_mgr.filter(Q_filter)
+                if needs_distinct:
+                    qquery_qs = qquery_qs.distinct()
 
                 # annotate q query filter fields and values
-                self.qfilter_qs = self.annotate_qfilter_value(qquery_qs, Q_query, stringify=True)
+                qfilter_qs = self.annotate_qfilter_value(qquery_qs, Q_query, stringify=True)
+                with self.qfilter_phase('cost'):
+                    self.check_qfilter_cost(qfilter_qs)
+                self.qfilter_qs = qfilter_qs
 
-                # merge-ing can be time consuming
-                if self.qfilter_options['merged']:
+                # merge-ing is streamed while rendering
+                if self.qfilter_options.merged:
                     LOGGER.debug('merge queryset')
-                    self.qfilter_qs.merged = utils.merge('id', self.qfilter_qs.qfilter_fields, self.qfilter_qs.values())
+                    merged = self.qfilter_saved.get_merged() if self.qfilter_saved is not None else None
+                    if merged is None:
+                        python_merged = utils.MergedValues(self.qfilter_qs, 'id', self.qfilter_qs.qfilter_fields,
+                                                           columns=self.qfilter_qs.qfilter_columns)
+                        if self.qfilter_merge_in_database:
+                            merged = utils.aggregate_merged(qquery_mgr.filter(Q_filter), 'id', self.qfilter_qs.qfilter_field_map,
+                                                            fallback=python_merged)
+                        if merged is None:
+                            merged = python_merged
+                    if self.qfilter_metrics is not None:
+                        merged = instrumentation.TimedMerged(merged, self.qfilter_metrics)
+                    self.qfilter_qs.merged = merged
+
+                if self.qfilter_replace_queryset:
+                    qs = self.qfilter_qs
 
         except Exception as exc:  # pylint: disable=broad-except
             LOGGER.exception(exc)
+            self.qfilter_error = exc
             messages.error(self.request, 'Failed to apply Q Filter: {} Filter: {}'.format(exc, self.qfilter))
         return qs
 
+    def get_qfilter_query(self, model):
+        """
+        parse and optimize the qfilter to a Q query
+        """
+        # pylint: disable=invalid-name
+        with self.qfilter_phase('parse'):
+            Q_query = eval_qquery(self.qfilter)
+        if self.qfilter_optimize:
+            with self.qfilter_phase('optimize'):
+                Q_query = optimize_q(Q_query, model)
+        return Q_query
+
+    def get_qfilter_manager(self, qs):
+        """
+        get the manager or queryset the qfilter is applied to
+        """
+        # check if there is a basic / non-customized select
+        if self.qfilter_replace_queryset:
+            return qs
+        if getattr(qs.model.objects, 'minimal', None):
+            return qs.model.objects.minimal()
+        return qs.model.objects
+
+    def get_qfilter_count(self, estimate=False):
+        """
+        count the objects matching the qfilter without annotations,
+        to-many lookups are rewritten as EXISTS if possible, otherwise COUNT(DISTINCT id) is used
+
+        with estimate the row estimate of the planner (EXPLAIN) is used if it
+        is at least qfilter_count_estimate_min, only supported on PostgreSQL.
+
+        :return: (count, estimated)
+        """
+        # pylint: disable=invalid-name
+        qs = super().get_queryset()
+        Q_query = self.qfilter_query = self.get_qfilter_query(qs.model)
+        Q_filter, needs_distinct = compile_exists(qs.model, Q_query)
+        count_qs = self.get_qfilter_manager(qs).filter(Q_filter).order_by()
+
+        with guard.statement_timeout(count_qs.db, self.qfilter_statement_timeout):
+            if estimate:
+                cost = guard.explain_cost(count_qs)
+                if cost is not None and cost.rows is not None and cost.rows >= self.qfilter_count_estimate_min:
+                    return int(cost.rows), True
+            if needs_distinct:
+                return count_qs.aggregate(count=Count('pk', distinct=True))['count'], False
+            return count_qs.count(), False
+
+    def render_qfilter_count(self, mode):
+        """
+        respond with the number of objects matching the qfilter as json,
+        ex. for live counts while editing the filter
+
+        :param mode: exact or estimate
+        """
+        if mode not in ('exact', 'estimate'):
+            return JsonResponse({'error': 'unknown count mode', 'modes': ['estimate', 'exact']}, status=400)
+        if not self.qfilter:
+            return JsonResponse({'qfilter': self.qfilter, 'error': 'empty query'}, status=400)
+        try:
+            count, estimated = self.get_qfilter_count(estimate=mode == 'estimate')
+        except QQuerySyntaxError as exc:
+            return JsonResponse({'qfilter': self.qfilter, 'error': exc.message, 'position': exc.position}, status=400)
+        except (FieldError, ValueError, ValidationError) as exc:
+            return JsonResponse({'qfilter': self.qfilter, 'error': str(exc)}, status=400)
+        except DatabaseError as exc:
+            LOGGER.warning('Q Filter count failed: %s Filter: %s', exc, self.qfilter)
+            return JsonResponse({'qfilter': self.qfilter, 'error': str(exc)}, status=503)
+        return JsonResponse({'qfilter': self.qfilter, 'count': count, 'estimated': estimated})
+
+    def start_qfilter_metrics(self, using):
+        """
+        start collecting the metrics of the qfilter request
+        """
+        if not self.qfilter_instrument or self.qfilter_metrics is not None:
+            return
+        self.qfilter_metrics = instrumentation.QFilterMetrics(self.qfilter, connections[using])
+        self.qfilter_metrics.start()
+
+    def qfilter_phase(self, name):
+        """
+        context manager to time a phase of the qfilter request
+        """
+        if self.qfilter_metrics is None:
+            return _no_phase()
+        return self.qfilter_metrics.phase(name)
+
+    def finish_qfilter_metrics(self, qfilter_qs=None):
+        """
+        stop collecting metrics, send the qfilter_finished signal
+        and report the metrics to qfilter_metrics_adapter
+        """
+        metrics = self.qfilter_metrics
+        if metrics is None or not metrics.finish():
+            return
+        result_cache = getattr(qfilter_qs, '_result_cache', None)
+        if result_cache is not None:
+            metrics.rows += len(result_cache)
+
+        LOGGER.debug('qfilter metrics: %s', metrics.as_dict())
+        instrumentation.qfilter_finished.send(sender=self.__class__, view=self, metrics=metrics)
+        if self.qfilter_metrics_adapter is not None:
+            try:
+                self.qfilter_metrics_adapter.report(metrics)
+            except Exception as exc:  # pylint: disable=broad-except
+                LOGGER.warning('failed to report qfilter metrics: %s', exc)
+
+    def _instrument_response(self, response, context):
+        """
+        time the rendering of the response and finish the metrics afterwards
+        """
+        render = response.render
+
+        def timed_render():
+            if response.is_rendered:
+                return render()
+            try:
+                with self.qfilter_phase('render'):
+                    return render()
+            finally:
+                self.finish_qfilter_metrics(context.get('qfilter_qs'))
+
+        response.render = timed_render
+        return response
+
+    def check_qfilter_cost(self, queryset):
+        """
+        estimate the cost of the qfilter queryset with EXPLAIN if limits are configured
+        and reject, warn or downgrade expensive filters according to qfilter_cost_action:
+
+        - reject: raise QueryCostExceeded, the filter is not applied
+        - warn: show a warning
+        - downgrade: show a warning, disable merged and force pagination
+        """
+        limits = (self.qfilter_max_cost, self.qfilter_max_rows, self.qfilter_max_scans)
+        if all(limit is None for limit in limits):
+            return
+
+        cost = guard.explain_cost(queryset)
+        if cost is None or not guard.exceeds(cost, *limits):
+            return
+
+        exc = guard.QueryCostExceeded(cost)
+        if self.qfilter_cost_action == 'reject':
+            raise exc
+
+        LOGGER.warning('%s Filter: %s', exc, self.qfilter)
+        messages.warning(self.request, 'Q Filter is expensive: {}'.format(exc))
+        if self.qfilter_cost_action == 'downgrade':
+            self.qfilter_options = self.qfilter_options._replace(merged=False)
+            self.paginate_by = self.paginate_by or self.qfilter_downgrade_paginate_by
+
+    def qfilter_timeout(self):
+        """
+        context manager which limits the qfilter queries to qfilter_statement_timeout
+        """
+        qfilter_qs = getattr(self, 'qfilter_qs', None)
+        if self.qfilter_statement_timeout is None or qfilter_qs is None:
+            return _no_phase()
+        return guard.statement_timeout(qfilter_qs.db, self.qfilter_statement_timeout)
+
+    def _qfilter_timed_out(self, exc, qfilter_qs):
+        """
+        report the exceeded statement timeout and get an empty qfilter queryset instead
+        """
+        LOGGER.warning('Q Filter timed out: %s Filter: %s', exc, self.qfilter)
+        messages.error(self.request, 'Q Filter took too long: {} Filter: {}'.format(exc, self.qfilter))
+        empty = qfilter_qs.none()
+        self._copy_qfilter_attributes(qfilter_qs, empty)
+        if hasattr(qfilter_qs, 'merged'):
+            empty.merged = qfilter_qs.merged.for_keys([])
+        return empty
+
+    def render_to_response(self, context, **response_kwargs):
+        """
+        render the response within the statement timeout, the qfilter querysets
+        are evaluated while rendering. if the timeout is exceeded the response
+        is rendered again without qfilter results.
+        """
+        response = super().render_to_response(context, **response_kwargs)
+        if self.qfilter_metrics is not None and hasattr(response, 'rendering_attrs'):
+            response = self._instrument_response(response, context)
+        if self.qfilter_statement_timeout is None or 'qfilter_qs' not in context:
+            return response
+
+        try:
+            with self.qfilter_timeout():
+                response.render()
+        except DatabaseError as exc:
+            qfilter_qs = self._qfilter_timed_out(exc, context['qfilter_qs'])
+            context['qfilter_qs'] = qfilter_qs
+            context[self.context_object_name] = qfilter_qs
+            response = super().render_to_response(context, **response_kwargs)
+            if self.qfilter_metrics is not None:
+                response = self._instrument_response(response, context)
+        return response
+
     def get_qfilter_wizard(self, context):
         """
         get and initialize qfilter wizard formset for filtering
@@ -173,9 +542,18 @@ class QQueryViewMixin:
         # init qfilter wizard
         context['qquery_filter_formset'] = formset
 
-        field_choices = [(v[0], utils.get_short_field_name(v[2]),) for v in self.get_filter_fields()]
+        catalog = self.get_filter_field_catalog()
+        if self.qfilter_lazy_field_choices:
+            # only the selected fields are rendered, the front end loads the choices
+            # from qquery_filter_fields_url, see render_qfilter_fields
+            field_choices = []
+            context['qquery_filter_fields_url'] = self.get_qfilter_fields_url()
+        else:
+            field_choices = [(ff.path, catalog.short_name(ff.path),) for ff in self.get_filter_fields()]
+        context['qquery_filter_autocomplete_url'] = '{}?{}='.format(self.request.path, self.qfilter_autocomplete_kwarg)
         for form in context['qquery_filter_formset'].forms:
-            form.fields['field'].choices = field_choices
+            selected = form['field'].value() if self.qfilter_lazy_field_choices else None
+            form.fields['field'].choices = [(selected, catalog.short_name(selected))] if selected else field_choices
             form.fields['combinator'].initial = 'AND'
         context['qquery_filter_formset_helper'] = QueryFilterWizardFormSetHelper()
         context['qquery_filter_formset_empty_form'] = context['qquery_filter_formset'].empty_form
@@ -183,9 +561,70 @@ class QQueryViewMixin:
 
         return context
 
+    def get_qfilter_fields_url(self):
+        """
+        get the url of the filter fields json, versioned so it can be cached by the browser
+        """
+        return '{}?{}=json&v={}'.format(self.request.path, self.qfilter_fields_kwarg,
+                                        self.get_filter_field_catalog().version)
+
+    def render_qfilter_fields(self):
+        """
+        respond with the filter fields as json for the wizard choices and the field table,
+        the json is built once per catalog and answered with 304 if the ETag matches
+        """
+        catalog = self.get_filter_field_catalog()
+        etag = '"{}"'.format(catalog.version)
+        if etag in parse_etags(self.request.META.get('HTTP_IF_NONE_MATCH', '')):
+            response = HttpResponseNotModified()
+        else:
+            response = HttpResponse(catalog.as_json(), content_type='application/json')
+        response['ETag'] = etag
+        patch_cache_control(response, private=True, max_age=self.qfilter_fields_max_age)
+        return response
+
+    def render_qfilter_autocomplete(self, path):
+        """
+        respond with the distinct values of a filter field starting with the
+        q parameter as json, the values are taken from the objects of get_queryset
+        and cached per query
+        """
+        catalog = self.get_filter_field_catalog()
+        filter_field = catalog.get(path) if path in catalog else None
+        if filter_field is None or filter_field.internal_type not in self.qfilter_autocomplete_field_types:
+            return JsonResponse({'field': path, 'error': 'field can not be autocompleted'}, status=400)
+
+        # istartswith is case insensitive, share the cache for all cases
+        prefix = self.request.GET.get('q', '').lower()
+        queryset = self.get_queryset()
+        models = get_involved_models(queryset.model, Q(**{path: None}))
+        queryset = utils.get_prefix_values(queryset, path, prefix, self.qfilter_autocomplete_limit)
+        values = get_cached_values(queryset, models,
+                                   timeout=self.qfilter_autocomplete_timeout,
+                                   alias=self.qfilter_cache_alias)
+        return JsonResponse({'field': path, 'prefix': prefix, 'values': values})
+
     def get_context_data(self, **kwargs):  # pylint: disable=arguments-differ
         """
         enrich context with qquery informations
+
+        the pagination queries run within the statement timeout, if the timeout
+        is exceeded the context is built again without qfilter results.
+        """
+        try:
+            with self.qfilter_timeout():
+                return self.get_qfilter_context_data(**kwargs)
+        except DatabaseError as exc:
+            if getattr(self, 'qfilter_qs', None) is None:
+                raise
+            self.qfilter_qs = self._qfilter_timed_out(exc, self.qfilter_qs)
+            if self.qfilter_replace_queryset:
+                self.object_list = self.qfilter_qs
+            return self.get_qfilter_context_data(**kwargs)
+
+    def get_qfilter_context_data(self, **kwargs):
+        """
+        build the context with the qfilter results, see get_context_data
         """
         context = super().get_context_data(**kwargs)    # pylint: disable=bad-super-call
         context['qfilter'] = self.qfilter
@@ -198,13 +637,92 @@ class QQueryViewMixin:
         # init query filter wizard
         self.get_qfilter_wizard(context)
 
+        # object list is already the filter queryset, paginated by the parent view
+        if hasattr(self, 'qfilter_qs') and self.qfilter_replace_queryset:
+            qfilter_qs = context['object_list']
+            if qfilter_qs is not self.qfilter_qs:
+                self._copy_qfilter_attributes(self.qfilter_qs, qfilter_qs)
+                if hasattr(self.qfilter_qs, 'merged'):
+                    qfilter_qs.merged = self.qfilter_qs.merged.for_keys({obj.id for obj in qfilter_qs})
+            context['qfilter_qs'] = qfilter_qs
+
         # override queryset with filter queryset
-        if hasattr(self, 'qfilter_qs'):
-            context[self.context_object_name] = self.qfilter_qs
-            context['qfilter_qs'] = self.qfilter_qs
+        elif hasattr(self, 'qfilter_qs'):
+            qfilter_qs = self.qfilter_qs
+            page_size = self.get_paginate_by(qfilter_qs)
+            if page_size:
+                context.update(self.paginate_qfilter_queryset(qfilter_qs, page_size))
+                qfilter_qs = context['qfilter_qs']
+            context[self.context_object_name] = qfilter_qs
+            context['qfilter_qs'] = qfilter_qs
 
         return context
 
+    def get_qfilter_keys(self, queryset):
+        """
+        get the ordered ids of the qfilter queryset to paginate,
+        from the result cache if qfilter_cache is enabled
+        """
+        if not self.qfilter_cache:
+            return utils.get_page_keys(queryset, 'id')
+        models = get_involved_models(queryset.model, self.qfilter_query)
+        return get_cached_keys(queryset, 'id', models,
+                               timeout=self.qfilter_cache_timeout,
+                               alias=self.qfilter_cache_alias)
+
+    @staticmethod
+    def _copy_qfilter_attributes(source, target):
+        """
+        querysets lose the qfilter attributes when cloned, ex. by filter() or slicing
+        """
+        target.qfilter_fields = source.qfilter_fields
+        target.qfilter_field_map = source.qfilter_field_map
+        target.qfilter_columns = source.qfilter_columns
+
+    def paginate_qfilter_queryset(self, queryset, page_size):
+        """
+        paginate the qfilter queryset by objects instead of joined rows,
+        the joined and merged representation contain the same objects.
+
+        - offset pagination with the qfilter-page parameter
+        - keyset pagination on id with the qfilter-after parameter, which
+          avoids large offsets on big result sets
+
+        :return: context with the paginated qfilter_qs
+        """
+        keys = self.get_qfilter_keys(queryset)
+        after = self.request.GET.get(self.qfilter_after_kwarg)
+        if after:
+            try:
+                after = queryset.model._meta.pk.to_python(after)
+                page_keys = utils.get_keyset_page_keys(keys, 'id', after, page_size)
+            except (ValueError, ValidationError):
+                LOGGER.warning('invalid %s: %s', self.qfilter_after_kwarg, after)
+                page_keys = utils.get_keyset_page_keys(keys, 'id', None, page_size)
+            context = {
+                'qfilter_paginator': None,
+                'qfilter_page_obj': None,
+                'qfilter_is_paginated': True,
+                'qfilter_next_after': page_keys[-1] if len(page_keys) == page_size else None,
+            }
+        else:
+            paginator = Paginator(keys, page_size)
+            page = paginator.get_page(self.request.GET.get(self.qfilter_page_kwarg))
+            page_keys = list(page.object_list)
+            context = {
+                'qfilter_paginator': paginator,
+                'qfilter_page_obj': page,
+                'qfilter_is_paginated': page.has_other_pages(),
+                'qfilter_next_after': page_keys[-1] if page.has_next() else None,
+            }
+
+        page_qs = queryset.filter(id__in=page_keys).order_by('id')
+        self._copy_qfilter_attributes(queryset, page_qs)
+        if hasattr(queryset, 'merged'):
+            page_qs.merged = queryset.merged.for_keys(page_keys)
+        context['qfilter_qs'] = page_qs
+        return context
+
     def _compile_query_from_wizard(self):
         total_forms = int(self.request.POST.get('form-TOTAL_FORMS'))
         form_counter = 0
@@ -239,17 +757,104 @@ class QQueryViewMixin:
             form_counter += 1
         return qfilter
 
+    def render_qfilter_export(self, export_format):
+        """
+        stream the qfilter results (joined or merged) as csv or json lines,
+        the base queryset is exported if there is no qfilter. a qfilter which
+        could not be applied is answered with 400, not with the base queryset.
+        """
+        if export_format not in export.EXPORT_FORMATS:
+            return JsonResponse({'error': 'unknown export format', 'formats': sorted(export.EXPORT_FORMATS)}, status=400)
+        generator, content_type, extension = export.EXPORT_FORMATS[export_format]
+
+        self.object_list = self.get_queryset()
+        queryset = getattr(self, 'qfilter_qs', None)
+        if self.qfilter and queryset is None:
+            self.finish_qfilter_metrics()
+            return JsonResponse({'qfilter': self.qfilter, 'error': str(self.qfilter_error)}, status=400)
+        if queryset is None:
+            columns = [field.attname for field in self.object_list.model._meta.concrete_fields]
+            rows = export.iter_rows(self.object_list, columns, self.qfilter_export_chunk_size)
+        elif hasattr(queryset, 'merged'):
+            columns = ['id'] + [column for column in queryset.qfilter_columns if column != 'id']
+            rows = export.iter_merged_rows(queryset.merged, columns)
+        else:
+            columns = queryset.qfilter_columns
+            rows = export.iter_rows(queryset, columns, self.qfilter_export_chunk_size)
+
+        # merged rows are counted by instrumentation.TimedMerged
+        if self.qfilter_metrics is not None and not isinstance(getattr(queryset, 'merged', None),
+                                                               instrumentation.TimedMerged):
+            rows = self._count_rows(rows)
+        rows = self._within_timeout(rows)
+        content = self._finish_after(generator(columns, rows, self.qfilter_export_list_separator))
+        response = StreamingHttpResponse(_ClosingStream(content, self.finish_qfilter_metrics), content_type=content_type)
+        response['Content-Disposition'] = 'attachment; filename="{}.{}"'.format(
+            self.object_list.model._meta.model_name, extension)
+        return response
+
+    def _within_timeout(self, rows):
+        """
+        stream the rows within the statement timeout
+        """
+        with self.qfilter_timeout():
+            yield from rows
+
+    def _count_rows(self, rows):
+        for row in rows:
+            self.qfilter_metrics.rows += 1
+            yield row
+
+    def _finish_after(self, iterable):
+        """
+        finish the metrics after the streamed response is sent, a response
+        which is closed before it is sent is finished by _ClosingStream
+        """
+        try:
+            with self.qfilter_phase('render'):
+                yield from iterable
+        finally:
+            self.finish_qfilter_metrics()
+
+    def get_saved_qfilter(self, name):
+        """
+        get the saved qfilter of the view's model, raises Http404 if it does not
+        exist. the models are imported here, qfilter.mixins can be imported
+        before the app registry is ready.
+        """
+        from .models import SavedQFilter  # pylint: disable=import-outside-toplevel
+        return get_object_or_404(SavedQFilter, name=name, model__iexact=self.model._meta.label,
+                                 refreshed__isnull=False)
+
+    def get_qfilter_options(self, data):
+        """
+        parse the per request qfilter options from GET or POST parameters
+        """
+        # pylint: disable=no-self-use
+        return QFilterOptions(merged=bool(data.get('qfilter-merged', None)))
+
     def get(self, request, *args, **kwargs):
         """
         get qfilter from get parameters
         """
         if self.request.method == 'GET':
+            if self.request.GET.get(self.qfilter_fields_kwarg):
+                return self.render_qfilter_fields()
+            if self.request.GET.get(self.qfilter_autocomplete_kwarg):
+                return self.render_qfilter_autocomplete(self.request.GET[self.qfilter_autocomplete_kwarg])
             self.qfilter = self.request.GET.get('qfilter', None)
-            if self.request.GET.get('qfilter-merged', None):
-                self.qfilter_options['merged'] = True
-            else:
-                self.qfilter_options['merged'] = False
-        return super().get(request, *args, **kwargs)
+            self.qfilter_options = self.get_qfilter_options(self.request.GET)
+            saved_name = self.request.GET.get(self.qfilter_saved_kwarg)
+            if saved_name:
+                self.qfilter_saved = self.get_saved_qfilter(saved_name)
+                self.qfilter = self.qfilter_saved.qfilter
+            count_mode = self.request.GET.get(self.qfilter_count_kwarg)
+            if count_mode:
+                return self._finish_on_error(self.render_qfilter_count, count_mode)
+            export_format = self.request.GET.get(self.qfilter_export_kwarg)
+            if export_format:
+                return self._finish_on_error(self.render_qfilter_export, export_format)
+        return self._finish_on_error(super().get, request, *args, **kwargs)
 
     def post(self, request, *args, **kwargs):
         """
@@ -257,8 +862,18 @@ class QQueryViewMixin:
         """
         if self.request.POST.get('qfilter-wizard'):
             self.qfilter = self._compile_query_from_wizard()
-            if self.request.POST.get('qfilter-merged', None):
-                self.qfilter_options['merged'] = True
-            else:
-                self.qfilter_options['merged'] = False
-        return super().get(request, *args, **kwargs)
+            self.qfilter_options = self.get_qfilter_options(self.request.POST)
+            count_mode = self.request.POST.get(self.qfilter_count_kwarg)
+            if count_mode:
+                return self._finish_on_error(self.render_qfilter_count, count_mode)
+        return self._finish_on_error(super().get, request, *args, **kwargs)
+
+    def _finish_on_error(self, handler, *args, **kwargs):
+        """
+        finish the metrics if the handler fails before the response is rendered
+        """
+        try:
+            return handler(*args, **kwargs)
+        except BaseException:
+            self.finish_qfilter_metrics()
+            raise
@@ -0,0 +1,301 @@
+"""
+Saved qfilters
+
+named qfilters of a model with materialized results: the matching primary
+keys (and optionally the merged values) are stored in SavedQFilterResult
+and refreshed incrementally by the qfilter_refresh management command.
+changes of the models a saved qfilter depends on mark it as stale.
+"""
+
+__all__ = (
+    'SavedQFilter',
+    'SavedQFilterResult',
+    'MaterializedMergedValues',
+)
+
+# pylint: disable=protected-access,unused-argument
+
+import json
+import logging
+import time
+from datetime import timedelta
+
+from django.apps import apps
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import DatabaseError, models, transaction
+from django.db.models import F
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from . import utils
+from .catalog import get_field_catalog
+from .compiler import compile_exists, get_involved_models
+from .optimizer import EMPTY, optimize_q
+
+LOGGER = logging.getLogger(__name__)
+
+BATCH_SIZE = 1000
+
+
+class SavedQFilter(models.Model):
+    """
+    named qfilter of a model with materialized results
+    """
+    name = models.SlugField(max_length=100, unique=True)
+    model = models.CharField(max_length=100, help_text='model label, ex. food.Recipe')
+    qfilter = models.TextField(validators=[utils.qquery_validator])
+    merged = models.BooleanField(default=False, help_text='materialize the merged values')
+    refresh_interval = models.PositiveIntegerField(null=True, blank=True,
+                                                   help_text='refresh every n seconds, only if stale if empty')
+    stale = models.BooleanField(default=True, editable=False)
+    # labels of the models the qfilter depends on, ex. ",food.recipe,food.ingredient,"
+    involved_models = models.TextField(default='', editable=False)
+    refreshed = models.DateTimeField(null=True, blank=True, editable=False)
+    created = models.DateTimeField(auto_now_add=True)
+    updated = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = 'saved qfilter'
+
+    # fields which change the results, editing them marks the saved qfilter as stale
+    DEFINITION_FIELDS = ('model', 'qfilter', 'merged')
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._definition = self._get_definition()
+
+    def __str__(self):
+        return self.name
+
+    def _get_definition(self):
+        # deferred fields are not loaded
+        return {name: self.__dict__[name] for name in self.DEFINITION_FIELDS if name in self.__dict__}
+
+    def save(self, *args, **kwargs):  # pylint: disable=arguments-differ
+        """
+        mark the saved qfilter as stale if its definition changed
+        """
+        update_fields = kwargs.get('update_fields')
+        definition = self._get_definition()
+        if any(definition[name] != value for name, value in self._definition.items() if name in definition):
+            self.stale = True
+            if update_fields is not None:
+                kwargs['update_fields'] = set(update_fields) | {'stale'}
+        super().save(*args, **kwargs)
+        self._definition = definition
+
+    def get_model(self):
+        return apps.get_model(self.model)
+
+    def get_qquery(self):
+        """
+        get the parsed and optimized Q query
+        """
+        model = self.get_model()
+        return optimize_q(utils.eval_qquery(self.qfilter), model)
+
+    def is_due(self, now=None):
+        """
+        check if the results have to be refreshed
+        """
+        if self.stale or self.refreshed is None:
+            return True
+        if self.refresh_interval is None:
+            return False
+        now = now or timezone.now()
+        return self.refreshed + timedelta(seconds=self.refresh_interval) <= now
+
+    def _get_payloads(self, model, qquery):
+        """
+        merged values of the matching objects as json, annotated like QQueryViewMixin
+        """
+        queryset = model._default_manager.filter(qquery).distinct()
+        catalog = get_field_catalog(model)
+        annotations = {}
+        for lookup, resolved in utils.resolve_q_lookups(queryset.query, qquery).items():
+            if lookup != EMPTY[0]:
+                annotations.setdefault(catalog.short_name(resolved.path), resolved.path)
+        queryset = queryset.annotate(**{name: F(path) for name, path in annotations.items()})
+        columns = [field.attname for field in model._meta.concrete_fields] + list(annotations)
+        merged = utils.MergedValues(queryset, model._meta.pk.attname, list(annotations), columns=columns)
+        return {key: json.dumps(record, cls=DjangoJSONEncoder) for key, record in merged.items()}
+
+    def refresh(self):
+        """
+        evaluate the qfilter and update the materialized results incrementally,
+        only added, removed and changed objects are written.
+
+        stale is cleared before the qfilter is evaluated, so changes of the involved
+        models while refreshing mark the saved qfilter as stale again.
+
+        :return: (added, removed, updated)
+        """
+        model = self.get_model()
+        qquery = self.get_qquery()
+        labels = sorted(m._meta.label_lower for m in get_involved_models(model, qquery))
+        self.involved_models = ',{},'.format(','.join(labels))
+        self.stale = False
+        SavedQFilter.objects.filter(pk=self.pk).update(involved_models=self.involved_models, stale=False)
+
+        try:
+            qfilter, _ = compile_exists(model, qquery)
+            ids = set(utils.get_page_keys(model._default_manager.filter(qfilter), 'pk'))
+            payloads = self._get_payloads(model, qquery) if self.merged else {}
+
+            with transaction.atomic():
+                existing = dict(self.results.values_list('object_id', 'payload'))
+                removed = [object_id for object_id in existing if object_id not in ids]
+                added = [object_id for object_id in ids if object_id not in existing]
+                updated = [object_id for object_id in ids
+                           if object_id in existing and existing[object_id] != payloads.get(object_id)]
+
+                for start in range(0, len(removed), BATCH_SIZE):
+                    self.results.filter(object_id__in=removed[start:start + BATCH_SIZE]).delete()
+                SavedQFilterResult.objects.bulk_create(
+                    [SavedQFilterResult(saved_filter=self, object_id=object_id, payload=payloads.get(object_id))
+                     for object_id in added], batch_size=BATCH_SIZE)
+                SavedQFilterResult.objects.bulk_update(
+                    [SavedQFilterResult(id=result_id, payload=payloads.get(object_id))
+                     for result_id, object_id in
+                     self.results.filter(object_id__in=updated).values_list('id', 'object_id')],
+                    ['payload'], batch_size=BATCH_SIZE)
+
+                self.refreshed = timezone.now()
+                SavedQFilter.objects.filter(pk=self.pk).update(refreshed=self.refreshed)
+        except BaseException:
+            SavedQFilter.objects.filter(pk=self.pk).update(stale=True)
+            self.stale = True
+            raise
+
+        self.refresh_from_db(fields=['stale'])
+        _TRACKED_LABELS.update(labels)
+        LOGGER.info('refreshed saved qfilter %s: %s added, %s removed, %s updated',
+                    self.name, len(added), len(removed), len(updated))
+        return len(added), len(removed), len(updated)
+
+    def get_result_ids(self):
+        """
+        queryset of the materialized primary keys, ex. for pk__in
+        """
+        return self.results.values('object_id')
+
+    def get_merged(self):
+        """
+        materialized merged values, None if the merged values are not materialized
+        """
+        if not self.merged:
+            return None
+        return MaterializedMergedValues(self.results.all())
+
+
+class SavedQFilterResult(models.Model):
+    """
+    materialized result of a saved qfilter: primary key and merged values (json)
+    of a matching object, only integer primary keys are supported
+    """
+    saved_filter = models.ForeignKey(SavedQFilter, on_delete=models.CASCADE, related_name='results')
+    object_id = models.BigIntegerField()
+    payload = models.TextField(null=True, blank=True)
+
+    class Meta:
+        unique_together = (('saved_filter', 'object_id'),)
+
+    def __str__(self):
+        return '{}: {}'.format(self.saved_filter_id, self.object_id)
+
+
+class MaterializedMergedValues:
+    """
+    merged values read from the materialized results, same interface as utils.MergedValues
+    """
+
+    def __init__(self, results):
+        self.results = results
+
+    def items(self):
+        values = self.results.order_by('object_id').values_list('object_id', 'payload').iterator()
+        for object_id, payload in values:
+            yield object_id, json.loads(payload) if payload else {}
+
+    def values(self):
+        return (record for _, record in self.items())
+
+    def for_keys(self, keys):
+        return type(self)(self.results.filter(object_id__in=list(keys)))
+
+
+# labels of the models saved qfilters depend on. updated when saved qfilters are refreshed
+# in this process and reloaded every _TRACKED_LABELS_TIMEOUT seconds to see saved qfilters
+# refreshed by other processes
+_TRACKED_LABELS = set()
+_TRACKED_LABELS_TIMEOUT = 60
+_tracked_labels_loaded = [None]
+
+
+def _tracked_labels_expired():
+    loaded = _tracked_labels_loaded[0]
+    return loaded is None or time.monotonic() - loaded > _TRACKED_LABELS_TIMEOUT
+
+
+def _load_tracked_labels():
+    """
+    load the labels of the involved models of all saved qfilters, runs outside of
+    a transaction (on commit), a missing table does not break the caller's transaction
+    """
+    try:
+        labels = set()
+        for involved in SavedQFilter.objects.values_list('involved_models', flat=True):
+            labels.update(filter(None, involved.split(',')))
+    except DatabaseError as exc:
+        # ex. not migrated yet, retried after the timeout
+        LOGGER.debug('failed to load saved qfilter models: %s', exc)
+        labels = set()
+    _TRACKED_LABELS.clear()
+    _TRACKED_LABELS.update(labels)
+    _tracked_labels_loaded[0] = time.monotonic()
+
+
+def mark_stale(model):
+    """
+    mark the saved qfilters depending on the model as stale
+    """
+    if _tracked_labels_expired():
+        _load_tracked_labels()
+    label = model._meta.label_lower
+    if label not in _TRACKED_LABELS:
+        return
+    SavedQFilter.objects.filter(involved_models__contains=',{},'.format(label), stale=False).update(stale=True)
+
+
+def _mark_stale_on_commit(models, using):
+    """
+    mark the saved qfilters as stale after the change is committed, only for
+    models saved qfilters may depend on
+    """
+    expired = _tracked_labels_expired()
+    models = [model for model in models
+              if model._meta.app_label != SavedQFilter._meta.app_label and model._meta.apps is apps
+              and (expired or model._meta.label_lower in _TRACKED_LABELS)]
+    if not models:
+        # qfilter's own models, historical models of migrations and untracked models
+        return
+
+    def stale():
+        for model in models:
+            mark_stale(model)
+
+    transaction.on_commit(stale, using=using)
+
+
+@receiver(post_save)
+@receiver(post_delete)
+def _stale_on_change(sender, using=None, **kwargs):
+    _mark_stale_on_commit((sender,), using)
+
+
+@receiver(m2m_changed)
+def _stale_on_m2m_change(sender, instance, action, model, using=None, **kwargs):
+    if not action.startswith('post_'):
+        return
+    _mark_stale_on_commit({sender, type(instance), model}, using)
@@ -0,0 +1,231 @@
+"""
+Q tree optimizer
+
+normalizes a Q query before it is executed:
+- nested nodes with the same connector and single child nodes are flattened
+- OR-ed exact lookups on the same field are merged into one __in lookup
+- duplicate clauses are removed
+- AND-ed clauses which can never match (a=1 & a=2, a=1 & ~a=1) make the node empty,
+  empty clauses are dropped from OR nodes and their negation from AND nodes.
+  exact values are only compared on fields of the model or its to-one relations
+  (a to-many relation can match a=1 and a=2 on different related rows), after
+  they are converted to the field type. nodes under a negation are not pruned.
+- children are sorted, so equivalent queries compile to the same SQL
+"""
+
+__all__ = (
+    'EMPTY',
+    'optimize_q',
+)
+
+# pylint: disable=protected-access
+
+from django.core.exceptions import FieldDoesNotExist, ValidationError
+from django.db.models import Q
+from django.db.models.constants import LOOKUP_SEP
+
+from .compiler import _resolve_lookup
+
+# leaf which matches nothing, django skips the query for an empty __in
+EMPTY = ('pk__in', ())
+
+# values which can be merged and compared
+_SCALARS = (str, int, float)
+
+
+def _value_key(value):
+    if isinstance(value, (list, tuple, set, frozenset)):
+        return tuple(_value_key(v) for v in value)
+    return (type(value).__name__, repr(value))
+
+
+def _key(child):
+    """
+    hashable and sortable key of a Q child, leaves are sorted before nodes
+    """
+    if isinstance(child, Q):
+        return (1, child.connector, child.negated, tuple(_key(c) for c in child.children))
+    return (0, child[0], _value_key(child[1]))
+
+
+# key of ~EMPTY, which matches everything
+_ALL_KEY = _key(~Q(EMPTY))
+
+
+def _is_scalar(value):
+    return isinstance(value, _SCALARS)
+
+
+def _exact_field(child, model):
+    """
+    get the field path of an exact lookup (ex. name, name__exact) or None
+    without a model only explicit __exact and __in lookups are recognized
+    """
+    if isinstance(child, Q):
+        return None
+    lookup, value = child
+    if lookup.endswith(LOOKUP_SEP + 'exact'):
+        field = lookup[:-len(LOOKUP_SEP + 'exact')]
+    elif model is not None and len(_resolve_lookup(model, lookup)[0]) == len(lookup.split(LOOKUP_SEP)):
+        field = lookup
+    else:
+        return None
+    return field if _is_scalar(value) else None
+
+
+def _in_field(child):
+    """
+    get the field path of an __in lookup with scalar values or None
+    """
+    if isinstance(child, Q):
+        return None
+    lookup, value = child
+    if not lookup.endswith(LOOKUP_SEP + 'in') or not isinstance(value, (list, tuple)):
+        return None
+    if not all(_is_scalar(v) for v in value):
+        return None
+    return lookup[:-len(LOOKUP_SEP + 'in')]
+
+
+def _sorted_values(values):
+    return tuple(sorted(set(values), key=lambda v: (type(v).__name__, v)))
+
+
+def _merge_or(children, model):
+    """
+    merge the exact and __in lookups of an OR node by field
+    """
+    groups = {}
+    merged = []
+    for child in children:
+        field = _exact_field(child, model)
+        values = [child[1]] if field is not None else None
+        if field is None:
+            field = _in_field(child)
+            values = list(child[1]) if field is not None else None
+        if field is None:
+            merged.append(child)
+            continue
+        if field not in groups:
+            groups[field] = (len(merged), [], child)
+            merged.append(None)
+        groups[field][1].extend(values)
+
+    for field, (index, values, first) in groups.items():
+        values = _sorted_values(values)
+        if len(values) == 1 and _exact_field(first, model) is not None:
+            merged[index] = first
+        else:
+            merged[index] = (field + LOOKUP_SEP + 'in', values)
+    return merged
+
+
+def _normalize_text(value):
+    # some databases compare case insensitive and ignore trailing spaces
+    return value.casefold().rstrip() if isinstance(value, str) else value
+
+
+def _get_local_field(model, path):
+    """
+    get the model field of a path which does not traverse a to-many relation, or None
+    """
+    opts = model._meta
+    field = None
+    for part in path.split(LOOKUP_SEP):
+        if opts is None:
+            return None
+        try:
+            field = opts.pk if part == 'pk' else opts.get_field(part)
+        except FieldDoesNotExist:
+            return None
+        if field.many_to_many or field.one_to_many:
+            return None
+        opts = field.related_model._meta if field.is_relation and field.related_model else None
+    return field
+
+
+def _exact_value(child, model):
+    """
+    get (field path, value converted to the field type) of an exact lookup on a local field, or None
+    """
+    path = _exact_field(child, model) if model is not None else None
+    field = _get_local_field(model, path) if path is not None else None
+    if field is None:
+        return None
+    try:
+        return path, _normalize_text(field.to_python(child[1]))
+    except ValidationError:
+        return None
+
+
+def _is_contradiction(children, model):
+    """
+    check if AND-ed children can never match
+    """
+    exact = {}
+    keys = {_key(child) for child in children}
+    for child in children:
+        if child == EMPTY:
+            return True
+        if isinstance(child, Q) and child.negated and len(child.children) == 1:
+            inner = child.children[0]
+            if not isinstance(inner, Q) and _key(inner) in keys:
+                return True
+        field_value = _exact_value(child, model)
+        if field_value is None:
+            continue
+        field, value = field_value
+        if field in exact:
+            other = exact[field]
+            if type(other) is type(value) and other != value:
+                return True
+        else:
+            exact[field] = value
+    return False
+
+
+def _optimize(node, model, negated=False):
+    negated = negated or node.negated
+    children = []
+    for child in node.children:
+        if isinstance(child, Q):
+            child = _optimize(child, model, negated)
+            if not child.negated and (child.connector == node.connector or len(child.children) == 1):
+                children.extend(child.children)
+                continue
+        children.append(child)
+
+    if node.connector == Q.AND and len(children) > 1:
+        # ~EMPTY matches everything
+        children = [child for child in children if _key(child) != _ALL_KEY] or children
+
+    if node.connector == Q.OR:
+        children = _merge_or(children, model)
+        if len(children) > 1:
+            children = [child for child in children if child != EMPTY] or [EMPTY]
+
+    # remove duplicates, AND and OR are idempotent
+    children = list({_key(child): child for child in children}.values())
+
+    # under a negation the ORM matches to-many lookups with separate subqueries
+    if node.connector == Q.AND and not negated and _is_contradiction(children, model):
+        children = [EMPTY]
+
+    children.sort(key=_key)
+    return Q(*children, _connector=node.connector, _negated=node.negated)
+
+
+def optimize_q(qquery, model=None):
+    """
+    optimize a Q query, the given Q object is not modified
+
+    :param qquery: Q query
+    :param model:  django model, needed to merge lookups without explicit
+                   __exact (ex. Q(name="a") | Q(name="b") -> Q(name__in=["a", "b"]))
+                   and to remove contradicting exact lookups
+    :return: equivalent Q query
+    """
+    optimized = _optimize(qquery, model)
+    if not optimized.negated and len(optimized.children) == 1 and isinstance(optimized.children[0], Q):
+        optimized = optimized.children[0]
+    return optimized
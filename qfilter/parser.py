@@ -0,0 +1,258 @@
+"""
+Tokenizer and parser for Q Query strings
+
+turns a qfilter string like ``Q(name="curry") & ~Q(cook_time__gte=10)``
+into a django Q object in one linear pass, without ``eval()``.
+
+grammar (same precedence as python)::
+
+    expression := term ( '|' term )*
+    term       := factor ( '&' factor )*
+    factor     := '~' factor | '(' expression ')' | q
+    q          := 'Q' '(' field '=' value ')'
+    value      := string | 'True' | 'False' | integer
+"""
+
+__all__ = (
+    'QQuerySyntaxError',
+    'Token',
+    'tokenize',
+    'normalize_qquery',
+    'parse_qquery',
+)
+
+# pylint: disable=invalid-name,redefined-builtin
+
+import ast
+import functools
+import re
+import warnings
+from collections import namedtuple
+from functools import reduce
+
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+
+from qfilter import vars
+
+Token = namedtuple('Token', ('type', 'value', 'position'))
+
+# token types
+NAME = 'NAME'
+STRING = 'STRING'
+NUMBER = 'NUMBER'
+OP = 'OP'
+END = 'END'
+
+OPERATORS = '&|~()='
+
+_WHITESPACE = re.compile(r'\s+')
+_OPERATOR_WHITESPACE = re.compile(r'\s*([{}])\s*'.format(re.escape(OPERATORS)))
+_NAME = re.compile(r'\w+')
+_NUMBER = re.compile(r'\d+')
+_STRING = re.compile(r'"([^"]*)"')
+_STRING_CONTENT = re.compile(r'[{}]*'.format(vars.QQUERY_ALLOWED_FIELD_CHARS))
+
+_CONSTANTS = {'True': True, 'False': False}
+
+
+class QQuerySyntaxError(ValidationError):
+    """
+    raised if a qfilter string does not match the Q Query grammar
+
+    :param message:  human readable error
+    :param position: offset in the query string where the error was detected
+    """
+
+    def __init__(self, message, position):
+        super().__init__('{} at position {}'.format(message, position), code='invalid')
+        self.position = position
+        self.reason = message
+
+
+def tokenize(query):
+    """
+    split a qfilter string into tokens
+
+    whitespace between tokens is ignored, string values must be double
+    quoted and may only contain vars.QQUERY_ALLOWED_FIELD_CHARS
+    """
+    pos = 0
+    length = len(query)
+    while pos < length:
+        char = query[pos]
+
+        match = _WHITESPACE.match(query, pos)
+        if match:
+            pos = match.end()
+            continue
+
+        if char in OPERATORS:
+            yield Token(OP, char, pos)
+            pos += 1
+            continue
+
+        if char == '"':
+            match = _STRING.match(query, pos)
+            if not match:
+                raise QQuerySyntaxError('unterminated string', pos)
+            content = match.group(1)
+            valid = _STRING_CONTENT.match(content)
+            if valid.end() != len(content):
+                raise QQuerySyntaxError('invalid character {!r} in string'.format(content[valid.end()]),
+                                        pos + 1 + valid.end())
+            yield Token(STRING, content, pos)
+            pos = match.end()
+            continue
+
+        # numbers before names, \w also matches digits
+        match = _NUMBER.match(query, pos)
+        if match and not _NAME.match(query, match.end()):
+            yield Token(NUMBER, int(match.group()), pos)
+            pos = match.end()
+            continue
+
+        match = _NAME.match(query, pos)
+        if match:
+            yield Token(NAME, match.group(), pos)
+            pos = match.end()
+            continue
+
+        raise QQuerySyntaxError('unexpected character {!r}'.format(char), pos)
+
+    yield Token(END, None, length)
+
+
+def normalize_qquery(query):
+    """
+    strip insignificant whitespace outside of string values
+
+    equivalent filters like ``Q(a=1)&Q(b=2)`` and ``Q(a=1) & Q(b=2)``
+    result in the same normalized string
+    """
+    parts = query.strip().split('"')
+    parts[::2] = [_OPERATOR_WHITESPACE.sub(r'\1', part) for part in parts[::2]]
+    return '"'.join(parts)
+
+
+class _Parser:
+    """
+    recursive descent parser over the token stream
+    """
+
+    def __init__(self, query):
+        self.tokens = tokenize(query)
+        self.token = next(self.tokens)
+
+    def advance(self):
+        token = self.token
+        self.token = next(self.tokens)
+        return token
+
+    def expect(self, token_type, value=None):
+        token = self.token
+        if token.type != token_type or (value is not None and token.value != value):
+            expected = value if value is not None else token_type.lower()
+            raise QQuerySyntaxError('expected {!r}'.format(expected), token.position)
+        return self.advance()
+
+    def is_op(self, value):
+        return self.token.type == OP and self.token.value == value
+
+    def parse(self):
+        query, _ = self.expression()
+        if self.token.type != END:
+            raise QQuerySyntaxError('unexpected {!r}'.format(self.token.value), self.token.position)
+        return query
+
+    def expression(self):
+        """
+        returns the Q object and whether it was combined with an operator
+        """
+        operands = [self.term()]
+        while self.is_op('|'):
+            self.advance()
+            operands.append(self.term())
+        if len(operands) == 1:
+            return operands[0]
+        return reduce(lambda a, b: a | b, (q for q, _ in operands)), True
+
+    def term(self):
+        operands = [self.factor()]
+        while self.is_op('&'):
+            self.advance()
+            operands.append(self.factor())
+        if len(operands) == 1:
+            return operands[0]
+        return reduce(lambda a, b: a & b, (q for q, _ in operands)), True
+
+    def factor(self):
+        if self.is_op('~'):
+            self.advance()
+            query, _ = self.factor()
+            return ~query, False
+
+        if self.is_op('('):
+            position = self.advance().position
+            query, combined = self.expression()
+            # redundant parentheses around a single Q are rejected
+            if not combined:
+                raise QQuerySyntaxError('redundant parentheses', position)
+            self.expect(OP, ')')
+            return query, False
+
+        return self.q(), False
+
+    def q(self):
+        self.expect(NAME, 'Q')
+        self.expect(OP, '(')
+        field = self.expect(NAME).value
+        self.expect(OP, '=')
+        value = self.value()
+        self.expect(OP, ')')
+        return Q(**{field: value})
+
+    def value(self):
+        token = self.token
+        if token.type == STRING:
+            self.advance()
+            # keep python string literal semantics for escape sequences
+            if '\\' in token.value:
+                try:
+                    with warnings.catch_warnings():
+                        warnings.simplefilter('ignore')
+                        return ast.literal_eval('"{}"'.format(token.value))
+                except (SyntaxError, ValueError):
+                    raise QQuerySyntaxError('invalid escape sequence', token.position) from None
+            return token.value
+        if token.type == NUMBER:
+            self.advance()
+            return token.value
+        if token.type == NAME and token.value in _CONSTANTS:
+            self.advance()
+            return _CONSTANTS[token.value]
+        raise QQuerySyntaxError('expected value', token.position)
+
+
+@functools.lru_cache(maxsize=vars.QQUERY_PARSE_CACHE_SIZE)
+def _parse_normalized(query):
+    return _Parser(query).parse()
+
+
+def parse_qquery(query):
+    """
+    parse a qfilter string to a Q object
+
+    results are cached by the normalized query string, the returned Q object
+    is shared between callers and must not be modified in place.
+
+    :raises QQuerySyntaxError: if the query does not match the grammar
+    """
+    if not query or not query.strip():
+        raise QQuerySyntaxError('empty query', 0)
+    try:
+        return _parse_normalized(normalize_qquery(query))
+    except QQuerySyntaxError:
+        # parse again to report the position within the original query
+        _Parser(query).parse()
+        raise
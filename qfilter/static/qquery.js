@@ -21,6 +21,72 @@ $(document).ready(function () {
         deleteCssClass: 'delete-row btn btn-block btn-default m-0 p-2 d-flex flex-sm-column align-items-center justify-content-left justify-content-sm-center'
     });
 
+    //
+    // load the filter fields once from the versioned json url,
+    // the browser caches the response and revalidates it with the ETag
+    //
+    var fieldsUrl = $('#qfilter-wizard-multi-form').data('fields-url');
+    if (fieldsUrl) {
+        $.ajax({url: fieldsUrl, dataType: 'json', cache: true}).done(function (data) {
+            var options = $.map(data.fields, function (field) {
+                return $('<option>').val(field.path).text(field.name);
+            });
+
+            // keep the selected field of already submitted forms
+            $('#qfilter-wizard-multi-form select[name$="-field"], #qfilter-wizard-form-empty select[name$="-field"]').each(function () {
+                var selected = $(this).val();
+                $(this).empty().append($.map(options, function (option) { return option.clone(); }));
+                if (selected) {
+                    $(this).val(selected);
+                }
+            });
+
+            $('#qquery-fields-body').empty().append($.map(data.fields, function (field) {
+                return $('<tr>').append(
+                    $('<td>').text(field.name), $('<td>').text(field.path), $('<td>').text(field.type));
+            }));
+        });
+    }
+
+    //
+    // autocomplete values of text fields, selecting a suggestion switches
+    // "contains" to the cheaper "equal" operator
+    //
+    var autocompleteUrl = $('#qfilter-wizard-multi-form').data('autocomplete-url');
+    var autocompleteTimer = null;
+    $('#qfilter-wizard-multi-form').on('input', 'input[name$="-value"]', function () {
+        var input = $(this);
+        var prefix = input.attr('name').slice(0, -'value'.length);
+        var field = $('select[name="' + prefix + 'field"]').val();
+        var listId = input.attr('id') + '-suggestions';
+        if (!autocompleteUrl || !field) {
+            return;
+        }
+        if (!$('#' + listId).length) {
+            input.after($('<datalist>').attr('id', listId));
+            input.attr('list', listId);
+        }
+        clearTimeout(autocompleteTimer);
+        autocompleteTimer = setTimeout(function () {
+            $.getJSON(autocompleteUrl + encodeURIComponent(field), {q: input.val()}).done(function (data) {
+                $('#' + listId).empty().append($.map(data.values, function (value) {
+                    return $('<option>').val(value);
+                }));
+            });
+        }, 200);
+    });
+    $('#qfilter-wizard-multi-form').on('change', 'input[name$="-value"]', function () {
+        var input = $(this);
+        var prefix = input.attr('name').slice(0, -'value'.length);
+        var operator = $('select[name="' + prefix + 'operator"]');
+        var suggested = $('#' + input.attr('id') + '-suggestions option').filter(function () {
+            return this.value === input.val();
+        }).length;
+        if (suggested && operator.val() === '__icontains=') {
+            operator.val('=');
+        }
+    });
+
     // select2-ify dropdowns
     //$('#qfilter-wizard-multi-form select').select2();
     //$('#qfilter-wizard-multi-form .add-row').click(function() {
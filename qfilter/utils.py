@@ -1,67 +1,169 @@
 """
 utils for qfilter
 """
+import bisect
+import functools
 import itertools
+import json
 import logging
+import operator
+from collections import namedtuple
 
+import django
 from django.core.exceptions import ValidationError
-from django.db.models import Q  # pylint: disable=unused-import
+from django.db import DataError, connections
+from django.db.models import (Aggregate, BooleanField, Case, Exists, IntegerField, OuterRef, Q,  # pylint: disable=unused-import
+                              TextField, Value, When)
 from django.db.models.constants import LOOKUP_SEP
 
-from .forms import QueryFilterForm
+from . import vars
+from .parser import QQuerySyntaxError, parse_qquery
 
 LOGGER = logging.getLogger(__name__)
 
-# pylint: disable=unused-argument, invalid-name, broad-except, unused-variable
+# separator for GROUP_CONCAT, ASCII unit separator
+GROUP_CONCAT_SEPARATOR = '\x1f'
 
+# pylint: disable=unused-argument, invalid-name, broad-except, unused-variable, redefined-builtin
+
+# resolved lookup of a Q query: field path, lookups/transforms and if the path is an annotation
+ResolvedLookup = namedtuple('ResolvedLookup', ('path', 'lookup_parts', 'is_expression'))
+
+_LOOKUP_CACHE = {}
+
+# error of an invalid qfilter, position is the offset in the query string
+QQueryError = namedtuple('QQueryError', ('position', 'reason', 'message'))
+
+
+def validate_qquery(query):
+    """
+    validate a qfilter against the Q Query grammar without building a form
+
+    :return: None if the query is valid, otherwise a QQueryError
+    """
+    try:
+        parse_qquery(query)
+    except QQuerySyntaxError as e:
+        return QQueryError(e.position, e.reason, e.message)
+    return None
+
+def validate_qqueries(queries):
+    """
+    validate many qfilters, ex. saved filters in a bulk job
+
+    :return: {index: QQueryError} of the invalid queries
+    """
+    errors = {}
+    for index, query in enumerate(queries):
+        error = validate_qquery(query)
+        if error is not None:
+            errors[index] = error
+    return errors
+
+def qquery_validator(query):
+    """
+    django validator for qfilter form fields
+
+    :raises QQuerySyntaxError: if the query does not match the grammar
+    """
+    parse_qquery(query)
 
 def sanitize_qquery(query):
     """
-    use form to validate qfilter before eval
-    QueryFilterForm uses the Regex in settings to validate the filter query
+    validate qfilter before eval
+    returns None for an empty query
+
+    :raises QQuerySyntaxError: if the query does not match the grammar
     """
-    qfilter_form = QueryFilterForm(data={'qfilter': query})
-    if not qfilter_form.is_valid():
-        raise ValidationError(qfilter_form.errors, code='invalid')
-    return qfilter_form.cleaned_data['qfilter']
+    if not query:
+        return None
+    qquery_validator(query)
+    return query
 
 def eval_qquery(query):
     """
-    Evaluate QQuery String to Q-Object after sanitize
-    """
-    safe_dict = {'Q': Q}
+    Evaluate QQuery String to Q-Object
 
-    sanitized_query = sanitize_qquery(query)
-    query = eval(sanitized_query, {"__builtins__": None}, safe_dict)  # pylint: disable=eval-used,line-too-long
+    the query is parsed by the qfilter grammar instead of eval(),
+    repeated queries are served from the parser cache.
+    """
+    query = parse_qquery(query)
     LOGGER.debug('Q Query: %s', query.__repr__())
     return query
 
-def extract_field_names_from_q(query, lookups):
+def _iter_q_lookups(node):
+    for child in node.children:
+        if isinstance(child, Q):
+            yield from _iter_q_lookups(child)
+        else:
+            yield child[0]
+
+def resolve_lookup(query, lookup):
     """
-    get field names from q query
-    this extracts the lookups (iexact, startswith..) from the Q query expression
+    resolve a lookup string to (path, lookup_parts, is_expression),
+    ex. ingredients__name__icontains -> ingredients__name, ('icontains',), False
+
+    results are cached by model, lookup and the annotation names of the query,
+    the cache is cleared if the app registry changes, see qfilter.catalog
     """
-    fields = []
-    for lookup in lookups:
-        LOGGER.debug(lookup)
-        ex_lookups, field_parts, is_expression = query.solve_lookup_type(lookup[0])
+    key = (query.model, lookup, tuple(sorted(query.annotations)))
+    try:
+        return _LOOKUP_CACHE[key]
+    except KeyError:
+        pass
 
-        if not is_expression:
-            field = LOOKUP_SEP.join(field_parts)
-            fields.append(field)
+    ex_lookups, field_parts, is_expression = query.solve_lookup_type(lookup)
+    if not is_expression:
+        path = LOOKUP_SEP.join(field_parts)
 
-        # expressions resp. annotations are handled differently in django
-        else:
-            lookup_splitted = lookup[0].split(LOOKUP_SEP)
-            LOGGER.debug(lookup_splitted)
-            for i in ex_lookups:
-                if i in lookup_splitted:
-                    lookup_splitted.remove(i)
-            fields.append(LOOKUP_SEP.join(lookup_splitted))
+    # expressions resp. annotations are handled differently in django
+    else:
+        lookup_splitted = lookup.split(LOOKUP_SEP)
+        for i in ex_lookups:
+            if i in lookup_splitted:
+                lookup_splitted.remove(i)
+        path = LOOKUP_SEP.join(lookup_splitted)
+
+    if len(_LOOKUP_CACHE) >= vars.QQUERY_LOOKUP_CACHE_SIZE:
+        _LOOKUP_CACHE.clear()
+    resolved = _LOOKUP_CACHE[key] = ResolvedLookup(path, tuple(ex_lookups), bool(is_expression))
+    return resolved
+
+def resolve_q_lookups(query, qquery):
+    """
+    resolve all lookups of a Q tree at once
+
+    :return: {lookup: ResolvedLookup} in lookup order, each lookup is resolved once
+    """
+    lookups = dict.fromkeys(_iter_q_lookups(qquery))
+    return {lookup: resolve_lookup(query, lookup) for lookup in lookups}
+
+def clear_lookup_cache():
+    """
+    clear the cached lookup resolutions
+    """
+    _LOOKUP_CACHE.clear()
 
+def extract_field_names_from_q(query, lookups):
+    """
+    get field names from q query
+    this extracts the lookups (iexact, startswith..) from the Q query expression
+    """
+    fields = [resolve_lookup(query, lookup[0]).path for lookup in lookups]
     LOGGER.debug('lookup fields: %s', fields)
     return fields
 
+def get_prefix_values(queryset, path, prefix, limit=10):
+    """
+    get the distinct values of a field path of the queryset which start with prefix
+    (case insensitive), ordered and limited, ex. for autocomplete. only values of the
+    queryset's objects are returned, ex. of the objects a user is allowed to see.
+    """
+    # in one filter() call, the lookups of a to-many path match the same related row
+    lookups = {path + '__gt': ''}
+    if prefix:
+        lookups[path + '__istartswith'] = prefix
+    return queryset.filter(**lookups).order_by(path).values_list(path, flat=True).distinct()[:limit]
 
 def get_short_field_name(model_field):
     """
@@ -70,6 +172,57 @@ def get_short_field_name(model_field):
     # pylint: disable=protected-access
     return '{}.{}'.format(model_field.model._meta.object_name, model_field.name)
 
+def _merge_into(record, dictionary, shared_key, merge_fields):
+    """
+    merge one dictionary into a record, merge_fields are collected
+    in insertion ordered dicts to drop duplicates in O(1)
+    """
+    for key, value in dictionary.items():
+        if key == shared_key:
+            continue
+        if key in merge_fields:
+            values = record.get(key)
+            if values is None:
+                values = record[key] = {}
+            if value is not None:
+                values[value] = None
+        else:
+            record[key] = value
+
+
+def _finish_record(record, merge_fields):
+    for key in merge_fields:
+        if key in record:
+            record[key] = list(record[key])
+    return record
+
+
+def iter_merge(shared_key, merge_fields, iterable):
+    """
+    streaming variant of merge for values ordered by shared_key.
+    a merged record is yielded as soon as the shared_key changes,
+    only the current record is held in memory.
+
+    :param shared_key:  ex. id
+    :param merge_fields: ex. Platform.name
+    :param iterable:   queryset values ordered by shared_key
+    :return: generator of (key, record)
+    """
+    merge_fields = frozenset(merge_fields)
+    record = None
+    current_key = None
+    for dictionary in iterable:
+        d_key = dictionary[shared_key]
+        if record is None or d_key != current_key:
+            if record is not None:
+                yield current_key, _finish_record(record, merge_fields)
+            current_key = d_key
+            record = {}
+        _merge_into(record, dictionary, shared_key, merge_fields)
+    if record is not None:
+        yield current_key, _finish_record(record, merge_fields)
+
+
 def merge(shared_key, merge_fields, *iterables):
     """
     merge dictionaries based on a given shared_key.
@@ -81,20 +234,314 @@ def merge(shared_key, merge_fields, *iterables):
     :param iterables:   queryset values
     :return: dictionary
     """
+    merge_fields = frozenset(merge_fields)
     result = {}
     for dictionary in itertools.chain.from_iterable(iterables):
         d_key = dictionary[shared_key]
-        if d_key not in result.keys():
-            result[d_key] = {}
-        dictionary.pop(shared_key, None)
-        for key, value in dictionary.items():
-            if key in merge_fields:
-                if key not in result[d_key].keys():
-                    result[d_key][key] = []
-                if value:
-                    result[d_key][key].extend([value])
-                    result[d_key][key] = list(set(result[d_key][key]))
-            else:
-                result[d_key][key] = value
-    LOGGER.debug(result)
+        record = result.get(d_key)
+        if record is None:
+            record = result[d_key] = {}
+        _merge_into(record, dictionary, shared_key, merge_fields)
+    for record in result.values():
+        _finish_record(record, merge_fields)
     return result
+
+
+def get_page_keys(queryset, shared_key):
+    """
+    distinct shared_key values of a queryset ordered by shared_key.
+    used to paginate objects instead of the joined rows, all rows
+    of an object are on the same page.
+    """
+    return queryset.order_by().values_list(shared_key, flat=True).distinct().order_by(shared_key)
+
+
+def get_keyset_page_keys(keys, shared_key, after, size):
+    """
+    get the shared_key values of a page after the given key (keyset pagination)
+    the page is fetched with an index range scan instead of a large OFFSET
+
+    :param keys: ordered keys from get_page_keys or a sorted list of keys
+    """
+    if isinstance(keys, list):
+        start = bisect.bisect_right(keys, after) if after is not None else 0
+        return keys[start:start + size]
+    if after is not None:
+        keys = keys.filter(**{'{}__gt'.format(shared_key): after})
+    return list(keys[:size])
+
+
+class MergedValues:
+    """
+    lazy merged representation of a queryset
+
+    the values are ordered by shared_key and merged with iter_merge
+    while iterating, the queryset is not materialized.
+
+    :param columns: values() fields, all fields and annotations if None
+    """
+
+    def __init__(self, queryset, shared_key, merge_fields, columns=None):
+        self.queryset = queryset
+        self.shared_key = shared_key
+        self.merge_fields = merge_fields
+        self.columns = columns
+
+    def items(self):
+        """
+        generator of (key, merged record)
+        """
+        values = self.queryset.order_by(self.shared_key).values(*(self.columns or ())).iterator()
+        return iter_merge(self.shared_key, self.merge_fields, values)
+
+    def values(self):
+        """
+        generator of merged records
+        """
+        return (record for _, record in self.items())
+
+    def for_keys(self, keys):
+        """
+        restrict the merged values to the given shared keys, ex. a page
+        """
+        queryset = self.queryset.filter(**{'{}__in'.format(self.shared_key): keys})
+        return type(self)(queryset, self.shared_key, self.merge_fields, self.columns)
+
+
+class JSONGroupArray(Aggregate):
+    """
+    SQLite json_group_array aggregate, returns the values as JSON array
+    """
+    function = 'JSON_GROUP_ARRAY'
+    allow_distinct = True
+
+    def __init__(self, expression, **extra):
+        super().__init__(expression, output_field=TextField(), **extra)
+
+
+class GroupConcat(Aggregate):
+    """
+    MySQL GROUP_CONCAT aggregate, values are separated by GROUP_CONCAT_SEPARATOR
+    """
+    function = 'GROUP_CONCAT'
+    template = "%(function)s(%(distinct)s%(expressions)s SEPARATOR '{}')".format(GROUP_CONCAT_SEPARATOR)
+    allow_distinct = True
+
+    def __init__(self, expression, **extra):
+        super().__init__(expression, output_field=TextField(), **extra)
+
+
+def _get_merge_aggregate(vendor):
+    """
+    get aggregate and splitter of the aggregated value to a list by database vendor
+    returns (None, None) if the database is not supported
+    """
+    if vendor == 'postgresql':
+        from django.contrib.postgres.aggregates import ArrayAgg  # pylint: disable=import-outside-toplevel
+        return ArrayAgg, lambda value: value or []
+    if vendor == 'sqlite':
+        return JSONGroupArray, lambda value: json.loads(value) if value else []
+    if vendor == 'mysql':
+        return GroupConcat, lambda value: value.split(GROUP_CONCAT_SEPARATOR) if value else []
+    return None, None
+
+
+class MergeTruncated(DataError):
+    """
+    the aggregated values were truncated by the database, ex. MySQL's group_concat_max_len
+    """
+
+
+def _get_value_converter(queryset, path):
+    """
+    get a converter of the aggregated values of a lookup path to python values,
+    the same conversions as for the joined values (to_python and the database converters,
+    ex. aware datetimes)
+    """
+    connection = connections[queryset.db]
+    expression = queryset.query.resolve_ref(path)
+    field = expression.output_field
+    converters = connection.ops.get_db_converters(expression) + expression.get_db_converters(connection)
+
+    def convert(value):
+        if value is None:
+            return None
+        try:
+            value = field.to_python(value)
+        except ValidationError:
+            return value
+        for converter in converters:
+            value = converter(value, expression, connection)
+        return value
+    return convert
+
+
+def _get_max_length(connection):
+    """
+    get the maximal length of a GROUP_CONCAT result in bytes (MySQL)
+    """
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT @@group_concat_max_len')
+        return int(cursor.fetchone()[0])
+
+
+def aggregate_merged(queryset, shared_key, field_map, fallback=None):
+    """
+    merge the joined values in the database instead of python.
+    the queryset is grouped by the model fields and the lookups of
+    field_map are aggregated with ArrayAgg (PostgreSQL), json_group_array (SQLite)
+    or GROUP_CONCAT (MySQL). the aggregated values are converted like the joined values.
+
+    GROUP_CONCAT results are truncated at group_concat_max_len, the records of truncated
+    values are merged by fallback or MergeTruncated is raised if there is no fallback.
+
+    :param queryset:  filtered queryset without qfilter annotations
+    :param shared_key: ex. id
+    :param field_map: {annotation name: lookup path}, ex. {'Platform.name': 'platform__name'}
+    :param fallback:  MergedValues of the joined queryset, used for truncated values
+    :return: AggregatedMergedValues or None if the database is not supported
+    """
+    connection = connections[queryset.db]
+    aggregate, splitter = _get_merge_aggregate(connection.vendor)
+    if aggregate is None:
+        return None
+
+    # pylint: disable=protected-access
+    model_fields = [field.attname for field in queryset.model._meta.concrete_fields]
+    aggregates = {name: aggregate(path, distinct=True) for name, path in field_map.items()}
+    grouped = queryset.order_by().values(*model_fields).annotate(**aggregates).order_by(shared_key)
+    converters = {name: _get_value_converter(queryset, path) for name, path in field_map.items()}
+    max_length = _get_max_length(connection) if connection.vendor == 'mysql' else None
+    return AggregatedMergedValues(grouped, shared_key, list(field_map), splitter,
+                                  converters=converters, max_length=max_length, fallback=fallback)
+
+
+class AggregatedMergedValues:
+    """
+    lazy merged representation of a queryset aggregated in the database
+    provides the same interface as MergedValues
+    """
+
+    def __init__(self, queryset, shared_key, merge_fields, splitter,  # pylint: disable=too-many-arguments
+                 converters=None, max_length=None, fallback=None):
+        self.queryset = queryset
+        self.shared_key = shared_key
+        self.merge_fields = merge_fields
+        self.splitter = splitter
+        self.converters = converters or {}
+        self.max_length = max_length
+        self.fallback = fallback
+
+    def _is_truncated(self, value):
+        return self.max_length is not None and isinstance(value, str) and len(value.encode()) >= self.max_length
+
+    def _merge(self, key, row):
+        for field in self.merge_fields:
+            value = row[field]
+            if self._is_truncated(value):
+                if self.fallback is None:
+                    raise MergeTruncated('aggregated values of {} {} are truncated'.format(field, key))
+                LOGGER.warning('aggregated values of %s %s are truncated, merge in python', field, key)
+                return dict(self.fallback.for_keys([key]).items())[key]
+            convert = self.converters.get(field)
+            values = (convert(value) for value in self.splitter(value)) if convert else self.splitter(value)
+            row[field] = [value for value in values if value is not None]
+        return row
+
+    def items(self):
+        """
+        generator of (key, merged record)
+        """
+        for row in self.queryset.iterator():
+            key = row.pop(self.shared_key)
+            yield key, self._merge(key, row)
+
+    def values(self):
+        """
+        generator of merged records
+        """
+        return (record for _, record in self.items())
+
+    def for_keys(self, keys):
+        """
+        restrict the merged values to the given shared keys, ex. a page
+        """
+        queryset = self.queryset.filter(**{'{}__in'.format(self.shared_key): keys})
+        fallback = self.fallback.for_keys(keys) if self.fallback is not None else None
+        return type(self)(queryset, self.shared_key, self.merge_fields, self.splitter,
+                          converters=self.converters, max_length=self.max_length, fallback=fallback)
+
+
+def _batch_condition(model, qquery):
+    """
+    condition of one qfilter which matches each object at most once, to-many
+    lookups are rewritten as EXISTS or the whole filter is checked by an EXISTS on pk
+    """
+    from .compiler import compile_exists  # pylint: disable=import-outside-toplevel
+    condition, needs_distinct = compile_exists(model, qquery)
+    if needs_distinct:
+        condition = Q(Exists(model._base_manager.filter(qquery, pk=OuterRef('pk'))))
+    return condition
+
+
+def evaluate_qqueries(queryset, qfilters, method='case', batch_size=100, optimize=True):
+    """
+    evaluate many qfilters of the same model together, ex. stored alert filters
+
+    - case:  one query per batch with a CASE WHEN flag per qfilter,
+             the table is scanned once for all qfilters of the batch
+    - union: one UNION ALL query of id-only subqueries per batch,
+             each qfilter can use its own indexes
+
+    django < 3.0 does not support EXISTS conditions, each qfilter is evaluated by its own query.
+
+    :param queryset:   base queryset or model
+    :param qfilters:   qfilter strings
+    :param batch_size: number of qfilters per query
+    :param optimize:   optimize the Q queries, see qfilter.optimizer
+    :raises QQuerySyntaxError: if a qfilter is invalid, see validate_qqueries
+    :return: {qfilter: sorted list of primary keys} in the order of qfilters
+    """
+    from .optimizer import optimize_q  # pylint: disable=import-outside-toplevel
+
+    if not hasattr(queryset, 'query'):
+        queryset = queryset._default_manager.all()
+    model = queryset.model
+    queryset = queryset.order_by()
+
+    qfilters = list(dict.fromkeys(qfilters))
+    qqueries = [eval_qquery(qfilter) for qfilter in qfilters]
+    if optimize:
+        qqueries = [optimize_q(qquery, model) for qquery in qqueries]
+    results = {qfilter: [] for qfilter in qfilters}
+
+    if django.VERSION < (3, 0):
+        for qfilter, qquery in zip(qfilters, qqueries):
+            results[qfilter] = list(get_page_keys(queryset.filter(qquery), 'pk'))
+        return results
+
+    for start in range(0, len(qfilters), batch_size):
+        batch = qfilters[start:start + batch_size]
+        conditions = [_batch_condition(model, qquery) for qquery in qqueries[start:start + batch_size]]
+
+        if method == 'case':
+            flags = {'qfilter_{}'.format(i): Case(When(condition, then=Value(True)), default=Value(False),
+                                                  output_field=BooleanField())
+                     for i, condition in enumerate(conditions)}
+            rows = queryset.filter(functools.reduce(operator.or_, conditions)).annotate(**flags) \
+                .values_list('pk', *flags).iterator()
+            for row in rows:
+                for qfilter, flag in zip(batch, row[1:]):
+                    if flag:
+                        results[qfilter].append(row[0])
+        elif method == 'union':
+            parts = [queryset.filter(condition).annotate(qfilter_index=Value(i, output_field=IntegerField()))
+                     .values_list('pk', 'qfilter_index') for i, condition in enumerate(conditions)]
+            for pk, index in parts[0].union(*parts[1:], all=True):
+                results[batch[index]].append(pk)
+        else:
+            raise ValueError('unknown method: {}'.format(method))
+
+    for keys in results.values():
+        keys.sort()
+    return results
@@ -19,3 +19,15 @@ QQUERY_ALLOWED_FIELD_CHARS = r'/\s\w\-\.\*\+\$\|\{\}\^\(\)\\[\]\:'
 # QQUERY_REGEX to validate complete Q-Query
 #
 QQUERY_REGEX = r'^\(?~?Q\(\w+=(["][{allowed_field_chars}]*["]|True|False|\d+)\)(( ?[&|] ?\(?~?Q\(\w+=(["][{allowed_field_chars}]*["]|True|False|\d+)\)\)?)+)?$'.format(allowed_field_chars=QQUERY_ALLOWED_FIELD_CHARS)  # pylint: disable=line-too-long
+
+#
+# QQUERY_PARSE_CACHE_SIZE:
+# number of parsed Q Query strings kept in the LRU cache
+#
+QQUERY_PARSE_CACHE_SIZE = 1024
+
+#
+# QQUERY_LOOKUP_CACHE_SIZE:
+# number of resolved lookups (model, lookup) kept in the lookup cache
+#
+QQUERY_LOOKUP_CACHE_SIZE = 4096
@@ -41,7 +41,7 @@ setup(
     long_description=open('README.md').read(),
     long_description_content_type='text/markdown',
     author='Benjamin Pereto',
-    packages=find_packages(exclude=['tests*']),
+    packages=find_packages(exclude=['tests*', 'benchmarks*']),
     include_package_data=True,
     install_requires=["django>=2.2"],
     python_requires=">=3.6",
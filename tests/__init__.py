@@ -1 +1,22 @@
-from .qquery import *
\ No newline at end of file
+import django
+from django.db import connections
+from django.test.utils import setup_test_environment
+
+django.setup()
+setup_test_environment()
+for _alias in connections:
+    connections[_alias].creation.create_test_db(verbosity=0)
+
+from .qquery import *
+from .parser import *
+from .catalog import *
+from .optimizer import *
+from .utils import *
+from .compiler import *
+from .cache import *
+from .guard import *
+from .models import *
+from .views import *
+from .aio import *
+from .instrumentation import *
+from .evaluator import *
@@ -0,0 +1,113 @@
+"""
+unit tests for the async q filter view mixin
+"""
+
+# pylint: disable=invalid-name,protected-access
+
+__all__ = (
+    'AsyncViewTestCase',
+    'ConcurrentAsyncViewTestCase',
+)
+
+import threading
+from unittest import mock
+
+from asgiref.sync import async_to_sync
+from django.contrib.messages.storage.cookie import CookieStorage
+from django.db import connections
+from django.test import RequestFactory, TestCase, TransactionTestCase
+from django.views.generic import ListView
+
+from qfilter.aio import AsyncQQueryViewMixin, _run_in_thread
+
+from .testapp.data import create_food
+from .testapp.models import Recipe
+from .views import result_ids
+
+
+class AsyncRecipeListView(AsyncQQueryViewMixin, ListView):
+    model = Recipe
+    template_name = 'testapp/recipe_list.html'
+    ordering = ['name']
+
+
+async def call_async_view(data=None, **initkwargs):
+    request = RequestFactory().get('/recipes/', data or {})
+    request._messages = CookieStorage(request)
+    return await AsyncRecipeListView.as_view(**initkwargs)(request)
+
+
+class AsyncViewTestCase(TestCase):
+    """
+    Test cases for the async view mixin, the queries run in the request's thread
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.recipes = create_food()
+
+    def test_get(self):
+        """
+        Test the qfilter results are prefetched and rendered
+        """
+        response = async_to_sync(call_async_view)({'qfilter': 'Q(cook_time__gte=40)', 'qfilter-merged': 'on'},
+                                                  qfilter_concurrent_queries=False)
+        self.assertTrue(response.is_rendered)
+        self.assertEqual(result_ids(response), {self.recipes['curry'].id, self.recipes['bread'].id})
+        self.assertIsInstance(response.context_data['qfilter_qs'].merged, dict)
+        self.assertEqual(set(response.context_data['qfilter_qs'].merged), result_ids(response))
+
+    def test_connection_not_closed(self):
+        """
+        Test queries in the request's thread do not close its connection
+        """
+        async def count():
+            return await _run_in_thread(Recipe.objects.count, False, 'default')
+
+        with mock.patch.object(type(connections['default']), 'close') as close:
+            self.assertEqual(async_to_sync(count)(), len(self.recipes))
+        close.assert_not_called()
+
+
+class ConcurrentAsyncViewTestCase(TransactionTestCase):
+    """
+    Test cases for concurrent queries in own threads and connections
+    """
+
+    def setUp(self):
+        self.recipes = create_food()
+
+    def test_get(self):
+        """
+        Test the qfilter results are prefetched concurrently
+        """
+        response = async_to_sync(call_async_view)({'qfilter': 'Q(ingredients__name="rice")'})
+        self.assertEqual(result_ids(response), {self.recipes['curry'].id, self.recipes['risotto'].id})
+
+    def test_close_opened_connection(self):
+        """
+        Test only the connection opened by the concurrent query is closed, not all connections of the thread
+        """
+        def run_in_new_thread(connect_before):
+            # the wrapped function as run by sync_to_async, called in a new thread
+            with mock.patch('qfilter.aio.sync_to_async') as sync_to_async:
+                _run_in_thread(Recipe.objects.count, True, 'default')
+            run = sync_to_async.call_args[0][0]
+            result = {}
+
+            def target():
+                if connect_before:
+                    connections['default'].ensure_connection()
+                result['count'] = run()
+            thread = threading.Thread(target=target)
+            thread.start()
+            thread.join()
+            return result['count']
+
+        with mock.patch.object(type(connections['default']), 'close') as close, \
+                mock.patch('django.db.connections.close_all') as close_all:
+            self.assertEqual(run_in_new_thread(connect_before=False), len(self.recipes))
+            self.assertEqual(close.call_count, 1)
+            self.assertEqual(run_in_new_thread(connect_before=True), len(self.recipes))
+            self.assertEqual(close.call_count, 1)
+        close_all.assert_not_called()
@@ -0,0 +1,142 @@
+"""
+unit tests for the q filter result cache
+"""
+
+# pylint: disable=invalid-name,protected-access
+
+__all__ = (
+    'ResultCacheTestCase',
+)
+
+from django.core.cache import caches
+from django.test import TestCase
+
+from qfilter.cache import _TRACKED_MODELS, _version_key, get_cached_keys, get_cached_values, track_models
+from qfilter.compiler import get_involved_models
+from qfilter.utils import eval_qquery
+
+from .testapp.data import create_food
+from .testapp.models import Cookbook, Ingredient, IngredientType, Recipe
+
+
+class ResultCacheTestCase(TestCase):
+    """
+    Test cases for cached qfilter results and their invalidation
+    """
+
+    QFILTER = 'Q(ingredients__name="onion") & Q(cookbook__name="italy")'
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.recipes = create_food()
+
+    def setUp(self):
+        for alias in ('default', 'other'):
+            caches[alias].clear()
+        _TRACKED_MODELS.clear()
+
+    def committed(self):
+        return self.captureOnCommitCallbacks(execute=True)
+
+    def cached_keys(self, alias='default'):
+        qquery = eval_qquery(self.QFILTER)
+        queryset = Recipe.objects.filter(qquery).distinct()
+        return get_cached_keys(queryset, 'id', get_involved_models(Recipe, qquery), alias=alias)
+
+    def test_cached(self):
+        """
+        Test the keys are queried once
+        """
+        self.assertEqual(self.cached_keys(), [self.recipes['salad'].id])
+        with self.assertNumQueries(0):
+            self.assertEqual(self.cached_keys(), [self.recipes['salad'].id])
+
+    def test_invalidate_on_save(self):
+        """
+        Test saving an involved model invalidates the cached keys
+        """
+        self.cached_keys()
+        with self.committed():
+            Ingredient.objects.filter(name='onion').get().save()
+        with self.assertNumQueries(1):
+            self.cached_keys()
+
+    def test_invalidate_on_m2m_change(self):
+        """
+        Test changing a many-to-many relation from both sides invalidates the cached keys
+        """
+        self.cached_keys()
+        with self.committed():
+            Cookbook.objects.get(name='italy').recipes.add(self.recipes['curry'])
+        self.assertEqual(self.cached_keys(), [self.recipes['curry'].id, self.recipes['salad'].id])
+
+        with self.committed():
+            self.recipes['soup'].cookbook_set.add(Cookbook.objects.get(name='italy'))
+        self.assertEqual(self.cached_keys(), [self.recipes['curry'].id, self.recipes['salad'].id,
+                                              self.recipes['soup'].id])
+
+    def test_invalidate_tracked(self):
+        """
+        Test the data version is only bumped for tracked models, in the caches they are tracked in
+        """
+        key = _version_key(IngredientType._meta.label_lower)
+        with self.committed():
+            IngredientType.objects.create(name='spice')
+        self.assertIsNone(caches['default'].get(key))
+
+        track_models({IngredientType}, alias='other')
+        with self.committed():
+            IngredientType.objects.create(name='herb')
+        self.assertIsNone(caches['default'].get(key))
+        self.assertIsNotNone(caches['other'].get(key))
+
+        self.cached_keys(alias='other')
+        with self.committed():
+            Recipe.objects.filter(name='salad').get().save()
+        with self.assertNumQueries(1):
+            self.cached_keys(alias='other')
+
+    def test_invalidate_on_commit(self):
+        """
+        Test the data version is bumped after the transaction is committed
+        """
+        self.cached_keys()
+        with self.captureOnCommitCallbacks() as callbacks:
+            Recipe.objects.filter(name='salad').get().save()
+            with self.assertNumQueries(0):
+                self.cached_keys()
+        for callback in callbacks:
+            callback()
+        with self.assertNumQueries(1):
+            self.cached_keys()
+
+    def test_cached_values(self):
+        """
+        Test cached values, ex. autocomplete suggestions, are invalidated
+        """
+        def values():
+            queryset = Ingredient.objects.filter(name__istartswith='c').order_by('name').values_list('name', flat=True)
+            return get_cached_values(queryset, {Ingredient})
+
+        self.assertEqual(values(), ['carrot', 'celery', 'cheese', 'chicken'])
+        with self.assertNumQueries(0):
+            values()
+        with self.committed():
+            Ingredient.objects.filter(name='celery').delete()
+        self.assertEqual(values(), ['carrot', 'cheese', 'chicken'])
+
+    def test_empty(self):
+        """
+        Test querysets which match nothing are not queried
+        """
+        with self.assertNumQueries(0):
+            self.assertEqual(get_cached_keys(Recipe.objects.none(), 'id', {Recipe}), [])
+            self.assertEqual(get_cached_keys(Recipe.objects.filter(pk__in=()), 'id', {Recipe}), [])
+
+    def test_involved_models(self):
+        """
+        Test the involved models include the related and through models, also of reverse relations
+        """
+        models = get_involved_models(Recipe, eval_qquery('Q(ingredients__type__name="grain") & Q(cookbook__name="asia")'))
+        self.assertEqual(models, {Recipe, Ingredient, IngredientType, Cookbook,
+                                  Recipe.ingredients.through, Cookbook.recipes.through})
@@ -0,0 +1,108 @@
+"""
+unit tests for the filter field catalog
+"""
+
+# pylint: disable=invalid-name
+
+__all__ = (
+    'FieldCatalogTestCase',
+)
+
+import json
+from unittest import TestCase
+
+from django.core.signals import setting_changed
+from django.db.models.signals import class_prepared
+
+from qfilter.catalog import clear_field_catalog, get_field_catalog, iter_filter_fields
+
+from .testapp.models import Recipe
+
+
+class FieldCatalogTestCase(TestCase):
+    """
+    Test cases for caching the filter fields of a model
+    """
+
+    def setUp(self):
+        clear_field_catalog()
+
+    def test_cached(self):
+        """
+        Test catalogs are built once per model and options
+        """
+        catalog = get_field_catalog(Recipe)
+        self.assertIs(get_field_catalog(Recipe), catalog)
+        self.assertIs(get_field_catalog(Recipe, exclude={'testapp.Recipe': ['name']}),
+                      get_field_catalog(Recipe, exclude={'testapp.recipe': ['name']}))
+        self.assertIsNot(get_field_catalog(Recipe, max_depth=2), catalog)
+
+    def test_cleared(self):
+        """
+        Test catalogs are cleared if models are prepared or the installed apps change
+        """
+        catalog = get_field_catalog(Recipe)
+        class_prepared.send(sender=Recipe)
+        self.assertIsNot(get_field_catalog(Recipe), catalog)
+
+        catalog = get_field_catalog(Recipe)
+        setting_changed.send(sender=self.__class__, setting='TIME_ZONE', value='UTC', enter=True)
+        self.assertIs(get_field_catalog(Recipe), catalog)
+        setting_changed.send(sender=self.__class__, setting='INSTALLED_APPS', value=[], enter=True)
+        self.assertIsNot(get_field_catalog(Recipe), catalog)
+
+    @staticmethod
+    def paths(**kwargs):
+        return [ff.path for ff in iter_filter_fields(Recipe, **kwargs)]
+
+    def test_depth(self):
+        """
+        Test relations are followed up to max_depth, breadth-first
+        """
+        self.assertEqual(self.paths(max_depth=0), ['name', 'created', 'cook_time', 'vegan'])
+        self.assertEqual(self.paths(max_depth=1), ['name', 'created', 'cook_time', 'vegan', 'cookbook__name',
+                                                   'ingredients__name', 'ingredients__created'])
+        self.assertEqual(self.paths(max_depth=2)[-1], 'ingredients__type__name')
+
+    def test_cycles(self):
+        """
+        Test a model is not entered twice on the same relation path
+        """
+        paths = self.paths(max_depth=5)
+        self.assertNotIn('cookbook__recipes__name', paths)
+        self.assertNotIn('ingredients__recipe__name', paths)
+        self.assertIn('ingredients__type__name', paths)
+        self.assertEqual(len(paths), len(set(paths)))
+
+    def test_include_exclude(self):
+        """
+        Test the include and exclude options per model label
+        """
+        paths = self.paths(include={'testapp.Recipe': ['name', 'ingredients']}, exclude={'testapp.ingredient': ['created']})
+        self.assertEqual(paths, ['name', 'ingredients__name'])
+        self.assertEqual(self.paths(include={'testapp.recipe': 'name'}, max_depth=0), ['name'])
+        self.assertEqual(self.paths(exclude={'testapp.recipe': 'vegan'}, max_depth=0), ['name', 'created', 'cook_time'])
+
+    def test_lookup(self):
+        """
+        Test fields are looked up by path, deeper paths are resolved on demand
+        """
+        catalog = get_field_catalog(Recipe)
+        self.assertIn('ingredients__name', catalog)
+        self.assertEqual(catalog.short_name('ingredients__name'), 'Ingredient.name')
+        self.assertEqual(catalog.internal_type('cook_time'), 'IntegerField')
+        self.assertNotIn('ingredients__type__name', catalog)
+        self.assertEqual(catalog.get('ingredients__type__name').internal_type, 'CharField')
+        self.assertIsNone(catalog.get('ingredients__missing'))
+        self.assertEqual(catalog.short_name('ingredients__missing'), 'ingredients__missing')
+
+    def test_json(self):
+        """
+        Test the serialized fields are built once and versioned by their content
+        """
+        catalog = get_field_catalog(Recipe)
+        data = json.loads(catalog.as_json())
+        self.assertIs(catalog.as_json(), catalog.as_json())
+        self.assertEqual(data['version'], catalog.version)
+        self.assertEqual([field['path'] for field in data['fields']], [ff.path for ff in catalog])
+        self.assertNotEqual(get_field_catalog(Recipe, max_depth=0).version, catalog.version)
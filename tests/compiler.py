@@ -0,0 +1,89 @@
+"""
+unit tests for the q filter compiler
+"""
+
+# pylint: disable=invalid-name
+
+__all__ = (
+    'CompileExistsTestCase',
+)
+
+from django.db.models import Exists
+from django.test import TestCase
+
+from qfilter.compiler import compile_exists
+from qfilter.utils import eval_qquery
+
+from .testapp.data import create_food
+from .testapp.models import Recipe
+
+
+class CompileExistsTestCase(TestCase):
+    """
+    Test cases for rewriting to-many lookups as EXISTS subqueries
+    """
+
+    QFILTERS = [
+        'Q(ingredients__name="rice")',
+        'Q(ingredients__name__icontains="o") & Q(cook_time__gte=10)',
+        'Q(ingredients__name__icontains="a") & Q(ingredients__name__icontains="e")',
+        'Q(ingredients__name="rice") & Q(ingredients__type__name="grain")',
+        'Q(ingredients__name="rice") | Q(cookbook__name="italy")',
+        'Q(ingredients__name="onion") | Q(ingredients__name="cheese")',
+        '~Q(ingredients__name="onion")',
+        '~Q(ingredients__name="onion") & Q(cookbook__name="italy")',
+        '~Q(ingredients__name="rice") | ~Q(cookbook__name="asia")',
+        '~(Q(ingredients__name="rice") & Q(ingredients__type__name="grain"))',
+        '~(Q(ingredients__name="rice") & Q(ingredients__type__name="vegetable"))',
+        '~(Q(ingredients__name="onion") & Q(ingredients__name="rice")) & Q(cook_time__gte=0)',
+        '~(Q(cook_time=0) | (Q(ingredients__name="rice") & Q(ingredients__type__name="vegetable")))',
+        '(Q(ingredients__name="onion") & Q(cook_time__lte=10)) | ~Q(ingredients__type__name="vegetable")',
+        'Q(ingredients__name__isnull=True)',
+        'Q(ingredients__name="onion") & Q(ingredients__name__isnull=False)',
+        'Q(cookbook__recipes__name="soup")',
+    ]
+
+    @classmethod
+    def setUpTestData(cls):
+        create_food()
+
+    @staticmethod
+    def joined_ids(qfilter):
+        return sorted(set(Recipe.objects.filter(eval_qquery(qfilter)).distinct().values_list('id', flat=True)))
+
+    @staticmethod
+    def exists_ids(qfilter):
+        q, needs_distinct = compile_exists(Recipe, eval_qquery(qfilter))
+        queryset = Recipe.objects.filter(q)
+        if needs_distinct:
+            queryset = queryset.distinct()
+        ids = list(queryset.values_list('id', flat=True))
+        return sorted(ids), needs_distinct, len(ids) != len(set(ids))
+
+    def test_same_results(self):
+        """
+        Test the EXISTS rewrite matches the same objects as the joins with DISTINCT
+        """
+        for qfilter in self.QFILTERS:
+            with self.subTest(qfilter=qfilter):
+                ids, needs_distinct, duplicates = self.exists_ids(qfilter)
+                self.assertEqual(ids, self.joined_ids(qfilter))
+                self.assertFalse(duplicates and not needs_distinct)
+
+    def test_rewritten(self):
+        """
+        Test to-many lookups are rewritten and siblings share one subquery
+        """
+        q, needs_distinct = compile_exists(Recipe, eval_qquery('Q(ingredients__name="rice") & Q(ingredients__type__name="grain") & Q(cook_time__gte=10)'))
+        self.assertFalse(needs_distinct)
+        self.assertEqual(sum(isinstance(child, Exists) for child in q.children), 1)
+        self.assertIn(('cook_time__gte', 10), q.children)
+
+    def test_kept_joins(self):
+        """
+        Test isnull=True and kept fields stay joined and need DISTINCT
+        """
+        q = eval_qquery('Q(ingredients__name__isnull=True)')
+        self.assertEqual(compile_exists(Recipe, q), (q, True))
+        q = eval_qquery('Q(ingredients__name="rice")')
+        self.assertEqual(compile_exists(Recipe, q, keep=('ingredients__name',)), (q, True))
@@ -0,0 +1,138 @@
+"""
+unit tests for the in-memory q filter evaluator
+"""
+
+# pylint: disable=invalid-name
+
+__all__ = (
+    'EvaluatorTestCase',
+    'EvaluatorDatabaseTestCase',
+)
+
+from datetime import date
+from types import SimpleNamespace
+from unittest import TestCase
+
+from django.test import TestCase as DBTestCase
+
+from django.db.models import Q
+
+from qfilter.evaluator import compile_qfilter, filter_objects
+from qfilter.utils import eval_qquery
+
+from .testapp.data import create_food
+from .testapp.models import Recipe
+
+
+class EvaluatorTestCase(TestCase):
+    """
+    Test cases for evaluating qfilters against objects and dicts
+    """
+
+    RECIPES = [
+        {'id': 1, 'name': 'Curry', 'cook_time': 40, 'ingredients': [{'name': 'rice'}, {'name': 'chicken'}]},
+        {'id': 2, 'name': 'Salad', 'cook_time': 10, 'ingredients': []},
+        {'id': 3, 'name': 'Soup', 'cook_time': None, 'ingredients': [{'name': 'carrot'}]},
+    ]
+
+    def ids(self, qfilter, objects=None):
+        return [obj['id'] for obj in filter_objects(qfilter, self.RECIPES if objects is None else objects)]
+
+    def test_lookups(self):
+        """
+        Test the operators of the query wizard
+        """
+        self.assertEqual(self.ids('Q(name="Curry")'), [1])
+        self.assertEqual(self.ids('Q(name__icontains="SO")'), [3])
+        self.assertEqual(self.ids('Q(cook_time__isnull=True)'), [3])
+        self.assertEqual(self.ids('Q(cook_time__gte=40)'), [1])
+        self.assertEqual(self.ids('Q(cook_time__lte=40)'), [1, 2])
+        self.assertEqual(self.ids('Q(name__regex="^S.*d$")'), [2])
+
+    def test_combined(self):
+        """
+        Test AND, OR and negation, negated lookups match NULL values like the ORM
+        """
+        self.assertEqual(self.ids('Q(cook_time__gte=10) & ~Q(name="Curry")'), [2])
+        self.assertEqual(self.ids('Q(name="Salad") | Q(name="Soup")'), [2, 3])
+        self.assertEqual(self.ids('~Q(cook_time__gte=20)'), [2, 3])
+
+    def test_to_many(self):
+        """
+        Test lookups over to-many relations match if any related value matches
+        """
+        self.assertEqual(self.ids('Q(ingredients__name="rice")'), [1])
+        self.assertEqual(self.ids('Q(ingredients__name__icontains="c")'), [1, 3])
+        self.assertEqual(self.ids('Q(ingredients__name__isnull=True)'), [2])
+        self.assertEqual(self.ids('~Q(ingredients__name="rice")'), [2, 3])
+
+    def test_same_related_value(self):
+        """
+        Test ANDed lookups over a to-many relation match the same related value
+        """
+        self.assertEqual(self.ids('Q(ingredients__name="rice") & Q(ingredients__name="chicken")'), [])
+        self.assertEqual(self.ids('Q(ingredients__name__icontains="c") & Q(ingredients__name__icontains="r")'), [1, 3])
+        self.assertEqual(self.ids('Q(ingredients__name__icontains="c") & Q(ingredients__name__icontains="t")'), [3])
+
+    def test_objects(self):
+        """
+        Test objects with attributes and related objects
+        """
+        objects = [
+            SimpleNamespace(id=1, name='Curry', cookbook=SimpleNamespace(pk=7, name='Asia')),
+            SimpleNamespace(id=2, name='Salad', cookbook=None),
+        ]
+        matches = filter_objects('Q(cookbook__name__icontains="asia")', objects)
+        self.assertEqual([obj.id for obj in matches], [1])
+        matches = filter_objects(Q(cookbook__isnull=True), objects)
+        self.assertEqual([obj.id for obj in matches], [2])
+
+    def test_cache(self):
+        """
+        Test compiled qfilters are cached
+        """
+        self.assertIs(compile_qfilter('Q(name="Curry")'), compile_qfilter('Q(name="Curry")'))
+
+    def test_attribute_path(self):
+        """
+        Test paths without a model are attributes or keys, ex. the year of a date
+        """
+        objects = [SimpleNamespace(id=1, created=date(2019, 5, 1)), SimpleNamespace(id=2, created=date(2021, 1, 1))]
+        matches = filter_objects(Q(created__year__gte=2020), objects)
+        self.assertEqual([obj.id for obj in matches], [2])
+
+
+class EvaluatorDatabaseTestCase(DBTestCase):
+    """
+    Test cases comparing the in-memory evaluation with the database query
+    """
+
+    QFILTERS = [
+        'Q(ingredients__name="rice")',
+        'Q(ingredients__name__icontains="a") & Q(ingredients__name__icontains="e")',
+        'Q(ingredients__name__icontains="o") & Q(ingredients__type__name="grain")',
+        'Q(ingredients__name="rice") & Q(ingredients__name="onion")',
+        'Q(ingredients__name="rice") | Q(ingredients__name="lettuce")',
+        'Q(ingredients__name__icontains="o") & Q(cook_time__gte=10)',
+        'Q(cookbook__name="italy") & Q(cookbook__recipes__name="soup")',
+        'Q(cookbook__recipes__vegan=True) & Q(cookbook__recipes__cook_time__gte=40)',
+        'Q(ingredients__name__isnull=True)',
+        'Q(ingredients__name__isnull=True) & Q(ingredients__type__name__isnull=True)',
+        '~Q(ingredients__name="onion")',
+        '~(Q(ingredients__name__icontains="a") & Q(ingredients__name__icontains="e"))',
+        '~(Q(cook_time=0) | (Q(ingredients__name="rice") & Q(ingredients__type__name="vegetable")))',
+    ]
+
+    @classmethod
+    def setUpTestData(cls):
+        create_food()
+
+    def test_database(self):
+        """
+        Test the evaluator matches the same recipes as the database
+        """
+        recipes = Recipe.objects.prefetch_related('ingredients__type', 'cookbook_set__recipes')
+        for qfilter in self.QFILTERS:
+            with self.subTest(qfilter=qfilter):
+                expected = set(Recipe.objects.filter(eval_qquery(qfilter)).values_list('name', flat=True))
+                self.assertEqual({recipe.name for recipe in filter_objects(qfilter, recipes, Recipe)}, expected)
@@ -0,0 +1,88 @@
+"""
+unit tests for the query cost guard
+"""
+
+# pylint: disable=invalid-name
+
+__all__ = (
+    'StatementTimeoutVendorTestCase',
+)
+
+import contextlib
+from unittest import TestCase, mock
+
+from qfilter.guard import statement_timeout
+
+
+class _Cursor:
+    def __init__(self, statements, value):
+        self.statements = statements
+        self.value = value
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+    def execute(self, sql, params=None):
+        self.statements.append((sql, params))
+
+    def fetchone(self):
+        return (self.value,)
+
+
+@contextlib.contextmanager
+def _atomic(using):
+    yield
+
+
+class _Connection:
+    alias = 'default'
+
+    def __init__(self, vendor, value):
+        self.vendor = vendor
+        self.value = value
+        self.statements = []
+
+    def cursor(self):
+        return _Cursor(self.statements, self.value)
+
+
+class StatementTimeoutVendorTestCase(TestCase):
+    """
+    Test cases for restoring the previous statement timeout
+    """
+
+    @staticmethod
+    def run_timeout(connection, fail=False):
+        with mock.patch.dict('qfilter.guard.connections', {'default': connection}), \
+                mock.patch('qfilter.guard.transaction.atomic', _atomic):
+            with contextlib.suppress(RuntimeError), statement_timeout('default', 100):
+                connection.statements.append(('query', None))
+                if fail:
+                    raise RuntimeError
+        return connection.statements
+
+    def test_postgresql(self):
+        """
+        Test the previous value is restored, SET LOCAL would last until the end of the outer transaction
+        """
+        statements = self.run_timeout(_Connection('postgresql', '30s'))
+        self.assertEqual(statements[1:], [
+            ('SET LOCAL statement_timeout = %s', [100]),
+            ('query', None),
+            ("SELECT set_config('statement_timeout', %s, true)", ['30s']),
+        ])
+
+    def test_mysql(self):
+        """
+        Test the previous session value is restored, also if the block fails
+        """
+        for fail in (False, True):
+            statements = self.run_timeout(_Connection('mysql', 2000), fail=fail)
+            self.assertEqual(statements[1:], [
+                ('SET SESSION max_execution_time = %s', [100]),
+                ('query', None),
+                ('SET SESSION max_execution_time = %s', [2000]),
+            ])
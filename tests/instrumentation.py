@@ -0,0 +1,73 @@
+"""
+unit tests for the qfilter instrumentation
+"""
+
+# pylint: disable=invalid-name
+
+__all__ = (
+    'InstrumentationTestCase',
+)
+
+from unittest import TestCase
+
+from qfilter.instrumentation import MemoryMetricsAdapter, QFilterMetrics, TimedMerged
+
+
+class _Merged:
+    def __init__(self, data):
+        self.data = data
+
+    def items(self):
+        return iter(self.data.items())
+
+    def values(self):
+        return iter(self.data.values())
+
+    def for_keys(self, keys):
+        return _Merged({k: v for k, v in self.data.items() if k in keys})
+
+
+class InstrumentationTestCase(TestCase):
+    """
+    Test cases for qfilter metrics
+    """
+
+    def test_phases(self):
+        """
+        Test repeated phases are summed up
+        """
+        metrics = QFilterMetrics('Q(name="curry")')
+        metrics.add('render', 0.5)
+        with metrics.phase('render'):
+            pass
+        with metrics.phase('parse'):
+            pass
+        self.assertGreaterEqual(metrics.phases['render'], 0.5)
+        self.assertEqual(list(metrics.phases), ['render', 'parse'])
+        self.assertTrue(metrics.finish())
+        self.assertFalse(metrics.finish())
+
+    def test_timed_merged(self):
+        """
+        Test merged values are proxied and counted as rows
+        """
+        metrics = QFilterMetrics('Q(name="curry")')
+        merged = TimedMerged(_Merged({1: 'a', 2: 'b', 3: 'c'}), metrics)
+        self.assertEqual(list(merged.for_keys({1, 3}).items()), [(1, 'a'), (3, 'c')])
+        self.assertEqual(list(merged.values()), ['a', 'b', 'c'])
+        self.assertEqual(metrics.rows, 5)
+        self.assertIn('merge', metrics.phases)
+
+    def test_memory_adapter(self):
+        """
+        Test reporting metrics to the memory adapter
+        """
+        metrics = QFilterMetrics('Q(name="curry")')
+        metrics.add('parse', 0.1)
+        metrics.queries = 2
+        metrics.rows = 10
+        adapter = MemoryMetricsAdapter()
+        adapter.report(metrics)
+        adapter.report(metrics)
+        self.assertEqual(adapter.timings, [('qfilter.parse', 0.1), ('qfilter.parse', 0.1)])
+        self.assertEqual(adapter.counters, {'qfilter.requests': 2, 'qfilter.queries': 4, 'qfilter.rows': 20})
@@ -0,0 +1,209 @@
+"""
+unit tests for the saved qfilters
+"""
+
+# pylint: disable=invalid-name
+
+__all__ = (
+    'SavedQFilterTestCase',
+    'RefreshCommandTestCase',
+    'SavedQFilterViewTestCase',
+)
+
+from io import StringIO
+from unittest import mock
+
+from django.core.management import CommandError, call_command
+from django.http import Http404
+from django.test import TestCase
+
+from qfilter import utils
+from qfilter.models import SavedQFilter
+
+from .testapp.data import create_food
+from .testapp.models import Ingredient, IngredientType, Recipe
+from .views import call_view, result_ids
+
+
+class SavedQFilterTestCase(TestCase):
+    """
+    Test cases for refreshing and invalidating saved qfilters
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.recipes = create_food()
+
+    def setUp(self):
+        self.saved = SavedQFilter.objects.create(name='onion', model='testapp.Recipe',
+                                                 qfilter='Q(ingredients__name="onion")')
+
+    def result_ids(self):
+        return {result['object_id'] for result in self.saved.get_result_ids()}
+
+    def test_refresh(self):
+        """
+        Test the matching primary keys are materialized incrementally
+        """
+        self.assertEqual(self.saved.refresh(), (3, 0, 0))
+        self.assertEqual(self.result_ids(), {self.recipes[name].id for name in ('curry', 'salad', 'soup')})
+        self.assertFalse(SavedQFilter.objects.get(pk=self.saved.pk).stale)
+        self.assertEqual(self.saved.involved_models, ',testapp.ingredient,testapp.recipe,testapp.recipe_ingredients,')
+
+        self.recipes['soup'].ingredients.remove(Ingredient.objects.get(name='onion'))
+        self.assertEqual(self.saved.refresh(), (0, 1, 0))
+        self.assertEqual(self.result_ids(), {self.recipes[name].id for name in ('curry', 'salad')})
+
+    def test_merged(self):
+        """
+        Test the merged values are materialized and only changed payloads are updated
+        """
+        self.saved.merged = True
+        self.saved.save()
+        self.saved.refresh()
+        merged = dict(self.saved.get_merged().items())
+        self.assertEqual(merged[self.recipes['curry'].id]['Ingredient.name'], ['onion'])
+
+        Recipe.objects.filter(pk=self.recipes['salad'].pk).update(name='greens')
+        self.assertEqual(self.saved.refresh(), (0, 0, 1))
+
+    def test_stale_on_change(self):
+        """
+        Test changes of the involved models mark the saved qfilter as stale
+        """
+        self.saved.refresh()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.recipes['bread'].save()
+            # not before the change is committed
+            self.assertFalse(SavedQFilter.objects.get(pk=self.saved.pk).stale)
+        self.assertTrue(SavedQFilter.objects.get(pk=self.saved.pk).stale)
+
+        self.saved.refresh()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.recipes['bread'].ingredients.add(Ingredient.objects.get(name='onion'))
+        self.assertTrue(SavedQFilter.objects.get(pk=self.saved.pk).stale)
+
+    def test_untracked_change(self):
+        """
+        Test changes of models no saved qfilter depends on do not query the saved qfilters
+        """
+        self.saved.refresh()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.recipes['bread'].save()
+        with self.captureOnCommitCallbacks() as callbacks, self.assertNumQueries(1):
+            IngredientType.objects.create(name='spice')
+        self.assertEqual(callbacks, [])
+
+    def test_stale_on_edit(self):
+        """
+        Test editing the qfilter marks the saved qfilter as stale, other fields do not
+        """
+        self.saved.refresh()
+        saved = SavedQFilter.objects.get(pk=self.saved.pk)
+        saved.refresh_interval = 60
+        saved.save()
+        self.assertFalse(SavedQFilter.objects.get(pk=self.saved.pk).stale)
+
+        saved.qfilter = 'Q(cook_time__gte=40)'
+        saved.save(update_fields=['qfilter'])
+        self.assertTrue(SavedQFilter.objects.get(pk=self.saved.pk).stale)
+
+    def test_changed_while_refreshing(self):
+        """
+        Test changes while the qfilter is evaluated are not lost
+        """
+        get_page_keys = utils.get_page_keys
+
+        def change_while_querying(*args, **kwargs):
+            keys = list(get_page_keys(*args, **kwargs))
+            with self.captureOnCommitCallbacks(execute=True):
+                self.recipes['bread'].ingredients.add(Ingredient.objects.get(name='onion'))
+            return keys
+
+        with mock.patch('qfilter.models.utils.get_page_keys', change_while_querying):
+            self.saved.refresh()
+        self.assertTrue(self.saved.stale)
+        self.assertTrue(SavedQFilter.objects.get(pk=self.saved.pk).stale)
+        self.assertNotIn(self.recipes['bread'].id, self.result_ids())
+
+    def test_failed_refresh(self):
+        """
+        Test a failed refresh leaves the saved qfilter stale
+        """
+        self.saved.refresh()
+        self.saved.qfilter = 'Q(missing="x")'
+        self.saved.save()
+        with self.assertRaises(Exception):
+            self.saved.refresh()
+        self.assertTrue(SavedQFilter.objects.get(pk=self.saved.pk).stale)
+
+
+class RefreshCommandTestCase(TestCase):
+    """
+    Test cases for the qfilter_refresh management command
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.recipes = create_food()
+        SavedQFilter.objects.create(name='long', model='testapp.Recipe', qfilter='Q(cook_time__gte=40)')
+        SavedQFilter.objects.create(name='vegan', model='testapp.Recipe', qfilter='Q(vegan=True)')
+
+    @staticmethod
+    def refresh(*args):
+        stdout = StringIO()
+        call_command('qfilter_refresh', *args, stdout=stdout, stderr=StringIO())
+        return stdout.getvalue()
+
+    def test_refresh(self):
+        """
+        Test named and due saved qfilters are refreshed
+        """
+        self.assertEqual(self.refresh('long'), 'long: 2 added, 0 removed, 0 updated\n')
+        self.assertEqual(self.refresh('--due'), 'vegan: 3 added, 0 removed, 0 updated\n')
+        self.assertEqual(self.refresh('--due'), '')
+        self.assertEqual(self.refresh(), 'long: 0 added, 0 removed, 0 updated\nvegan: 0 added, 0 removed, 0 updated\n')
+
+    def test_errors(self):
+        """
+        Test unknown and failing saved qfilters
+        """
+        with self.assertRaises(CommandError):
+            self.refresh('missing')
+        SavedQFilter.objects.filter(name='long').update(qfilter='Q(missing="x")')
+        with self.assertRaises(CommandError):
+            self.refresh()
+        self.assertFalse(SavedQFilter.objects.get(name='vegan').stale)
+
+
+class SavedQFilterViewTestCase(TestCase):
+    """
+    Test cases for serving saved qfilters with qfilter-saved
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.recipes = create_food()
+        cls.saved = SavedQFilter.objects.create(name='long', model='testapp.Recipe', qfilter='Q(cook_time__gte=40)')
+
+    def test_saved(self):
+        """
+        Test the materialized results are served
+        """
+        self.saved.refresh()
+        response = call_view(data={'qfilter-saved': 'long'})
+        self.assertEqual(result_ids(response), {self.recipes['bread'].id, self.recipes['curry'].id})
+
+        # the materialized results, not the current data
+        Recipe.objects.filter(pk=self.recipes['soup'].pk).update(cook_time=50)
+        response = call_view(data={'qfilter-saved': 'long'})
+        self.assertEqual(result_ids(response), {self.recipes['bread'].id, self.recipes['curry'].id})
+
+    def test_not_refreshed(self):
+        """
+        Test unknown and never refreshed saved qfilters are not found
+        """
+        with self.assertRaises(Http404):
+            call_view(data={'qfilter-saved': 'long'})
+        with self.assertRaises(Http404):
+            call_view(data={'qfilter-saved': 'missing'})
@@ -0,0 +1,124 @@
+"""
+unit tests for the q filter optimizer
+"""
+
+# pylint: disable=invalid-name
+
+__all__ = (
+    'QOptimizerTestCase',
+    'QOptimizerDatabaseTestCase',
+)
+
+from unittest import TestCase
+
+from django.db.models import Q
+from django.test import TestCase as DBTestCase
+
+from qfilter.optimizer import EMPTY, optimize_q
+from qfilter.utils import eval_qquery
+
+from .testapp.data import create_food
+from .testapp.models import Recipe
+
+
+class QOptimizerTestCase(TestCase):
+    """
+    Test cases for the Q tree optimizer
+    """
+
+    def test_flatten(self):
+        """
+        Test nested nodes with the same connector are flattened
+        """
+        q = Q(Q(a__gte=1) & Q(Q(b__gte=2) & Q(c__gte=3)))
+        self.assertEqual(optimize_q(q).children, [('a__gte', 1), ('b__gte', 2), ('c__gte', 3)])
+
+    def test_merge_or_to_in(self):
+        """
+        Test OR-ed exact and __in lookups on the same field are merged
+        """
+        q = Q(name__exact='b') | Q(name__exact='a') | Q(name__in=['c', 'a']) | Q(hours__gte=6)
+        self.assertEqual(optimize_q(q), Q(hours__gte=6) | Q(name__in=('a', 'b', 'c')))
+
+    def test_duplicates(self):
+        """
+        Test duplicate clauses are removed
+        """
+        q = Q(name__icontains='a') & Q(name__icontains='a')
+        self.assertEqual(optimize_q(q).children, [('name__icontains', 'a')])
+
+    def test_contradictions(self):
+        """
+        Test AND-ed clauses which never match are replaced by the empty clause
+        """
+        self.assertEqual(optimize_q(Q(name__exact='a') & Q(name__exact='b'), Recipe).children, [EMPTY])
+        self.assertEqual(optimize_q(Q(cook_time__gte=6) & ~Q(cook_time__gte=6)).children, [EMPTY])
+        # case insensitive collations compare equal
+        self.assertEqual(len(optimize_q(Q(name__exact='a') & Q(name__exact='A'), Recipe).children), 2)
+        # empty clause is dropped from OR
+        q = Q(cook_time__gte=6) | (Q(name__exact='a') & Q(name__exact='b'))
+        self.assertEqual(optimize_q(q, Recipe).children, [('cook_time__gte', 6)])
+        # exact values are only compared with the field type
+        self.assertEqual(len(optimize_q(Q(name__exact='a') & Q(name__exact='b')).children), 2)
+
+    def test_no_contradictions(self):
+        """
+        Test clauses which can match together are kept
+        """
+        # converted to the field type
+        self.assertEqual(len(optimize_q(Q(cook_time='40') & Q(cook_time='040'), Recipe).children), 2)
+        # different related rows
+        q = Q(ingredients__name='rice') & Q(ingredients__name='onion')
+        self.assertEqual(len(optimize_q(q, Recipe).children), 2)
+        # negated
+        q = ~(Q(name='a') & Q(name='b'))
+        self.assertEqual(optimize_q(q, Recipe), q)
+        q = ~(Q(cook_time__gte=6) | (Q(name='a') & Q(name='b')))
+        self.assertEqual(optimize_q(q, Recipe), q)
+
+    def test_canonical_order(self):
+        """
+        Test equivalent queries are optimized to the same Q object
+        """
+        a = Q(hours__gte=6) & (Q(name__exact='x') | Q(name__exact='y'))
+        b = (Q(name__exact='y') | Q(name__exact='x')) & Q(hours__gte=6)
+        self.assertEqual(optimize_q(a), optimize_q(b))
+
+    def test_not_modified(self):
+        """
+        Test the given Q object is not modified
+        """
+        q = Q(name__exact='a') | Q(name__exact='b')
+        optimize_q(q)
+        self.assertEqual(q.children, [('name__exact', 'a'), ('name__exact', 'b')])
+
+
+class QOptimizerDatabaseTestCase(DBTestCase):
+    """
+    Test cases comparing the results of optimized and original queries
+    """
+
+    QFILTERS = [
+        'Q(name="curry") & Q(name="soup")',
+        'Q(cook_time="40") & Q(cook_time="040")',
+        'Q(ingredients__name="rice") & Q(ingredients__name="onion")',
+        '~(Q(ingredients__name="rice") & Q(ingredients__name="onion"))',
+        '~(Q(name="curry") & Q(name="soup"))',
+        'Q(ingredients__name="onion") | Q(ingredients__name="rice") | Q(cook_time__gte=60)',
+        'Q(vegan=True) & ~Q(vegan=True) | Q(name="bread")',
+    ]
+
+    @classmethod
+    def setUpTestData(cls):
+        create_food()
+
+    def test_same_results(self):
+        """
+        Test the optimized query matches the same objects
+        """
+        for qfilter in self.QFILTERS:
+            with self.subTest(qfilter=qfilter):
+                qquery = eval_qquery(qfilter)
+                expected = set(Recipe.objects.filter(qquery).values_list('name', flat=True))
+                optimized = set(Recipe.objects.filter(optimize_q(qquery, Recipe)).values_list('name', flat=True))
+                self.assertEqual(optimized, expected)
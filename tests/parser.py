@@ -0,0 +1,83 @@
+"""
+unit tests for the q filter parser
+"""
+
+# pylint: disable=invalid-name,line-too-long
+
+__all__ = (
+    'QQueryParserTestCase',
+)
+
+from unittest import TestCase
+
+from django.db.models import Q
+
+from qfilter.parser import QQuerySyntaxError, normalize_qquery, parse_qquery
+
+
+class QQueryParserTestCase(TestCase):
+    """
+    Test cases for the Q Query parser
+    """
+
+    def test_parse_values(self):
+        """
+        Test parsing of the different value types
+        """
+        self.assertEqual(parse_qquery('Q(name="thai curry ")'), Q(name='thai curry '))
+        self.assertEqual(parse_qquery('Q(active=True)'), Q(active=True))
+        self.assertEqual(parse_qquery('Q(active=False)'), Q(active=False))
+        self.assertEqual(parse_qquery('Q(hours=6)'), Q(hours=6))
+        self.assertEqual(parse_qquery('Q(name__regex="^[a-z0-9]$")'), Q(name__regex='^[a-z0-9]$'))
+
+    def test_parse_operators(self):
+        """
+        Test operator precedence, negation and grouping like python
+        """
+        a, b, c = Q(name='a'), Q(name='b'), Q(name='c')
+        self.assertEqual(parse_qquery('Q(name="a") & Q(name="b") | Q(name="c")'), a & b | c)
+        self.assertEqual(parse_qquery('Q(name="a") | Q(name="b") & Q(name="c")'), a | b & c)
+        self.assertEqual(parse_qquery('Q(name="a") & (Q(name="b") | Q(name="c"))'), a & (b | c))
+        self.assertEqual(parse_qquery('~Q(name="a")&~Q(name="b")'), ~a & ~b)
+        self.assertEqual(parse_qquery('~(Q(name="a") | Q(name="b"))'), ~(a | b))
+
+    def test_normalize(self):
+        """
+        Test whitespace normalization outside of strings
+        """
+        self.assertEqual(normalize_qquery(' Q(name="a b") |  Q(name="c") '), 'Q(name="a b")|Q(name="c")')
+        self.assertEqual(normalize_qquery('Q(name="a") | Q(name="b")'), normalize_qquery('Q(name="a")|Q(name="b")'))
+
+    def test_syntax_error_position(self):
+        """
+        Test syntax errors report the position in the original query
+        """
+        with self.assertRaises(QQuerySyntaxError) as ctx:
+            parse_qquery('Q(name="curry")  | Q(active=true)')
+        self.assertEqual(ctx.exception.position, 28)
+
+        with self.assertRaises(QQuerySyntaxError) as ctx:
+            parse_qquery('Q(name="; DROP")')
+        self.assertEqual(ctx.exception.position, 8)
+
+    def test_invalid(self):
+        """
+        Test invalid queries are rejected
+        """
+        QFILTER = [
+            '',
+            'os.system("ls")',
+            "__import__('os').system('clear')",
+            'Q(name="\'; drop")',
+            'Q(name=${HOSTNAME})',
+            'Q(question__startswith=\'Who\')',
+            'Q(active=Tr ue)',
+            'Q(name="curry") | ',
+            'Q(name="curry") | Q()',
+            '()Q(name="curry")()',
+            '((Q(name="asdf")))',
+            '(Q(name="a") | Q(name="b")',
+        ]
+        for qfilter in QFILTER:
+            with self.assertRaises(QQuerySyntaxError, msg=qfilter):
+                parse_qquery(qfilter)
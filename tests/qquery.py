@@ -142,3 +142,12 @@ class QFilterTestCase(TestCase):
             except AssertionError:
                 print('FAILED:', qfilter)
                 raise
+
+    def test_no_browser_pattern(self):
+        """
+        Test the input has no pattern attribute, the browser would block queries the parser accepts
+        """
+        qfilter = '~(Q(name="curry") | (Q(hours=6)  &  Q(active=True)))'
+        qfilter_form = QueryFilterForm(data={'qfilter': qfilter})
+        self.assertTrue(qfilter_form.is_valid())
+        self.assertNotIn('pattern', qfilter_form.fields['qfilter'].widget.attrs)
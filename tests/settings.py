@@ -1,2 +1,42 @@
 SECRET_KEY = 'test'
-USE_I18N = False
\ No newline at end of file
+USE_I18N = False
+USE_TZ = True
+
+INSTALLED_APPS = [
+    'django.contrib.contenttypes',
+    'django.contrib.auth',
+    'django.contrib.messages',
+    'crispy_forms',
+    'qfilter',
+    'tests.testapp',
+]
+
+DATABASES = {
+    'default': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': ':memory:',
+    }
+}
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'other': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'other',
+    },
+}
+
+TEMPLATES = [
+    {
+        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        'OPTIONS': {
+            'loaders': [
+                ('django.template.loaders.locmem.Loader', {
+                    'testapp/recipe_list.html': '{% for recipe in qfilter_qs %}{{ recipe.id }},{% endfor %}',
+                }),
+            ],
+        },
+    },
+]
@@ -0,0 +1,40 @@
+"""
+test data of the test app
+"""
+
+from .models import Cookbook, Ingredient, IngredientType, Recipe
+
+RECIPES = {
+    'curry': (40, False, ['rice', 'chicken', 'onion']),
+    'salad': (10, True, ['lettuce', 'tomato', 'onion']),
+    'soup': (0, True, ['carrot', 'onion', 'celery']),
+    'risotto': (35, False, ['rice', 'cheese']),
+    'bread': (60, True, []),
+}
+
+COOKBOOKS = {
+    'asia': ['curry', 'soup'],
+    'italy': ['risotto', 'bread', 'salad'],
+}
+
+
+def create_food():
+    """
+    create the recipes, ingredients and cookbooks
+
+    :return: {recipe name: Recipe}
+    """
+    types = {name: IngredientType.objects.create(name=name) for name in ('grain', 'meat', 'vegetable', 'dairy')}
+    ingredient_types = {'rice': 'grain', 'chicken': 'meat', 'cheese': 'dairy'}
+    ingredients = {}
+    recipes = {}
+    for name, (cook_time, vegan, ingredient_names) in RECIPES.items():
+        recipe = recipes[name] = Recipe.objects.create(name=name, cook_time=cook_time, vegan=vegan)
+        for ingredient_name in ingredient_names:
+            if ingredient_name not in ingredients:
+                ingredients[ingredient_name] = Ingredient.objects.create(
+                    name=ingredient_name, type=types[ingredient_types.get(ingredient_name, 'vegetable')])
+            recipe.ingredients.add(ingredients[ingredient_name])
+    for name, recipe_names in COOKBOOKS.items():
+        Cookbook.objects.create(name=name).recipes.set([recipes[recipe] for recipe in recipe_names])
+    return recipes
@@ -0,0 +1,28 @@
+"""
+models of the test app, like the example project
+"""
+
+from django.db import models
+
+
+class IngredientType(models.Model):
+    name = models.CharField(max_length=100)
+
+
+class Ingredient(models.Model):
+    name = models.CharField(max_length=100)
+    type = models.ForeignKey(IngredientType, on_delete=models.PROTECT)
+    created = models.DateTimeField(auto_now_add=True)
+
+
+class Recipe(models.Model):
+    name = models.CharField(max_length=100)
+    created = models.DateTimeField(auto_now_add=True)
+    ingredients = models.ManyToManyField(Ingredient)
+    cook_time = models.IntegerField()
+    vegan = models.BooleanField(default=False)
+
+
+class Cookbook(models.Model):
+    name = models.CharField(max_length=100)
+    recipes = models.ManyToManyField(Recipe)
@@ -0,0 +1,266 @@
+"""
+unit tests for the q filter utils
+"""
+
+# pylint: disable=invalid-name,protected-access
+
+__all__ = (
+    'AggregateMergeTestCase',
+    'EvaluateQQueriesTestCase',
+    'LookupCacheTestCase',
+    'MergeTestCase',
+    'ValidateTestCase',
+)
+
+from datetime import datetime
+from unittest import TestCase, mock
+
+from django.db.models import F
+from django.db.models.signals import class_prepared
+from django.test import TestCase as DBTestCase
+
+from qfilter import utils
+from qfilter.parser import QQuerySyntaxError
+from qfilter.utils import (AggregatedMergedValues, MergedValues, MergeTruncated, aggregate_merged, clear_lookup_cache,
+                           eval_qquery, evaluate_qqueries, iter_merge, merge, resolve_lookup, sanitize_qquery, validate_qqueries,
+                           validate_qquery)
+
+from .testapp.data import create_food
+from .testapp.models import Recipe
+
+
+class MergeTestCase(TestCase):
+    """
+    Test cases for merging joined values
+    """
+
+    VALUES = [
+        {'id': 1, 'name': 'curry', 'Ingredient.name': 'rice'},
+        {'id': 1, 'name': 'curry', 'Ingredient.name': 'chicken'},
+        {'id': 1, 'name': 'curry', 'Ingredient.name': 'rice'},
+        {'id': 2, 'name': 'salad', 'Ingredient.name': None},
+        {'id': 3, 'name': 'soup', 'Ingredient.name': 'carrot'},
+    ]
+
+    EXPECTED = {
+        1: {'name': 'curry', 'Ingredient.name': ['rice', 'chicken']},
+        2: {'name': 'salad', 'Ingredient.name': []},
+        3: {'name': 'soup', 'Ingredient.name': ['carrot']},
+    }
+
+    def test_merge(self):
+        """
+        Test merge of unordered values
+        """
+        values = [self.VALUES[4], self.VALUES[0], self.VALUES[3], self.VALUES[1], self.VALUES[2]]
+        self.assertEqual(merge('id', ['Ingredient.name'], values), self.EXPECTED)
+
+    def test_iter_merge(self):
+        """
+        Test streaming merge of values ordered by the shared key
+        """
+        merged = iter_merge('id', ['Ingredient.name'], iter(self.VALUES))
+        self.assertEqual(next(merged), (1, self.EXPECTED[1]))
+        self.assertEqual(dict(merged), {2: self.EXPECTED[2], 3: self.EXPECTED[3]})
+        self.assertEqual(list(iter_merge('id', ['Ingredient.name'], [])), [])
+
+    def test_merge_does_not_modify_values(self):
+        """
+        Test the shared key is not removed from the input values
+        """
+        values = [dict(v) for v in self.VALUES]
+        merge('id', ['Ingredient.name'], values)
+        self.assertEqual(values, self.VALUES)
+
+    def test_merge_keeps_falsy_values(self):
+        """
+        Test only None is dropped from the merged values, not 0 or False
+        """
+        values = [{'id': 1, 'time': 0}, {'id': 1, 'time': None}, {'id': 1, 'time': 5}]
+        self.assertEqual(merge('id', ['time'], values), {1: {'time': [0, 5]}})
+
+
+class AggregateMergeTestCase(DBTestCase):
+    """
+    Test cases for merging joined values with database aggregates
+    """
+
+    FIELD_MAP = {
+        'Ingredient.name': 'ingredients__name',
+        'Ingredient.created': 'ingredients__created',
+        'Recipe.cook_time': 'cookbook__recipes__cook_time',
+        'Recipe.vegan': 'cookbook__recipes__vegan',
+    }
+
+    @classmethod
+    def setUpTestData(cls):
+        create_food()
+
+    def merged(self):
+        queryset = Recipe.objects.all()
+        columns = [field.attname for field in Recipe._meta.concrete_fields] + list(self.FIELD_MAP)
+        joined = queryset.annotate(**{name: F(path) for name, path in self.FIELD_MAP.items()})
+        python_merged = MergedValues(joined, 'id', list(self.FIELD_MAP), columns=columns)
+        return python_merged, aggregate_merged(queryset, 'id', self.FIELD_MAP, fallback=python_merged)
+
+    @staticmethod
+    def normalize(items):
+        # the order of the aggregated values is not defined
+        return {key: {name: sorted(value) if isinstance(value, list) else value for name, value in record.items()}
+                for key, record in items}
+
+    def test_same_as_python_merge(self):
+        """
+        Test the aggregated values are converted like the joined values, ex. aware datetimes, 0 and False
+        """
+        python_merged, db_merged = self.merged()
+        self.assertIsInstance(db_merged, AggregatedMergedValues)
+        expected = self.normalize(python_merged.items())
+        self.assertEqual(self.normalize(db_merged.items()), expected)
+
+        record = expected[Recipe.objects.get(name='curry').id]
+        self.assertIsInstance(record['Ingredient.created'][0], datetime)
+        self.assertIsNotNone(record['Ingredient.created'][0].tzinfo)
+        self.assertEqual(record['Recipe.cook_time'], [0, 40])
+        self.assertEqual(record['Recipe.vegan'], [False, True])
+
+        keys = [Recipe.objects.get(name='bread').id]
+        self.assertEqual(self.normalize(db_merged.for_keys(keys).items()),
+                         self.normalize(python_merged.for_keys(keys).items()))
+
+    def test_truncated(self):
+        """
+        Test truncated aggregates (MySQL's group_concat_max_len) are merged by the fallback or raise
+        """
+        python_merged, db_merged = self.merged()
+        db_merged.max_length = 1
+        with self.assertLogs('qfilter.utils', 'WARNING'):
+            self.assertEqual(self.normalize(db_merged.items()), self.normalize(python_merged.items()))
+
+        db_merged.fallback = None
+        with self.assertRaises(MergeTruncated):
+            list(db_merged.items())
+
+
+class EvaluateQQueriesTestCase(DBTestCase):
+    """
+    Test cases for evaluating many qfilters together
+    """
+
+    QFILTERS = [
+        'Q(cook_time__gte=30)',
+        'Q(vegan=True) | Q(cook_time=0)',
+        'Q(ingredients__name="rice") & Q(ingredients__type__name="vegetable")',
+        'Q(ingredients__name="onion") & ~Q(cookbook__name="asia")',
+        '~(Q(ingredients__name="rice") & Q(ingredients__type__name="vegetable"))',
+        '~Q(ingredients__name="onion")',
+        'Q(cook_time=0) | ~(Q(ingredients__name="rice") & Q(ingredients__type__name="grain"))',
+        'Q(name="missing")',
+    ]
+
+    @classmethod
+    def setUpTestData(cls):
+        create_food()
+
+    def expected(self):
+        return {qfilter: sorted(Recipe.objects.filter(eval_qquery(qfilter)).distinct().values_list('pk', flat=True))
+                for qfilter in self.QFILTERS}
+
+    def test_methods(self):
+        """
+        Test both methods match the ORM, also in batches smaller than the qfilters
+        """
+        expected = self.expected()
+        for method in ('case', 'union'):
+            for batch_size in (100, 3):
+                with self.subTest(method=method, batch_size=batch_size):
+                    self.assertEqual(evaluate_qqueries(Recipe.objects.all(), self.QFILTERS, method=method,
+                                                       batch_size=batch_size), expected)
+                    self.assertEqual(evaluate_qqueries(Recipe, self.QFILTERS, method=method, batch_size=batch_size,
+                                                       optimize=False), expected)
+
+    def test_queryset(self):
+        """
+        Test the qfilters are evaluated within the queryset
+        """
+        queryset = Recipe.objects.filter(vegan=True)
+        self.assertEqual(evaluate_qqueries(queryset, ['Q(cook_time__gte=30)'], method='union'),
+                         {'Q(cook_time__gte=30)': list(queryset.filter(cook_time__gte=30).values_list('pk', flat=True))})
+
+    def test_unknown_method(self):
+        """
+        Test unknown methods raise a ValueError
+        """
+        with self.assertRaises(ValueError):
+            evaluate_qqueries(Recipe, self.QFILTERS, method='loop')
+
+
+class LookupCacheTestCase(TestCase):
+    """
+    Test cases for the cache of resolved lookups
+    """
+
+    def setUp(self):
+        clear_lookup_cache()
+
+    def test_cached(self):
+        """
+        Test lookups are resolved once per model, lookup and annotations
+        """
+        query = Recipe.objects.all().query
+        resolved = resolve_lookup(query, 'ingredients__name__icontains')
+        self.assertEqual(resolved, ('ingredients__name', ('icontains',), False))
+        self.assertIs(resolve_lookup(Recipe.objects.all().query, 'ingredients__name__icontains'), resolved)
+
+        annotated = Recipe.objects.annotate(ingredient=F('ingredients__name')).query
+        self.assertEqual(resolve_lookup(annotated, 'ingredient__icontains'), ('ingredient', ('icontains',), True))
+
+    def test_cleared(self):
+        """
+        Test the cache is cleared explicitly, if models are prepared and if it is full
+        """
+        query = Recipe.objects.all().query
+        resolved = resolve_lookup(query, 'name')
+        clear_lookup_cache()
+        self.assertIsNot(resolve_lookup(query, 'name'), resolved)
+
+        resolved = resolve_lookup(query, 'name')
+        class_prepared.send(sender=Recipe)
+        self.assertIsNot(resolve_lookup(query, 'name'), resolved)
+
+        with mock.patch('qfilter.vars.QQUERY_LOOKUP_CACHE_SIZE', 2):
+            resolve_lookup(query, 'cook_time')
+            resolve_lookup(query, 'vegan')
+            self.assertEqual(len(utils._LOOKUP_CACHE), 1)
+
+
+class ValidateTestCase(TestCase):
+    """
+    Test cases for validating qfilters without a form
+    """
+
+    def test_validate_qquery(self):
+        """
+        Test valid and invalid queries with error positions
+        """
+        self.assertIsNone(validate_qquery('Q(name="curry") & ~Q(active=True)'))
+        error = validate_qquery('Q(name="curry") | ')
+        self.assertEqual(error.position, 18)
+        self.assertEqual(error.reason, "expected 'Q'")
+
+    def test_validate_qqueries(self):
+        """
+        Test only invalid queries are reported by index
+        """
+        errors = validate_qqueries(['Q(name="curry")', 'Q(name=curry)', 'Q(hours=6)', ''])
+        self.assertEqual(sorted(errors), [1, 3])
+        self.assertEqual(errors[1].position, 7)
+
+    def test_sanitize_qquery(self):
+        """
+        Test sanitize returns the query or raises a ValidationError
+        """
+        self.assertEqual(sanitize_qquery('Q(hours=6)'), 'Q(hours=6)')
+        self.assertIsNone(sanitize_qquery(''))
+        with self.assertRaises(QQuerySyntaxError):
+            sanitize_qquery('os.system("ls")')
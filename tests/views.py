@@ -0,0 +1,538 @@
+"""
+unit tests for the q filter view mixin
+"""
+
+# pylint: disable=invalid-name
+
+__all__ = (
+    'AnnotateTestCase',
+    'AutocompleteTestCase',
+    'CountTestCase',
+    'FieldChoicesTestCase',
+    'ExportTestCase',
+    'InstrumentationViewTestCase',
+    'OptionsTestCase',
+    'PaginationTestCase',
+    'ReplaceQuerysetTestCase',
+    'StatementTimeoutTestCase',
+)
+
+import contextlib
+import json
+from unittest import mock
+
+from django.contrib.messages import get_messages
+from django.core.cache import caches
+from django.contrib.messages.storage.cookie import CookieStorage
+from django.db import OperationalError, connection
+from django.db.models import QuerySet
+from django.template import TemplateDoesNotExist
+from django.test import RequestFactory, TestCase
+from django.views.generic import ListView
+
+from qfilter.instrumentation import MemoryMetricsAdapter
+from qfilter.mixins import QFilterOptions, QQueryViewMixin
+from qfilter.utils import eval_qquery
+
+from .testapp.data import create_food
+from .testapp.models import Recipe
+
+
+class RecipeListView(QQueryViewMixin, ListView):
+    model = Recipe
+    template_name = 'testapp/recipe_list.html'
+    ordering = ['name']
+
+
+def call_view(view_class=RecipeListView, data=None, **initkwargs):
+    """
+    call the view with GET parameters and render the response
+    """
+    request = RequestFactory().get('/recipes/', data or {})
+    request._messages = CookieStorage(request)  # pylint: disable=protected-access
+    response = view_class.as_view(**initkwargs)(request)
+    if hasattr(response, 'render'):
+        response.render()
+    response.request = request
+    return response
+
+
+def result_ids(response):
+    return {int(pk) for pk in response.content.decode().split(',') if pk}
+
+
+class StatementTimeoutTestCase(TestCase):
+    """
+    Test cases for the statement timeout of the qfilter queries
+    """
+
+    QFILTER = 'Q(ingredients__name="onion") | Q(cook_time__gte=40)'
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.recipes = create_food()
+
+    @contextlib.contextmanager
+    def record_timeout(self, fail=False):
+        """
+        record the queries run outside of the statement timeout,
+        with fail the first query within the timeout exceeds it
+        """
+        state = {'active': False, 'outside': [], 'failed': False}
+
+        @contextlib.contextmanager
+        def statement_timeout(using, timeout):
+            state['active'] = True
+            try:
+                yield
+            finally:
+                state['active'] = False
+
+        def execute(execute_, sql, params, many, context):
+            if not state['active']:
+                state['outside'].append(sql)
+            elif fail and not state['failed']:
+                state['failed'] = True
+                raise OperationalError('interrupted')
+            return execute_(sql, params, many, context)
+
+        with mock.patch('qfilter.guard.statement_timeout', statement_timeout), connection.execute_wrapper(execute):
+            yield state
+
+    def test_paginated_queries_within_timeout(self):
+        """
+        Test the pagination and rendering queries run within the statement timeout
+        """
+        # the first page by id or by the ordering of the view
+        for replace, names in ((False, {'curry', 'salad'}), (True, {'bread', 'curry'})):
+            with self.subTest(replace=replace), self.record_timeout() as state:
+                response = call_view(data={'qfilter': self.QFILTER}, paginate_by=2, qfilter_statement_timeout=100,
+                                     qfilter_replace_queryset=replace)
+                self.assertEqual(result_ids(response), {self.recipes[name].id for name in names})
+                self.assertEqual([sql for sql in state['outside'] if 'testapp_recipe' in sql], [])
+
+    def test_pagination_timeout(self):
+        """
+        Test the context is built without qfilter results if the pagination exceeds the timeout
+        """
+        with self.record_timeout(fail=True) as state, self.assertLogs('qfilter.mixins', 'WARNING'):
+            response = call_view(data={'qfilter': self.QFILTER}, paginate_by=2, qfilter_statement_timeout=100)
+        self.assertTrue(state['failed'])
+        self.assertEqual(result_ids(response), set())
+        self.assertIn('took too long', [str(m) for m in get_messages(response.request)][0])
+
+
+class ExportTestCase(TestCase):
+    """
+    Test cases for the csv and json lines export
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.recipes = create_food()
+
+    @staticmethod
+    def content(response):
+        return b''.join(response.streaming_content).decode()
+
+    def test_export(self):
+        """
+        Test the filtered rows are exported
+        """
+        response = call_view(data={'qfilter': 'Q(cook_time__gte=40)', 'qfilter-export': 'jsonl'})
+        self.assertEqual(response.status_code, 200)
+        rows = [json.loads(line) for line in self.content(response).splitlines()]
+        self.assertEqual({row['id'] for row in rows}, {self.recipes['bread'].id, self.recipes['curry'].id})
+
+    def test_rows_counted_once(self):
+        """
+        Test the exported rows are counted once in the metrics, joined and merged
+        """
+        qfilter = 'Q(ingredients__name__icontains="o")'
+        for data, rows in (({}, 5), ({'qfilter-merged': '1'}, 3)):
+            adapter = MemoryMetricsAdapter()
+            response = call_view(data=dict(data, **{'qfilter': qfilter, 'qfilter-export': 'jsonl'}),
+                                 qfilter_metrics_adapter=adapter)
+            self.assertEqual(len(self.content(response).splitlines()), rows)
+            self.assertEqual(adapter.counters['qfilter.rows'], rows)
+
+    def test_export_without_qfilter(self):
+        """
+        Test the base queryset is exported without a qfilter
+        """
+        response = call_view(data={'qfilter-export': 'csv'})
+        self.assertEqual(len(self.content(response).splitlines()), len(self.recipes) + 1)
+
+    def test_rejected_qfilter(self):
+        """
+        Test invalid and rejected qfilters are not exported as the unfiltered base queryset
+        """
+        with self.assertLogs('qfilter.mixins', 'ERROR'):
+            response = call_view(data={'qfilter': 'Q(name=thai)', 'qfilter-export': 'csv'})
+        self.assertEqual(response.status_code, 400)
+
+        with self.assertLogs('qfilter.mixins', 'ERROR'):
+            response = call_view(data={'qfilter': 'Q(cook_time__gte=40)', 'qfilter-export': 'csv'}, qfilter_max_scans=0)
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('too expensive', json.loads(response.content)['error'])
+
+    def test_unknown_format(self):
+        """
+        Test errors are answered as json, the parameters are not reflected as html
+        """
+        response = call_view(data={'qfilter-export': '<script>alert(1)</script>'})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response['Content-Type'], 'application/json')
+        self.assertNotIn(b'<script>', response.content)
+        self.assertEqual(json.loads(response.content)['formats'], ['csv', 'jsonl'])
+
+
+class InstrumentationViewTestCase(TestCase):
+    """
+    Test cases for finishing the metrics of the view, which removes the execute wrapper
+    """
+
+    QFILTER = 'Q(cook_time__gte=40)'
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.recipes = create_food()
+
+    def test_render(self):
+        """
+        Test the wrapper is removed after rendering
+        """
+        wrappers = list(connection.execute_wrappers)
+        call_view(data={'qfilter': self.QFILTER})
+        self.assertEqual(connection.execute_wrappers, wrappers)
+
+    def test_failing_render(self):
+        """
+        Test the wrapper is removed if rendering fails
+        """
+        wrappers = list(connection.execute_wrappers)
+        with mock.patch.object(RecipeListView, 'get_template_names', return_value=['testapp/missing.html']), \
+                self.assertRaises(TemplateDoesNotExist):
+            call_view(data={'qfilter': self.QFILTER})
+        self.assertEqual(connection.execute_wrappers, wrappers)
+
+    def test_closed_export(self):
+        """
+        Test the wrapper is removed if the export is closed before or while it is streamed
+        """
+        wrappers = list(connection.execute_wrappers)
+        response = call_view(data={'qfilter': self.QFILTER, 'qfilter-export': 'csv'})
+        response.close()
+        self.assertEqual(connection.execute_wrappers, wrappers)
+
+        response = call_view(data={'qfilter': self.QFILTER, 'qfilter-export': 'csv'})
+        next(iter(response.streaming_content))
+        response.close()
+        self.assertEqual(connection.execute_wrappers, wrappers)
+
+
+class PaginationTestCase(TestCase):
+    """
+    Test cases for paginating the qfilter results by objects
+    """
+
+    QFILTER = 'Q(ingredients__name__icontains="o")'
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.recipes = create_food()
+
+    def ids(self, *names):
+        return {self.recipes[name].id for name in names}
+
+    def test_pages(self):
+        """
+        Test pages contain all joined rows of their objects
+        """
+        response = call_view(data={'qfilter': self.QFILTER}, paginate_by=2)
+        context = response.context_data
+        self.assertEqual(result_ids(response), self.ids('curry', 'salad'))
+        # salad is joined with onion and tomato
+        self.assertEqual(len(response.content.decode().split(',')) - 1, 3)
+        self.assertEqual(context['qfilter_paginator'].count, 3)
+        self.assertTrue(context['qfilter_is_paginated'])
+        self.assertEqual(context['qfilter_next_after'], self.recipes['salad'].id)
+
+        response = call_view(data={'qfilter': self.QFILTER, 'qfilter-page': 2}, paginate_by=2)
+        self.assertEqual(result_ids(response), self.ids('soup'))
+        self.assertIsNone(response.context_data['qfilter_next_after'])
+
+    def test_after(self):
+        """
+        Test keyset pagination after an id, invalid ids start with the first page
+        """
+        response = call_view(data={'qfilter': self.QFILTER, 'qfilter-after': self.recipes['curry'].id}, paginate_by=2)
+        self.assertEqual(result_ids(response), self.ids('salad', 'soup'))
+        self.assertIsNone(response.context_data['qfilter_paginator'])
+
+        with self.assertLogs('qfilter.mixins', 'WARNING'):
+            response = call_view(data={'qfilter': self.QFILTER, 'qfilter-after': 'x'}, paginate_by=2)
+        self.assertEqual(result_ids(response), self.ids('curry', 'salad'))
+
+    def test_merged(self):
+        """
+        Test the merged values are paginated like the joined rows
+        """
+        response = call_view(data={'qfilter': self.QFILTER, 'qfilter-merged': '1', 'qfilter-page': 2}, paginate_by=2)
+        merged = dict(response.context_data['qfilter_qs'].merged.items())
+        self.assertEqual(set(merged), self.ids('soup'))
+        self.assertEqual(sorted(merged[self.recipes['soup'].id]['Ingredient.name']), ['carrot', 'onion'])
+
+    def test_not_paginated(self):
+        """
+        Test all results without paginate_by
+        """
+        response = call_view(data={'qfilter': self.QFILTER})
+        self.assertEqual(result_ids(response), self.ids('curry', 'salad', 'soup'))
+        self.assertNotIn('qfilter_paginator', response.context_data)
+
+
+class ReplaceQuerysetTestCase(TestCase):
+    """
+    Test cases for using the filtered queryset as the view's object list
+    """
+
+    QFILTER = 'Q(ingredients__name__icontains="o")'
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.recipes = create_food()
+
+    def ids(self, *names):
+        return {self.recipes[name].id for name in names}
+
+    def test_object_list(self):
+        """
+        Test the object list is the annotated qfilter queryset
+        """
+        response = call_view(data={'qfilter': self.QFILTER}, qfilter_replace_queryset=True)
+        context = response.context_data
+        self.assertIs(context['object_list'], context['qfilter_qs'])
+        self.assertEqual(context['object_list'].qfilter_fields, ['Ingredient.name'])
+        self.assertEqual(result_ids(response), self.ids('curry', 'salad', 'soup'))
+
+    def test_view_queryset(self):
+        """
+        Test the qfilter is applied to the view's queryset
+        """
+        response = call_view(data={'qfilter': self.QFILTER}, qfilter_replace_queryset=True,
+                             queryset=Recipe.objects.filter(vegan=True))
+        self.assertEqual(result_ids(response), self.ids('salad', 'soup'))
+
+    def test_paginated(self):
+        """
+        Test the joined rows are paginated by the view, merged values are restricted to the page
+        """
+        data = {'qfilter': self.QFILTER, 'qfilter-merged': '1', 'page': 3}
+        response = call_view(data=data, paginate_by=2, qfilter_replace_queryset=True)
+        context = response.context_data
+        # 5 joined rows ordered by name, the third page contains the second row of soup
+        self.assertEqual(context['page_obj'].paginator.count, 5)
+        self.assertEqual(result_ids(response), self.ids('soup'))
+        self.assertEqual(set(dict(context['qfilter_qs'].merged.items())), self.ids('soup'))
+
+
+class AnnotateTestCase(TestCase):
+    """
+    Test cases for annotating the qfilter fields to the results
+    """
+
+    QFILTER = 'Q(ingredients__name="onion") | Q(ingredients__name__icontains="ri") & Q(cookbook__name="asia")'
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.recipes = create_food()
+
+    def test_single_annotate(self):
+        """
+        Test all fields are annotated in one annotate() call, repeated fields once in lookup order
+        """
+        annotate = QuerySet.annotate
+        with mock.patch.object(QuerySet, 'annotate', autospec=True, side_effect=annotate) as mocked:
+            response = call_view(data={'qfilter': self.QFILTER})
+        self.assertEqual(mocked.call_count, 1)
+        qfilter_qs = response.context_data['qfilter_qs']
+        self.assertEqual(qfilter_qs.qfilter_field_map, {'Ingredient.name': 'ingredients__name',
+                                                        'Cookbook.name': 'cookbook__name'})
+        self.assertEqual(qfilter_qs.qfilter_fields, ['Ingredient.name', 'Cookbook.name'])
+        self.assertEqual(qfilter_qs.qfilter_columns[-2:], ['Ingredient.name', 'Cookbook.name'])
+        self.assertEqual(list(qfilter_qs.query.annotations), ['Ingredient.name', 'Cookbook.name'])
+
+    def test_annotated_values(self):
+        """
+        Test the joined rows contain the annotated values
+        """
+        response = call_view(data={'qfilter': 'Q(ingredients__name="rice")'})
+        rows = response.context_data['qfilter_qs'].values_list('name', 'Ingredient.name')
+        self.assertEqual(sorted(rows), [('curry', 'rice'), ('risotto', 'rice')])
+
+
+class OptionsTestCase(TestCase):
+    """
+    Test cases for the immutable per request qfilter options
+    """
+
+    QFILTER = 'Q(ingredients__name="onion")'
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.recipes = create_food()
+
+    def test_per_request(self):
+        """
+        Test the options of a request do not leak into the view class or other requests
+        """
+        response = call_view(data={'qfilter': self.QFILTER, 'qfilter-merged': '1'})
+        self.assertEqual(response.context_data['qfilter_options'], QFilterOptions(merged=True))
+        self.assertTrue(hasattr(response.context_data['qfilter_qs'], 'merged'))
+        self.assertEqual(RecipeListView.qfilter_options, QFilterOptions(merged=False))
+
+        response = call_view(data={'qfilter': self.QFILTER})
+        self.assertEqual(response.context_data['qfilter_options'], QFilterOptions(merged=False))
+        self.assertFalse(hasattr(response.context_data['qfilter_qs'], 'merged'))
+
+    def test_downgrade(self):
+        """
+        Test a downgraded filter disables merged for the request only
+        """
+        with self.assertLogs('qfilter.mixins', 'WARNING'):
+            response = call_view(data={'qfilter': self.QFILTER, 'qfilter-merged': '1'},
+                                 qfilter_max_scans=0, qfilter_cost_action='downgrade')
+        self.assertEqual(response.context_data['qfilter_options'], QFilterOptions(merged=False))
+        self.assertEqual(RecipeListView.qfilter_options, QFilterOptions(merged=False))
+
+
+class CountTestCase(TestCase):
+    """
+    Test cases for the count-only responses
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.recipes = create_food()
+
+    @staticmethod
+    def count(qfilter, mode='exact'):
+        response = call_view(data={'qfilter': qfilter, 'qfilter-count': mode})
+        return response.status_code, json.loads(response.content)
+
+    def test_exact(self):
+        """
+        Test objects are counted once, like the joined query with DISTINCT
+        """
+        for qfilter in ('Q(ingredients__name__icontains="o")', 'Q(cook_time__gte=35)',
+                        '~(Q(ingredients__name="rice") & Q(ingredients__type__name="vegetable"))',
+                        'Q(ingredients__name="onion") | Q(cookbook__name="italy")'):
+            with self.subTest(qfilter=qfilter):
+                expected = Recipe.objects.filter(eval_qquery(qfilter)).distinct().count()
+                self.assertEqual(self.count(qfilter), (200, {'qfilter': qfilter, 'count': expected, 'estimated': False}))
+
+    def test_estimate(self):
+        """
+        Test databases without planner estimates count exactly
+        """
+        self.assertEqual(self.count('Q(cook_time__gte=35)', 'estimate')[1]['count'], 3)
+        self.assertFalse(self.count('Q(cook_time__gte=35)', 'estimate')[1]['estimated'])
+
+    def test_errors(self):
+        """
+        Test invalid filters and modes are answered with 400 and a json error
+        """
+        status, data = self.count('Q(cook_time__gte=35')
+        self.assertEqual(status, 400)
+        self.assertIn('position', data)
+        self.assertEqual(self.count('Q(missing=1)')[0], 400)
+        self.assertEqual(self.count('')[0], 400)
+
+        response = call_view(data={'qfilter': 'Q(cook_time__gte=35)', 'qfilter-count': '<img src=x onerror=alert(1)>'})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response['Content-Type'], 'application/json')
+        self.assertNotIn(b'<img', response.content)
+
+
+class FieldChoicesTestCase(TestCase):
+    """
+    Test cases for the wizard field choices and the filter fields json
+    """
+
+    def test_server_rendered(self):
+        """
+        Test the choices are rendered server side by default
+        """
+        context = call_view().context_data
+        self.assertNotIn('qquery_filter_fields_url', context)
+        choices = context['qquery_filter_formset_empty_form'].fields['field'].choices
+        self.assertIn(('ingredients__name', 'Ingredient.name'), choices)
+
+    def test_lazy(self):
+        """
+        Test lazy choices are loaded from the versioned fields url
+        """
+        context = call_view(qfilter_lazy_field_choices=True).context_data
+        self.assertEqual(context['qquery_filter_formset_empty_form'].fields['field'].choices, [])
+        self.assertTrue(context['qquery_filter_fields_url'].startswith('/recipes/?qfilter-fields=json&v='))
+
+    def test_fields_json(self):
+        """
+        Test the fields json is versioned with an ETag and answered with 304 if it matches
+        """
+        response = call_view(data={'qfilter-fields': 'json'})
+        self.assertEqual(response.status_code, 200)
+        data = json.loads(response.content)
+        self.assertEqual(response['ETag'], '"{}"'.format(data['version']))
+        self.assertIn({'path': 'cook_time', 'name': 'Recipe.cook_time', 'type': 'IntegerField'}, data['fields'])
+
+        request = RequestFactory().get('/recipes/', {'qfilter-fields': 'json'}, HTTP_IF_NONE_MATCH=response['ETag'])
+        not_modified = RecipeListView.as_view()(request)
+        self.assertEqual(not_modified.status_code, 304)
+        self.assertEqual(not_modified['ETag'], response['ETag'])
+
+        request = RequestFactory().get('/recipes/', {'qfilter-fields': 'json'}, HTTP_IF_NONE_MATCH='"other"')
+        self.assertEqual(RecipeListView.as_view()(request).status_code, 200)
+
+
+class AutocompleteTestCase(TestCase):
+    """
+    Test cases for the autocomplete suggestions of the wizard
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.recipes = create_food()
+
+    def setUp(self):
+        caches['default'].clear()
+
+    @staticmethod
+    def values(path, prefix, **initkwargs):
+        response = call_view(data={'qfilter-autocomplete': path, 'q': prefix}, **initkwargs)
+        return json.loads(response.content)['values']
+
+    def test_values(self):
+        """
+        Test the distinct values starting with the prefix, case insensitive
+        """
+        self.assertEqual(self.values('ingredients__name', 'C'), ['carrot', 'celery', 'cheese', 'chicken'])
+        self.assertEqual(self.values('name', ''), ['bread', 'curry', 'risotto', 'salad', 'soup'])
+        self.assertEqual(self.values('name', 's', qfilter_autocomplete_limit=1), ['salad'])
+
+    def test_restricted_queryset(self):
+        """
+        Test only values of the objects of the view's queryset are suggested
+        """
+        vegan = Recipe.objects.filter(vegan=True)
+        self.assertEqual(self.values('ingredients__name', 'c', queryset=vegan), ['carrot', 'celery'])
+        self.assertEqual(self.values('name', 'r', queryset=vegan), [])
+
+    def test_invalid_field(self):
+        """
+        Test unknown and non text fields are rejected
+        """
+        for path in ('missing', 'cook_time'):
+            response = call_view(data={'qfilter-autocomplete': path, 'q': 'a'})
+            self.assertEqual(response.status_code, 400)